@@ -0,0 +1,406 @@
+"""
+Shared client for the NOAA Aviation Weather Center (AWC) METAR/TAF pages.
+
+``SESSION`` is a pooled keep-alive ``requests`` session used by the single
+station fetchers in metar.py, taf.py and meteogram.py. ``fetch_reports`` is
+the asyncio bulk API for hundreds of stations: one pooled aiohttp client, a
+concurrency limit, per-host rate limiting, and results yielded as each
+station finishes.
+
+Running this file checks the report extractor against the saved pages in
+data/awc_pages, compares its throughput with the old BeautifulSoup path and
+benchmarks the bulk fetcher against a local stand-in server.
+"""
+import asyncio
+import codecs
+import html
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import numpy as np
+import requests
+from aiohttp import web
+
+
+AWC_URL = 'https://www.aviationweather.gov'
+
+# one keep-alive connection pool for every blocking request in the process
+SESSION = requests.Session()
+
+
+def metar_url(icao, hoursback=None, base_url=AWC_URL):
+    """URL of the raw METAR page for ``icao`` going ``hoursback`` hours back."""
+    return f'{base_url}/metar/data?ids={icao}&format=raw&date=&hours={hoursback or 0}&taf=off'
+
+
+def taf_url(icao, base_url=AWC_URL):
+    """URL of the raw METAR + TAF page for ``icao``."""
+    return f'{base_url}/metar/data?ids={icao}&format=raw&hours=0&taf=on&layout=off'
+
+
+CONTENT_START = 'id="awc_main_content_wrap"'
+CODE_OPEN, CODE_CLOSE = '<code>', '</code>'
+BREAK = re.compile(r'<br\s*/?>', re.IGNORECASE)
+TAG = re.compile(r'<[^>]*>')
+
+
+def iter_reports(chunks, taf=False):
+    """
+    Stream the report text out of an AWC page without building a DOM
+
+    Scans the body for ``<code>...</code>`` blocks after the
+    ``awc_main_content_wrap`` marker, holding at most one unfinished block in
+    memory, so the response can be fed in as it arrives.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes or str
+        Body of the response, whole or in pieces (e.g. ``iter_content()``)
+    taf : bool
+        Page uses the TAF layout: the METAR is listed before the TAF, so only
+        blocks starting with ``TAF`` are kept, and each ``<br/>`` separated
+        forecast line becomes its own line
+
+    Yields
+    ----------
+    line : str
+        One report (or TAF line) with entities decoded
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buf, started = '', False
+    for chunk in chunks:
+        buf += decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if not started:
+            pos = buf.find(CONTENT_START)
+            if pos < 0:
+                buf = buf[-len(CONTENT_START):]
+                continue
+            started = True
+            buf = buf[pos + len(CONTENT_START):]
+
+        while True:
+            start = buf.find(CODE_OPEN)
+            if start < 0:
+                buf = buf[-len(CODE_OPEN):]
+                break
+            end = buf.find(CODE_CLOSE, start)
+            if end < 0:
+                buf = buf[start:]
+                break
+            text = buf[start + len(CODE_OPEN):end]
+            buf = buf[end + len(CODE_CLOSE):]
+            if not taf:
+                yield html.unescape(TAG.sub('', text))
+            elif text.lstrip().startswith('TAF'):
+                for line in BREAK.split(text):
+                    yield html.unescape(TAG.sub('', line))
+
+
+def extract_reports(src, taf=False):
+    """
+    Pull the report lines out of an AWC page
+
+    Parameters
+    ----------
+    src : bytes, str or iterable of bytes
+        Body of the response
+    taf : bool
+        Page uses the TAF layout, see ``iter_reports``
+
+    Returns
+    ----------
+    obs : str
+        str with each report as a seperate line (\n)
+    """
+    if isinstance(src, (bytes, str)):
+        src = [src]
+    return ''.join(f'{line}\n' for line in iter_reports(src, taf=taf))
+
+
+def _extract_reports_soup(src, taf=False):
+    """The original BeautifulSoup extraction, kept only as a benchmark baseline."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(src, "html.parser")
+    metar_data = soup.find(id='awc_main_content_wrap')
+
+    obs = ''
+    for i, text in enumerate(metar_data):
+        if taf and i <= 8:
+            continue
+        if str(text).startswith('<code>'):
+            line = str(text).lstrip('<code>').rstrip('</code>')
+            obs += line
+            obs += '\n'
+    if taf:
+        obs = obs.replace('<br/>', '\n')
+    return obs
+
+
+class RateLimiter:
+    """
+    Token bucket allowing ``rate`` requests per second with bursts of up to ``burst``
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def _fetch_one(client, limiters, semaphore, icao, url, taf, retries, rate, burst,
+                     backoff=1.):
+    netloc = urlsplit(url).netloc
+    if netloc not in limiters:
+        limiters[netloc] = RateLimiter(rate, burst)
+    limiter = limiters[netloc]
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(backoff * attempt)
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                async with client.get(url) as resp:
+                    resp.raise_for_status()
+                    src = await resp.read()
+                return icao, extract_reports(src, taf=taf), None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+    return icao, None, error
+
+
+async def fetch_reports(icaos, taf=False, hoursback=None, concurrency=16, rate=20.,
+                        burst=5, retries=2, backoff=1., timeout=30, base_url=AWC_URL,
+                        trace_configs=None):
+    """
+    Fetch METARs (or TAFs) for many stations concurrently
+
+    All requests share one pooled keep-alive aiohttp client. At most
+    ``concurrency`` requests are in flight, and each host is limited to
+    ``rate`` requests per second. Stations are yielded as soon as they finish,
+    not in input order.
+
+    Parameters
+    ----------
+    icaos : iterable of str
+        ICAO identifiers to fetch
+    taf : bool
+        Fetch the TAF page (as ``get_taf`` does) instead of the METAR page
+    hoursback : str or int
+        Number of hours before present to query (METARs only)
+    concurrency : int
+        Maximum number of requests in flight
+    rate, burst : float, int
+        Per-host token bucket: requests per second and maximum burst
+    retries : int
+        Number of times a failed station is retried
+    backoff : float
+        Seconds to wait before the first retry, growing linearly after that
+    timeout : float
+        Total timeout in seconds for each request
+    base_url : str
+        Server to query, e.g. a local stand-in server for tests
+    trace_configs : list of aiohttp.TraceConfig
+        Request hooks passed to the client, e.g. to time each request
+
+    Yields
+    ----------
+    icao, obs, error : str, str, Exception
+        ``obs`` is the same text the single-station fetchers return, or None
+        if the station failed with ``error``
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiters = {}
+    async with aiohttp.ClientSession(connector=connector, trace_configs=trace_configs,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as client:
+        tasks = []
+        for icao in icaos:
+            icao = icao.upper()
+            url = taf_url(icao, base_url) if taf else metar_url(icao, hoursback, base_url)
+            tasks.append(asyncio.ensure_future(
+                _fetch_one(client, limiters, semaphore, icao, url, taf, retries, rate, burst,
+                           backoff)))
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def fetch_all(icaos, **kwargs):
+    """
+    Blocking wrapper around ``fetch_reports``
+
+    Returns
+    ----------
+    obs : dict
+        ICAO -> report text for every station that succeeded
+    """
+    async def collect():
+        obs = {}
+        async for icao, text, error in fetch_reports(icaos, **kwargs):
+            if error is None:
+                obs[icao] = text
+            else:
+                print(f'{icao}: {error}')
+        return obs
+
+    return asyncio.run(collect())
+
+
+def stand_in_page(icao, hoursback=0, taf=False):
+    """HTML in the AWC layout with fake reports for ``icao``."""
+    metars = [f'{icao} 18{(17 - h) % 24:02d}51Z 27010KT 10SM FEW045 12/03 A3012 RMK AO2'
+              for h in range(max(int(hoursback or 0), 1))]
+    body = ['<h1>Data</h1>', '<p>Data at: 1751 UTC 18 Oct 2026</p>', '<hr/>']
+    body += [f'<code>{m}</code><br/>' for m in metars]
+    if taf:
+        body += ['<p>TAF</p>'] * 6
+        body.append(f'<code>TAF {icao} 181720Z 1818/1918 27010KT P6SM FEW045<br/>'
+                    f'&nbsp;&nbsp;FM190000 VRB03KT P6SM SKC</code>')
+    return (f'<html><body><div id="awc_main_content_wrap">{"".join(body)}'
+            '</div></body></html>')
+
+
+def stand_in_app(latency=0.05, jitter=0.05, seed=0):
+    """
+    aiohttp application imitating the AWC METAR/TAF endpoint
+
+    Every request waits ``latency`` seconds plus an exponential tail with
+    mean ``jitter`` before answering, so throughput and tail latency can be
+    measured offline.
+    """
+    rng = np.random.default_rng(seed)
+
+    async def handler(request):
+        await asyncio.sleep(latency + rng.exponential(jitter))
+        q = request.query
+        page = stand_in_page(q.get('ids', 'KXXX'), q.get('hours', 0), q.get('taf') == 'on')
+        return web.Response(text=page, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/metar/data', handler)
+    return app
+
+
+async def serve_stand_in(app, host='127.0.0.1', port=0):
+    """Start ``app`` on ``host``; returns the runner and the base URL to pass as ``base_url``."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://{host}:{port}'
+
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'awc_pages')
+
+
+def check_extract(pages_dir=PAGES_DIR):
+    """
+    Run the extractor over the saved AWC pages and compare with the expected text
+
+    Each ``<name>.html`` in ``pages_dir`` is paired with ``<name>.txt``;
+    pages named ``taf_*`` use the TAF layout. Every page is also fed in
+    small chunks to exercise the streaming path. Returns the failing names.
+    """
+    failed = []
+    for name in sorted(os.listdir(pages_dir)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(pages_dir, name), 'rb') as f:
+            src = f.read()
+        with open(os.path.join(pages_dir, name[:-5] + '.txt'), encoding='utf-8') as f:
+            expected = f.read()
+        taf = name.startswith('taf_')
+        chunks = [src[i:i + 7] for i in range(0, len(src), 7)]
+        ok = extract_reports(src, taf=taf) == expected == extract_reports(chunks, taf=taf)
+        print(f'{name}: {"ok" if ok else "MISMATCH"}')
+        if not ok:
+            failed.append(name)
+    return failed
+
+
+def benchmark_extract(n_reports=(1, 24, 500), repeat=20):
+    """
+    Parse throughput of the BeautifulSoup path against the streaming extractor
+
+    The extractor is timed on whole pages and on 8 kB chunks as they arrive
+    from ``iter_content``.
+    """
+    for n in n_reports:
+        page = stand_in_page('KPIT', hoursback=n).encode()
+        chunks = [page[i:i + 8192] for i in range(0, len(page), 8192)]
+        assert _extract_reports_soup(page) == extract_reports(page) == extract_reports(chunks)
+        for label, func, src in (('soup', _extract_reports_soup, page),
+                                 ('streaming', extract_reports, page),
+                                 ('chunked', extract_reports, chunks)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func(src)
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f'{n:4d} reports  {label:9s} {elapsed * 1000:8.3f} ms/page  '
+                  f'{len(page) / elapsed / 2**20:8.1f} MB/s')
+
+
+def benchmark(n_stations=500, concurrency=(1, 16, 64), rate=1000., latency=0.05, jitter=0.05):
+    """Throughput and tail latency of ``fetch_reports`` against the stand-in server."""
+    icaos = [f'K{i:03d}' for i in range(n_stations)]
+
+    async def run(limit):
+        latencies = []
+
+        async def on_start(session, ctx, params):
+            ctx.start = time.perf_counter()
+
+        async def on_end(session, ctx, params):
+            latencies.append(time.perf_counter() - ctx.start)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_start)
+        trace.on_request_end.append(on_end)
+
+        runner, base_url = await serve_stand_in(stand_in_app(latency, jitter))
+        start = time.perf_counter()
+        try:
+            async for icao, text, error in fetch_reports(icaos, hoursback=24, concurrency=limit,
+                                                         rate=rate, burst=limit,
+                                                         base_url=base_url,
+                                                         trace_configs=[trace]):
+                pass
+        finally:
+            await runner.cleanup()
+        return time.perf_counter() - start, np.array(latencies)
+
+    for limit in concurrency:
+        total, latencies = asyncio.run(run(limit))
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        print(f'concurrency {limit:3d}: {n_stations / total:8.1f} stations/s  '
+              f'latency p50 {p50:6.1f} ms  p95 {p95:6.1f} ms  p99 {p99:6.1f} ms')
+
+
+if __name__ == '__main__':
+    check_extract()
+    benchmark_extract()
+    benchmark()
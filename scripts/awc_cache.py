@@ -0,0 +1,263 @@
+"""
+On-disk cache of AWC METAR and TAF reports with incremental refresh.
+
+Reports are stored in SQLite keyed by (station, kind, report time). For each
+station the cache also remembers when it last hit the server and how far
+back that history is complete, so a request for N hours back only downloads
+the hours since the last fetch and merges them with what is already cached.
+Reports older than the TTL are evicted, and the oldest reports go first when
+the cache grows past its size cap.
+"""
+import asyncio
+import math
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from awc import SESSION, metar_url, taf_url, extract_reports, fetch_reports
+
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                          'awc_cache.sqlite')
+
+# day/hour/minute group of the issue time, e.g. 181751Z
+REPORT_TIME = re.compile(r'\b(\d{2})(\d{2})(\d{2})Z\b')
+
+
+def report_time(text, now=None):
+    """
+    Epoch seconds of a METAR/TAF report from its DDHHMMZ group
+
+    The month and year are not in the report, so the most recent matching
+    day no later than an hour past ``now`` is used.
+    """
+    match = REPORT_TIME.search(text)
+    if match is None:
+        return None
+    day, hour, minute = (int(g) for g in match.groups())
+    now = datetime.fromtimestamp(now or time.time(), timezone.utc)
+    year, month = now.year, now.month
+    for _ in range(3):
+        try:
+            t = datetime(year, month, day, hour, minute, tzinfo=timezone.utc)
+            if t.timestamp() <= now.timestamp() + 3600:
+                return t.timestamp()
+        except ValueError:
+            pass
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return None
+
+
+def download_metar(icao, hours):
+    resp = SESSION.get(metar_url(icao, hours), stream=True)
+    # an error or rate-limit page must not be stored as "no reports"
+    resp.raise_for_status()
+    return extract_reports(resp.iter_content(chunk_size=8192))
+
+
+def download_taf(icao, hours=None):
+    resp = SESSION.get(taf_url(icao), stream=True)
+    resp.raise_for_status()
+    return extract_reports(resp.iter_content(chunk_size=8192), taf=True)
+
+
+class ReportCache:
+    """
+    TTL-aware, size-capped store of raw METAR/TAF reports
+
+    Parameters
+    ----------
+    path : str
+        SQLite file holding the cache
+    ttl : float
+        Seconds a report is kept after its issue time
+    max_bytes : int
+        Cap on the total size of the cached report text
+    refresh : float
+        Seconds during which a station's last download is considered current,
+        so repeated calls do not hit the server at all
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=7 * 86400, max_bytes=64 * 2**20, refresh=300):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=30)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS reports (
+                    station TEXT, kind TEXT, issued REAL, text TEXT,
+                    PRIMARY KEY (station, kind, issued));
+                CREATE INDEX IF NOT EXISTS reports_issued ON reports (issued);
+                CREATE TABLE IF NOT EXISTS coverage (
+                    station TEXT, kind TEXT, covered_from REAL, fetched_at REAL,
+                    PRIMARY KEY (station, kind));
+            """)
+        return self._db
+
+    def close(self):
+        """Close the connection; the next access reopens it (e.g. in a forked worker)."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _coverage(self, icao, kind):
+        row = self.db.execute('SELECT covered_from, fetched_at FROM coverage '
+                              'WHERE station = ? AND kind = ?', (icao, kind)).fetchone()
+        return row or (None, None)
+
+    def missing_hours(self, icao, hoursback=None, kind='metar', now=None):
+        """
+        Number of hours to download to complete ``hoursback`` hours of ``icao``
+
+        Returns None when the cache is already current, 0 for "latest report
+        only" (AWC ``hours=0``), or the smallest hour count that reaches back
+        to the previous download.
+        """
+        now = now or time.time()
+        hoursback = int(hoursback or 0)
+        covered_from, fetched_at = self._coverage(icao, kind)
+        if fetched_at is None or covered_from > now - hoursback * 3600:
+            return hoursback
+        if now - fetched_at < self.refresh:
+            return None
+        return max(1, math.ceil((now - fetched_at) / 3600))
+
+    def store(self, icao, text, hours, kind='metar', now=None):
+        """
+        Merge freshly downloaded ``text`` covering the last ``hours`` hours into the cache
+
+        Only call this after a successful download: the hours are recorded as
+        covered and are not fetched again until they are evicted.
+        """
+        now = now or time.time()
+        # a METAR is one line, while a TAF spans the whole (multi-line) text
+        rows = []
+        for report in ([text.strip('\n')] if kind == 'taf' else text.split('\n')):
+            issued = report_time(report, now) if report.strip() else None
+            if issued is not None:
+                rows.append((icao, kind, issued, report))
+
+        covered_from, fetched_at = self._coverage(icao, kind)
+        start = now - hours * 3600
+        if fetched_at is None or start > fetched_at:
+            covered_from = start
+        else:
+            covered_from = min(covered_from, start)
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)', rows)
+            self.db.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?)',
+                            (icao, kind, covered_from, now))
+        self.evict(now)
+
+    def reports(self, icao, hoursback=None, kind='metar', now=None):
+        """Cached reports of ``icao`` in the last ``hoursback`` hours, newest first, one per line."""
+        now = now or time.time()
+        if hoursback:
+            rows = self.db.execute('SELECT text FROM reports WHERE station = ? AND kind = ? '
+                                   'AND issued >= ? ORDER BY issued DESC',
+                                   (icao, kind, now - int(hoursback) * 3600))
+        else:
+            rows = self.db.execute('SELECT text FROM reports WHERE station = ? AND kind = ? '
+                                   'ORDER BY issued DESC LIMIT 1', (icao, kind))
+        return ''.join(f'{text}\n' for text, in rows)
+
+    def insert(self, rows, kind='metar'):
+        """
+        Add reports already placed in time, e.g. a backfill of an archive
+
+        ``rows`` are ``(icao, issued, text)`` with ``issued`` in epoch seconds;
+        the download coverage is left alone.
+        """
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)',
+                                ((icao.upper(), kind, float(issued), text)
+                                 for icao, issued, text in rows))
+
+    def iter_reports(self, icao, kind='metar', start=None, end=None):
+        """
+        Stream ``(issued, text)`` of ``icao`` with ``start <= issued < end``, oldest first
+
+        Rows come straight off the SQLite cursor (the primary key is already
+        in this order), so a year of reports is never held at once.
+        """
+        rows = self.db.execute('SELECT issued, text FROM reports WHERE station = ? AND kind = ? '
+                               'AND issued >= ? AND issued < ? ORDER BY issued',
+                               (icao.upper(), kind, -math.inf if start is None else start,
+                                math.inf if end is None else end))
+        yield from rows
+
+    def evict(self, now=None):
+        """Drop reports past the TTL, then the oldest reports until under the size cap."""
+        now = now or time.time()
+        cutoff = now - self.ttl
+        with self.db:
+            self.db.execute('DELETE FROM reports WHERE issued < ?', (cutoff,))
+            self.db.execute('UPDATE coverage SET covered_from = ? WHERE covered_from < ?',
+                            (cutoff, cutoff))
+            size, = self.db.execute('SELECT COALESCE(SUM(LENGTH(text)), 0) FROM reports').fetchone()
+            if size > self.max_bytes:
+                # walk the reports oldest first until enough text has been dropped
+                excess, oldest = size - self.max_bytes, None
+                for issued, length in self.db.execute(
+                        'SELECT issued, LENGTH(text) FROM reports ORDER BY issued'):
+                    excess -= length
+                    oldest = issued
+                    if excess <= 0:
+                        break
+                self.db.execute('DELETE FROM reports WHERE issued <= ?', (oldest,))
+                self.db.execute('UPDATE coverage SET covered_from = ? WHERE covered_from <= ?',
+                                (oldest, oldest))
+
+    def _get(self, icao, hoursback, kind, download):
+        icao = icao.upper()
+        now = time.time()
+        hours = self.missing_hours(icao, hoursback, kind, now)
+        if hours is not None:
+            # download first: a failed request raises before any coverage is recorded
+            text = download(icao, hours)
+            self.store(icao, text, hours, kind, now)
+        return self.reports(icao, hoursback, kind, now)
+
+    def metars(self, icao, hoursback=None, download=download_metar):
+        """METARs of the last ``hoursback`` hours, downloading only what is missing."""
+        return self._get(icao, hoursback, 'metar', download)
+
+    def taf(self, icao, download=download_taf):
+        """Latest TAF of ``icao``, downloaded at most once per ``refresh`` seconds."""
+        return self._get(icao, None, 'taf', download)
+
+    def refresh_metars(self, icaos, hoursback=None, **kwargs):
+        """
+        Bring many stations up to date with the concurrent fetcher
+
+        Stations are grouped by the number of hours they are missing so each
+        group is one ``fetch_reports`` call; ``kwargs`` are passed through.
+        """
+        now = time.time()
+        groups = {}
+        for icao in icaos:
+            icao = icao.upper()
+            hours = self.missing_hours(icao, hoursback, 'metar', now)
+            if hours is not None:
+                groups.setdefault(hours, []).append(icao)
+
+        async def run():
+            for hours, group in groups.items():
+                async for icao, text, error in fetch_reports(group, hoursback=hours, **kwargs):
+                    if error is None:
+                        self.store(icao, text, hours, 'metar', now)
+                    else:
+                        print(f'{icao}: {error}')
+
+        asyncio.run(run())
+
+
+CACHE = ReportCache()
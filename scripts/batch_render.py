@@ -0,0 +1,229 @@
+"""
+Batch rendering of Skew-Ts and meteograms over many stations.
+
+Every (product, station) pair is one task in a process pool. Workers use the
+Agg backend, can be capped in address space, and are replaced after a fixed
+number of tasks so leaked figures and fragmented heaps never pile up over a
+full cycle. METARs for the meteograms and soundings for the Skew-Ts are
+brought up to date once, up front, with the concurrent AWC and Wyoming
+fetchers so the workers read them from the local caches.
+
+Usage (from scripts/):
+
+    python batch_render.py --stations KPIT KIAD --products skewt meteogram
+    python batch_render.py --state PA --products meteogram --hoursback 24
+    python batch_render.py --near 40.5 -80.2 300 --workers 8 --max-memory 2048
+
+A JSON manifest with the output file, status and timings of every task is
+written next to the images.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+import warnings
+from datetime import datetime, timezone
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_DIR = os.path.join(SCRIPT_DIR, '..', 'imgs')
+PRODUCTS = ('skewt', 'meteogram')
+
+
+def select_stations(stations=None, state=None, country=None, near=None, bbox=None):
+    """
+    ICAO identifiers from an explicit list and/or a query against the station file
+
+    Parameters
+    ----------
+    stations : iterable of str
+        Explicit ICAO identifiers
+    state, country : str
+        Two-letter state or country code to match
+    near : (lat, lon, radius)
+        Stations within ``radius`` km of a point
+    bbox : (west, east, south, north)
+        Stations inside a lon/lat box
+
+    Returns
+    ----------
+    icaos : list of str
+        Unique identifiers, explicit stations first
+    """
+    from stations import station_index
+
+    icaos = [s.upper() for s in stations or []]
+    if state or country or near or bbox:
+        index = station_index()
+        rows = None
+        if near:
+            rows = set(index.within(near[0], near[1], near[2]))
+        if bbox:
+            found = set(index.bbox(*bbox))
+            rows = found if rows is None else rows & found
+        table = index.table
+        if rows is None:
+            rows = set(range(len(index)))
+        if state:
+            rows = {r for r in rows if table['state'][r] == state.upper()}
+        if country:
+            rows = {r for r in rows if table['country'][r] == country.upper()}
+        icaos += [str(index.icao[r]) for r in sorted(rows)]
+    return list(dict.fromkeys(icaos))
+
+
+def _init_worker(max_memory=None):
+    """Pool initializer: headless backend, optional address-space cap, quiet warnings."""
+    import matplotlib
+    matplotlib.use('Agg')
+    os.chdir(SCRIPT_DIR)  # products save to ../imgs relative to here
+    warnings.simplefilter('ignore')
+    if max_memory:
+        limit = int(max_memory) * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def render(task):
+    """Render one (product, station, hoursback) task and report how it went."""
+    product, icao, hoursback = task
+    import matplotlib.pyplot as plt
+
+    entry = {'product': product, 'station': icao, 'file': None, 'status': 'ok',
+             'error': None, 'pid': os.getpid()}
+    tic = time.perf_counter()
+    try:
+        if product == 'skewt':
+            from skewt import make_skewt
+            fname = make_skewt(icao, hoursback)
+        else:
+            from meteogram import meteogram
+            fname, _ = meteogram(icao, hoursback)
+        entry['file'] = os.path.normpath(os.path.join(SCRIPT_DIR, fname))
+    except MemoryError:
+        entry.update(status='error', error='MemoryError')
+    except Exception as e:
+        entry.update(status='error', error=f'{type(e).__name__}: {e}')
+    finally:
+        plt.close('all')
+    entry['seconds'] = round(time.perf_counter() - tic, 3)
+    entry['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return entry
+
+
+def run_batch(icaos, products=PRODUCTS, hoursback=None, workers=None, maxtasksperchild=10,
+              max_memory=None, prefetch=True, manifest=None):
+    """
+    Render every product for every station in a process pool
+
+    Parameters
+    ----------
+    icaos : list of str
+        Stations to render
+    products : iterable of str
+        Any of ``'skewt'`` and ``'meteogram'``
+    hoursback : int
+        Hours back for the sounding cycle / METAR history, None for the latest
+    workers : int
+        Pool size, defaults to the number of CPUs
+    maxtasksperchild : int
+        Tasks a worker renders before it is replaced by a fresh process
+    max_memory : int
+        Address-space cap per worker in MB (tasks over it fail with MemoryError)
+    prefetch : bool
+        Refresh the METAR cache and the sounding archive for all stations
+        concurrently before rendering
+    manifest : str
+        Path of the JSON manifest, defaults to imgs/manifest_<UTC time>.json
+
+    Returns
+    ----------
+    manifest : str
+        Path of the written manifest
+    """
+    started = datetime.now(timezone.utc)
+    tic = time.perf_counter()
+    prefetch_seconds = None
+    if prefetch and 'meteogram' in products:
+        from awc_cache import CACHE
+        CACHE.refresh_metars(icaos, hoursback)
+        # SQLite connections must not cross a fork: each worker opens its own
+        CACHE.close()
+    if prefetch and 'skewt' in products:
+        from soundings import cycle_time, fetch_cycle, station_id
+        fetch_cycle([station_id(icao) for icao in icaos], cycle_time(hoursback))
+    if prefetch:
+        prefetch_seconds = round(time.perf_counter() - tic, 3)
+    if 'skewt' in products:
+        # load the template and the pseudoadiabat table once here, forked workers inherit them
+        from skewt import skewt_template
+        from thermo import load_pseudoadiabat_table
+        skewt_template()
+        load_pseudoadiabat_table()
+
+    # interleave products so a slow product does not leave workers idle at the end
+    tasks = [(product, icao, hoursback) for icao in icaos for product in products]
+    entries = []
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(max_memory,),
+                              maxtasksperchild=maxtasksperchild) as pool:
+        for entry in pool.imap_unordered(render, tasks):
+            entries.append(entry)
+            print(f"[{len(entries)}/{len(tasks)}] {entry['product']} {entry['station']}: "
+                  f"{entry['file'] or entry['error']} ({entry['seconds']} s)")
+
+    ok = [e for e in entries if e['status'] == 'ok']
+    manifest = manifest or os.path.join(
+        MANIFEST_DIR, f"manifest_{started.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(manifest, 'w') as f:
+        json.dump({
+            'started': started.isoformat(),
+            'wall_seconds': round(time.perf_counter() - tic, 3),
+            'prefetch_seconds': prefetch_seconds,
+            'workers': workers or os.cpu_count(),
+            'maxtasksperchild': maxtasksperchild,
+            'max_memory_mb': max_memory,
+            'hoursback': hoursback,
+            'rendered': len(ok),
+            'failed': len(entries) - len(ok),
+            'render_seconds': round(sum(e['seconds'] for e in entries), 3),
+            'tasks': sorted(entries, key=lambda e: (e['station'], e['product'])),
+        }, f, indent=1)
+    print(f'{len(ok)}/{len(entries)} rendered in {time.perf_counter() - tic:.1f} s, '
+          f'manifest at {manifest}')
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stations', nargs='+', default=[], help='ICAO identifiers')
+    parser.add_argument('--stations-file', help='file with one ICAO per line')
+    parser.add_argument('--state', help='every station in a two-letter state')
+    parser.add_argument('--country', help='every station in a two-letter country')
+    parser.add_argument('--near', nargs=3, type=float, metavar=('LAT', 'LON', 'KM'),
+                        help='stations within KM of a point')
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('W', 'E', 'S', 'N'),
+                        help='stations inside a lon/lat box')
+    parser.add_argument('--products', nargs='+', choices=PRODUCTS, default=list(PRODUCTS))
+    parser.add_argument('--hoursback', type=int)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--maxtasksperchild', type=int, default=10)
+    parser.add_argument('--max-memory', type=int, metavar='MB',
+                        help='address-space cap per worker')
+    parser.add_argument('--no-prefetch', action='store_true')
+    parser.add_argument('--manifest')
+    args = parser.parse_args(argv)
+
+    stations = list(args.stations)
+    if args.stations_file:
+        with open(args.stations_file) as f:
+            stations += [line.strip() for line in f if line.strip()]
+    icaos = select_stations(stations, args.state, args.country, args.near, args.bbox)
+    if not icaos:
+        parser.error('no stations selected')
+    return run_batch(icaos, args.products, args.hoursback, args.workers, args.maxtasksperchild,
+                     args.max_memory, not args.no_prefetch, args.manifest)
+
+
+if __name__ == '__main__':
+    main()
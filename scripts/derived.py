@@ -0,0 +1,251 @@
+"""
+Registry of derived variables computed lazily and memoized per dataset.
+
+Each derived quantity declares its inputs (dataset variables, the vertical
+pressure coordinate or other derived quantities) with the units its kernel
+expects, and a vectorized kernel over plain arrays. ``derived(ds, 'theta')``
+converts the inputs at the edge, runs the kernel once through
+``xr.apply_ufunc`` (so a 1-D ``level`` broadcasts against 3-D fields without
+being materialized, and dask-backed inputs stay lazy) and keeps the result in
+an LRU cache keyed by the dataset's source and coordinates plus the selection,
+so every product asking for ``theta`` or ``rh`` on the same data shares one
+computation.
+
+    theta = derived(ds, 'theta')
+    rh = derived(ds, 'rh', latitude=slice(50, 20))
+"""
+import hashlib
+import os
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import xarray as xr
+from metpy.units import units
+
+from thermo import EPS, KAPPA, _dewpoint_from_vapor_pressure, _saturation_vapor_pressure
+
+
+Derived = namedtuple('Derived', ['name', 'inputs', 'units', 'kernel'])
+
+REGISTRY = {}
+
+# dataset variable names tried for each raw input (ERA5 short names first)
+ALIASES = {
+    'temperature': ('t', 'Temperature_isobaric', 'temperature'),
+    'specific_humidity': ('q', 'Specific_humidity_isobaric', 'specific_humidity'),
+    'u': ('u', 'u-component_of_wind_isobaric', 'u_wind'),
+    'v': ('v', 'v-component_of_wind_isobaric', 'v_wind'),
+    'height': ('z', 'Geopotential_height_isobaric', 'height'),
+}
+
+
+def register(name, inputs, units):
+    """
+    Decorator adding a kernel to the registry
+
+    Parameters
+    ----------
+    name : str
+        Name of the derived quantity
+    inputs : sequence of (str, str)
+        ``(input name, units the kernel expects)``; names are raw variables
+        (see ``ALIASES``), ``'pressure'`` for the vertical coordinate, or other
+        derived quantities
+    units : str
+        Units of the kernel's result
+    """
+    def decorator(kernel):
+        REGISTRY[name] = Derived(name, tuple(inputs), units, kernel)
+        return kernel
+    return decorator
+
+
+@register('theta', [('pressure', 'hPa'), ('temperature', 'K')], 'K')
+def _theta(p, t):
+    return t * (1000. / p)**KAPPA
+
+
+@register('mixing_ratio', [('specific_humidity', 'dimensionless')], 'dimensionless')
+def _mixing_ratio(q):
+    return q / (1 - q)
+
+
+@register('rh', [('pressure', 'hPa'), ('temperature', 'K'), ('mixing_ratio', 'dimensionless')],
+          'dimensionless')
+def _relative_humidity(p, t, w):
+    return p * w / (EPS + w) / _saturation_vapor_pressure(t)
+
+
+@register('dewpoint', [('pressure', 'hPa'), ('mixing_ratio', 'dimensionless')], 'K')
+def _dewpoint(p, w):
+    return _dewpoint_from_vapor_pressure(p * w / (EPS + w))
+
+
+@register('wind_speed', [('u', 'knots'), ('v', 'knots')], 'knots')
+def _wind_speed(u, v):
+    return np.hypot(u, v)
+
+
+@register('u_knots', [('u', 'knots')], 'knots')
+def _u_knots(u):
+    return u
+
+
+@register('v_knots', [('v', 'knots')], 'knots')
+def _v_knots(v):
+    return v
+
+
+def _convert(arr, target):
+    """``arr`` converted from its ``units`` attribute to ``target``, lazily (linear conversions)."""
+    source = arr.attrs.get('units', target)
+    if source in ('', None):
+        source = 'dimensionless'
+    if units(source) == units(target):
+        return arr
+    offset = units.Quantity(0., source).m_as(target)
+    scale = units.Quantity(1., source).m_as(target) - offset
+    out = arr * scale + offset if offset else arr * scale
+    return out.assign_attrs(units=target)
+
+
+def _vertical(ds):
+    """Vertical pressure coordinate of ``ds``."""
+    for var in ds.data_vars.values():
+        if var.ndim >= 3:
+            try:
+                return var.metpy.vertical
+            except AttributeError:
+                break
+    return ds['level']
+
+
+def _fingerprint(ds):
+    """Key of a dataset view: its source file and coordinate values (the data itself when in memory)."""
+    digest = hashlib.sha1()
+    source = ds.encoding.get('source')
+    if source:
+        digest.update(str(source).encode())
+        # a file rewritten at the same path must not hit results of the old one
+        try:
+            stat = os.stat(source)
+            digest.update(f'{stat.st_mtime_ns}:{stat.st_size}'.encode())
+        except OSError:
+            pass
+    else:
+        from dask.base import tokenize
+        digest.update(tokenize(ds).encode())
+    for name in sorted(map(str, ds.coords)):
+        coord = ds[name]
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(coord.values).tobytes() if coord.dtype != object
+                      else repr(coord.values.tolist()).encode())
+    digest.update(repr(sorted(map(str, ds.data_vars))).encode())
+    return digest.hexdigest()
+
+
+def _selection_key(selection):
+    return tuple(sorted((k, repr(np.asarray(v).tolist() if not isinstance(v, slice) else v))
+                        for k, v in selection.items()))
+
+
+class DerivedCache:
+    """
+    LRU of derived arrays, bounded by their size in memory
+
+    Lazy (dask-backed) results count with the size they will have once
+    computed, so they are evicted like any other.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Total size kept; the least recently used results are dropped first
+    """
+
+    def __init__(self, max_bytes=512 * 2**20):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        nbytes = value.nbytes
+        if nbytes > self.max_bytes:
+            return value
+        self._items[key] = value
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, old = self._items.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return value
+
+    def clear(self):
+        self._items.clear()
+        self.nbytes = 0
+
+
+DERIVED_CACHE = DerivedCache()
+
+
+def _raw(ds, name):
+    """Dataset variable for a raw input name."""
+    if name == 'pressure':
+        return _vertical(ds)
+    for alias in ALIASES.get(name, (name,)):
+        if alias in ds.variables:
+            return ds[alias]
+    raise KeyError(f'{name!r} is neither a variable of the dataset nor a derived quantity')
+
+
+def derived(ds, name, cache=DERIVED_CACHE, **selection):
+    """
+    Derived quantity ``name`` of ``ds``, computed on first access and memoized
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Source data
+    name : str
+        Registered quantity (see ``REGISTRY``) or a dataset variable
+    cache : DerivedCache
+        Memo of results, the process-wide ``DERIVED_CACHE`` by default
+    selection
+        ``ds.sel`` arguments restricting the computation
+
+    Returns
+    ----------
+    value : xarray.DataArray
+        With a ``units`` attribute
+    """
+    return _derived(ds, _fingerprint(ds), name, cache, selection)
+
+
+def _derived(ds, token, name, cache, selection):
+    if name not in REGISTRY:
+        raw = _raw(ds, name)
+        keep = {k: v for k, v in selection.items() if k in raw.dims}
+        return raw.sel(keep) if keep else raw
+
+    key = (token, name, _selection_key(selection))
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    spec = REGISTRY[name]
+    args = [_convert(_derived(ds, token, inp, cache, selection), unit)
+            for inp, unit in spec.inputs]
+    # keep_attrs keeps the coordinates' (e.g. MetPy axis) attributes, the result's are replaced
+    value = xr.apply_ufunc(spec.kernel, *args, dask='allowed', keep_attrs=True)
+    value = value.rename(name)
+    value.attrs = {'units': spec.units}
+    return cache.put(key, value)
@@ -1,6 +1,7 @@
 import itertools
 import os
 import sys
+import time
 import requests
 import datetime
 from datetime import datetime as dt
@@ -33,22 +34,33 @@ from metpy import calc as mpcalc
 from metpy.plots.ctables import registry
 from siphon.catalog import TDSCatalog
 
+from goes_raster import COLORTABLES, ColorLUT, FixedGrid, render_image, write_png, annotate, \
+    feature_lines, write_tiles
+from goes_subset import open_goes_subset, catalog_url
+from map_features import cached_feature
+from stations import station_index
 
-def get_goes_image(date=dt.utcnow(), channel=13, region='CONUS'):
-    """Return dataset of GOES-16 data."""
-    cat = TDSCatalog('https://thredds.ucar.edu/thredds/catalog/satellite/goes/east/products/'
-                     'CloudAndMoistureImagery/{}/Channel{:02d}/{:%Y%m%d}/'
-                     'catalog.xml'.format(region, channel, date))
+
+# lon/lat extent of the regional GOES products
+EXTENT = (-110, -70, 25, 50)
+
+
+def get_goes_image(date=dt.utcnow(), channel=13, region='CONUS', bbox=None, resolution=None):
+    """
+    Return dataset of GOES-16 data.
+
+    Only the part of the sector covering ``bbox`` (west, east, south, north),
+    decimated to about ``resolution`` km, is requested over OPeNDAP.
+    """
+    cat = TDSCatalog(catalog_url(channel, region, date))
 
     ds = cat.datasets[0]  # Get most recent dataset
-    ds = ds.remote_access(service='OPENDAP')
-    ds = NetCDF4DataStore(ds)
-    ds = xr.open_dataset(ds)
+    ds = open_goes_subset(ds.access_urls['OPENDAP'], bbox, resolution)
 
     return ds
 
 
-def plot_cities(ax, data_crs, color, label=True):
+def plot_cities(ax, data_crs, color, label=True, stations=None):
 
     cities = {
         # 'Grand Junction':(39.1222, -108.5291), # Grand Junction: 39.1222° N, 108.5291° W
@@ -78,6 +90,9 @@ def plot_cities(ax, data_crs, color, label=True):
         'Ashtabula': (47.0975, -97.9106),  # KBAC
         'Thunder Spirit': (46.0453, -102.6003),
     }
+    if stations is not None:
+        # label ICAOs looked up in the station registry instead of the list above
+        cities = station_index().coords(stations)
 
     for city, coord in cities.items():
         at_x, at_y = ax.projection.transform_point(coord[1], coord[0], src_crs=data_crs)
@@ -91,9 +106,10 @@ def plot_cities(ax, data_crs, color, label=True):
     return cities
 
 
-def plotGOES(channel, cities=True):
+def plotGOES(channel, cities=True, resolution=None):
     # channel 9 in mid WV, channel 13 is clean LWIR
-    ds = get_goes_image(channel=channel)
+    # read only the pixels inside the map extent
+    ds = get_goes_image(channel=channel, bbox=EXTENT, resolution=resolution)
     # Parse out the projection data from the satellite file
     dat = ds.metpy.parse_cf('Sectorized_CMI')
     proj = dat.metpy.cartopy_crs
@@ -133,10 +149,11 @@ def plotGOES(channel, cities=True):
     cbar.ax.tick_params(labelsize=60, direction='out', length=50, width=5)
     cbar.set_ticks(tickloc)
 
-    ax.add_feature(cfeat.BORDERS, linewidth=8, edgecolor='black')
-    ax.add_feature(cfeat.STATES.with_scale('50m'), linestyle='-',
+    # borders and states come pre-projected into the satellite's geostationary CRS
+    ax.add_feature(cached_feature('borders', proj, EXTENT), linewidth=8, edgecolor='black')
+    ax.add_feature(cached_feature('states', proj, EXTENT, scale='50m'), linestyle='-',
                    edgecolor='black', linewidth=4)
-    ax.set_extent([-110, -70, 50, 25])
+    ax.set_extent(EXTENT)
 
     timestamp = datetime.datetime.strptime(ds.start_date_time, '%Y%j%H%M%S')
     text_time = ax.text(0.01, 0.01, timestamp.strftime('%d %B %Y %H%MZ'),
@@ -174,11 +191,53 @@ def plotGOES(channel, cities=True):
     return cities, fpath
 
 
+def rasterGOES(channel, resolution=None, tiles=False, zooms=range(3, 8), label=True,
+               cities=None, ds=None):
+    """
+    Render a GOES image straight from the brightness temperatures
+
+    The colortable is applied through a uint8 lookup table and borders and
+    states are burned in as pixel lines, without a matplotlib figure. With
+    ``tiles`` an XYZ pyramid is written under ``../imgs/satellite/tiles``;
+    ``label`` adds the time stamp (and ``cities``, a list of ICAOs) with
+    matplotlib.
+
+    Returns
+    ----------
+    fpath : str
+        PNG (or tile directory) written
+    """
+    if ds is None:
+        ds = get_goes_image(channel=channel, bbox=EXTENT, resolution=resolution)
+    values = ds['Sectorized_CMI'].values
+    grid = FixedGrid.from_dataset(ds)
+    lut = ColorLUT.for_channel(channel, values)
+    lines = feature_lines(('borders', 'states'), EXTENT)
+
+    fname = COLORTABLES.get(channel, (None, None, None, 'sat'))[3]
+    timestamp = datetime.datetime.strptime(ds.start_date_time, '%Y%j%H%M%S')
+    if tiles:
+        fpath = f'../imgs/satellite/tiles/{fname}_{timestamp.strftime("%Y%m%dT%H%MZ")}'
+        write_tiles(values, grid, lut, fpath, EXTENT, zooms, lines=lines)
+        return fpath
+
+    image = render_image(values, lut, grid, lines=lines, line_width=2)
+    fpath = f'../imgs/satellite/{fname}_{timestamp.strftime("%Y%m%dT%H%MZ")}.png'
+    if not label:
+        return write_png(image, fpath)
+    points = {}
+    if cities:
+        for icao, (lat, lon) in station_index().coords(cities).items():
+            points[icao] = grid.pixel(lat, lon)
+    return annotate(image, fpath, timestamp.strftime('%d %B %Y %H%MZ'), points)
+
+
 if __name__ == '__main__':
     # plot a goes east image from cahnnel 9 (mid-level water vapor)
     # channel 13 is infrared
     # channel 2 is traditional daytime visibile (black and white)
     channel = int(input('Enter GOES channel (Visible=2, Mid-level WV=9, IR=13): '))
+    frames = input('Enter loop length in frames (Leave blank for a single image): ')
     success = False
     i = 0
     while not success:
@@ -186,13 +245,19 @@ if __name__ == '__main__':
             print('I/O error. Try again later.')
             sys.exit(1)
         try:
-            cities, fpath = plotGOES(channel=channel)
+            if frames:
+                # only catalog entries newer than the buffered loop are downloaded
+                from goes_loop import update_loop
+                update_loop(channel, frames=int(frames), bbox=EXTENT,
+                            lines=feature_lines(('borders', 'states'), EXTENT))
+            else:
+                cities, fpath = plotGOES(channel=channel)
+                print(f'Satellite image saved at {fpath}')
             success = True
-            print(f'Satellite image saved at {fpath}')
         except OSError as e:
-            print(f'Download failed, trying again... ({x}/3 tries)')
-            time.sleep(2)
             i += 1
+            print(f'Download failed, trying again... ({i}/3 tries)')
+            time.sleep(2)
 
 
 
@@ -0,0 +1,329 @@
+"""
+Incrementally refreshed GOES animation loops.
+
+The last N frames of a channel/sector are kept as packed uint16 counts in a
+memory-mapped ring buffer (``frames.npy``) next to a small JSON index of
+which catalog entry, time and packing each slot holds. A refresh asks the
+catalog for entries newer than the newest buffered frame, downloads only
+those (concurrently, each in its own process because netCDF/HDF5 is not
+thread safe), colorizes only them into cached PNGs and assembles the
+animation from the cached PNGs. In steady state a refresh of a 60-frame loop
+is one download and one render.
+
+Each (region, channel, bbox, resolution) has its own loop directory. When the
+sector's grid changes under a loop, the buffered frames are dropped and the
+whole loop is downloaded again on the new grid.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from goes_raster import COLORTABLES, ColorLUT, FixedGrid, draw_lines, write_png
+from goes_subset import catalog_url, open_goes_subset
+
+
+LOOP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'goes_loop')
+TIME_FORMAT = '%Y%j%H%M%S'
+
+
+def catalog_entries(channel=13, region='CONUS', n=60, now=None):
+    """
+    ``(name, OPeNDAP URL)`` of the newest ``n`` catalog entries, oldest first
+
+    Yesterday's catalog is consulted too when today's has fewer than ``n``.
+    """
+    from siphon.catalog import TDSCatalog
+
+    now = now or datetime.utcnow()
+    entries = []
+    for date in (now, now - timedelta(days=1)):
+        cat = TDSCatalog(catalog_url(channel, region, date))
+        entries = [(name, ds.access_urls['OPENDAP']) for name, ds in cat.datasets.items()] + entries
+        if len(entries) >= n:
+            break
+    return sorted(entries)[-n:]
+
+
+def loop_name(channel=13, region='CONUS', bbox=None, resolution=None):
+    """Directory name of the loop of ``channel``/``region`` subset to ``bbox`` at ``resolution``."""
+    name = f'{region}_ch{channel:02d}'
+    if bbox is None and resolution is None:
+        return name
+    key = repr((None if bbox is None else [float(b) for b in bbox], resolution))
+    return f'{name}_{hashlib.sha1(key.encode()).hexdigest()[:12]}'
+
+
+def frame_grid(meta):
+    """The part of ``fetch_frame``'s metadata that all frames of one loop share."""
+    return {'x': meta['x'], 'y': meta['y'], 'proj': meta['proj']}
+
+
+def fetch_frame(source, bbox=None, resolution=None, variable='Sectorized_CMI'):
+    """
+    Packed counts and metadata of one GOES file, restricted to ``bbox``
+
+    Returns
+    ----------
+    counts : ndarray
+        uint16 counts as stored in the file
+    meta : dict
+        Scan time, packing (``scale_factor``, ``add_offset``, ``fill_value``),
+        x/y scan angles and grid mapping
+    """
+    with open_goes_subset(source, bbox, resolution, variable, mask_and_scale=False) as ds:
+        var = ds[variable]
+        counts = var.values.astype(np.uint16)
+        grid = FixedGrid.from_dataset(ds, variable)
+        meta = {
+            'time': datetime.strptime(ds.attrs['start_date_time'], TIME_FORMAT).isoformat(),
+            'scale_factor': float(var.attrs.get('scale_factor', 1.)),
+            'add_offset': float(var.attrs.get('add_offset', 0.)),
+            'fill_value': int(var.attrs['_FillValue']) if '_FillValue' in var.attrs else None,
+            'x': grid.x.tolist(),
+            'y': grid.y.tolist(),
+            'proj': {k: (v.item() if hasattr(v, 'item') else v) for k, v in grid.proj.items()},
+        }
+    return counts, meta
+
+
+class FrameRing:
+    """
+    Memory-mapped ring buffer of the last ``size`` frames of one channel/sector
+
+    Parameters
+    ----------
+    root : str
+        Directory of this loop, holding ``frames.npy``, ``index.json`` and the
+        rendered ``png/`` frames
+    size : int
+        Number of frames kept
+    request : dict
+        ``bbox`` and ``resolution`` the frames were requested with; an index
+        written for a different request is discarded
+    """
+
+    def __init__(self, root, size=60, request=None):
+        self.root = root
+        self.size = size
+        self.request = request
+        self.index_path = os.path.join(root, 'index.json')
+        self.frames_path = os.path.join(root, 'frames.npy')
+        self.png_dir = os.path.join(root, 'png')
+        self._frames = None
+        self.index = self._empty_index()
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index['size'] == size and index.get('request') == request:
+                self.index = index
+            else:
+                # the cached PNGs are named by scan time only, they belong to the old frames
+                self.clear()
+
+    def _empty_index(self):
+        return {'size': self.size, 'request': self.request, 'shape': None, 'grid': None,
+                'next': 0, 'slots': [None] * self.size}
+
+    @property
+    def frames(self):
+        if self._frames is None and self.index['shape'] is not None:
+            self._frames = np.lib.format.open_memmap(self.frames_path, mode='r+')
+        return self._frames
+
+    def clear(self):
+        """Drop every buffered frame and rendered PNG; the next ``push`` sets the grid."""
+        if os.path.isdir(self.png_dir):
+            for name in os.listdir(self.png_dir):
+                os.remove(os.path.join(self.png_dir, name))
+        self._frames = None
+        self.index = self._empty_index()
+
+    def _allocate(self, shape, grid):
+        """Create the empty buffer for frames of ``shape`` on ``grid``."""
+        os.makedirs(self.png_dir, exist_ok=True)
+        self._frames = np.lib.format.open_memmap(self.frames_path, mode='w+', dtype=np.uint16,
+                                                 shape=(self.size,) + tuple(shape))
+        self.index['shape'] = list(shape)
+        self.index['grid'] = grid
+
+    def save_index(self):
+        tmp = f'{self.index_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def newest(self):
+        """Catalog name of the newest buffered frame (None when empty)."""
+        names = [slot['name'] for slot in self.index['slots'] if slot]
+        return max(names) if names else None
+
+    def ordered(self):
+        """``(slot number, slot info)`` of the buffered frames, oldest first."""
+        slots = [(i, slot) for i, slot in enumerate(self.index['slots']) if slot]
+        return sorted(slots, key=lambda s: s[1]['name'])
+
+    def push(self, name, counts, meta):
+        """Store a frame in the oldest slot; frames on another grid than the buffer's raise."""
+        grid = frame_grid(meta)
+        if self.index['shape'] is None:
+            self._allocate(counts.shape, grid)
+        elif self.index['shape'] != list(counts.shape) or self.index['grid'] != grid:
+            raise ValueError(f'Frame {name} is not on the grid of the buffered frames, '
+                             'clear the ring first')
+        slot = self.index['next']
+        old = self.index['slots'][slot]
+        if old and os.path.isfile(self.png_path(old)):
+            os.remove(self.png_path(old))
+        self.frames[slot] = counts
+        self.index['slots'][slot] = {'name': name, 'time': meta['time'],
+                                     'scale_factor': meta['scale_factor'],
+                                     'add_offset': meta['add_offset'],
+                                     'fill_value': meta['fill_value']}
+        self.index['next'] = (slot + 1) % self.size
+        return slot
+
+    def png_path(self, slot_info):
+        return os.path.join(self.png_dir, f"{slot_info['time'].replace(':', '')}.png")
+
+    def grid(self):
+        grid = self.index['grid']
+        return FixedGrid(np.array(grid['x']), np.array(grid['y']), grid['proj'])
+
+
+def refresh_loop(channel=13, region='CONUS', frames=60, bbox=None, resolution=None,
+                 entries=None, workers=4, lines=None, root=None):
+    """
+    Bring the loop of ``channel``/``region`` up to date and return its buffer
+
+    Parameters
+    ----------
+    frames : int
+        Loop length
+    bbox, resolution
+        Region and pixel size passed to ``open_goes_subset``
+    entries : list of (name, source)
+        Catalog entries (names sort by time), defaults to ``catalog_entries``;
+        sources can be OPeNDAP URLs or local files
+    workers : int
+        Concurrent downloads
+    lines : list of (lon, lat)
+        Overlay polylines burned into rendered frames
+    root : str
+        Loop directory, defaults to ``LOOP_DIR/<loop_name(...)>``
+
+    Returns
+    ----------
+    ring : FrameRing
+    stats : dict
+        Number of frames downloaded and rendered by this refresh
+    """
+    root = root or os.path.join(LOOP_DIR, loop_name(channel, region, bbox, resolution))
+    os.makedirs(root, exist_ok=True)
+    request = {'bbox': None if bbox is None else [float(b) for b in bbox],
+               'resolution': resolution}
+    ring = FrameRing(root, frames, request)
+    if entries is None:
+        entries = catalog_entries(channel, region, frames)
+    entries = sorted(entries)[-frames:]
+
+    newest = ring.newest()
+    new = [(name, src) for name, src in entries if newest is None or name > newest]
+    fetched = _fetch_frames(new, bbox, resolution, workers)
+    if fetched:
+        grid = frame_grid(fetched[-1][2])
+        if ring.index['grid'] is not None and ring.index['grid'] != grid:
+            # the sector moved: the buffered frames cannot share the loop with the new
+            # ones, so start over and download the older part of the loop again
+            ring.clear()
+            older = [entry for entry in entries if entry not in new]
+            fetched = _fetch_frames(older, bbox, resolution, workers) + fetched
+            new = older + new
+        # within the loop only frames on the newest grid are kept
+        for name, counts, meta in fetched:
+            if frame_grid(meta) == grid:
+                ring.push(name, counts, meta)
+        ring.frames.flush()
+        ring.save_index()
+
+    rendered = render_frames(ring, channel, lines)
+    return ring, {'downloaded': len(new), 'rendered': rendered}
+
+
+def _fetch_frames(entries, bbox, resolution, workers):
+    """``(name, counts, meta)`` of each ``(name, source)`` entry, downloaded concurrently."""
+    if not entries:
+        return []
+    with ProcessPoolExecutor(min(workers, len(entries))) as pool:
+        results = pool.map(fetch_frame, [src for _, src in entries], [bbox] * len(entries),
+                           [resolution] * len(entries))
+        return [(name, counts, meta) for (name, _), (counts, meta) in zip(entries, results)]
+
+
+def render_frames(ring, channel, lines=None, line_color=(0, 0, 0, 255), line_width=2):
+    """Colorize the buffered frames that have no cached PNG yet; returns how many were rendered."""
+    lut = ColorLUT.for_channel(channel, None if channel in COLORTABLES else _decoded_range(ring))
+    packed = {}
+    grid = ring.grid() if lines else None
+    pixel_lines = [grid.pixel(lat, lon) for lon, lat in lines] if lines else []
+    rendered = 0
+    for slot, info in ring.ordered():
+        path = ring.png_path(info)
+        if os.path.isfile(path):
+            continue
+        key = (info['scale_factor'], info['add_offset'], info['fill_value'])
+        if key not in packed:
+            packed[key] = lut.packed(*key)
+        image = packed[key][ring.frames[slot]]
+        if pixel_lines:
+            draw_lines(image, pixel_lines, line_color, line_width)
+        stamp = datetime.fromisoformat(info['time']).strftime('%d %b %Y %H%MZ')
+        write_png(_stamped(image, stamp), path)
+        rendered += 1
+    return rendered
+
+
+def _stamped(image, text):
+    """Image with ``text`` written in its lower left corner."""
+    img = Image.fromarray(image, 'RGBA')
+    ImageDraw.Draw(img).text((10, img.height - 20), text, fill=(255, 255, 255, 255))
+    return np.asarray(img)
+
+
+def _decoded_range(ring):
+    """Data range for channels without a fixed colortable (greys over the buffered values)."""
+    slots = ring.ordered()
+    if not slots:
+        return np.array([0., 1.])
+    slot, info = slots[-1]
+    counts = np.asarray(ring.frames[slot], dtype=np.float64)
+    if info['fill_value'] is not None:
+        counts[counts == info['fill_value']] = np.nan
+    return counts * info['scale_factor'] + info['add_offset']
+
+
+def assemble(ring, path, duration=100, last_pause=1000):
+    """Write the cached frames of ``ring`` as an animated GIF (or anything PIL can animate)."""
+    images = [Image.open(ring.png_path(info)) for _, info in ring.ordered()
+              if os.path.isfile(ring.png_path(info))]
+    if not images:
+        raise ValueError('No rendered frames to animate')
+    durations = [duration] * (len(images) - 1) + [last_pause]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=durations, loop=0,
+                   disposal=1)
+    return path
+
+
+def update_loop(channel=13, region='CONUS', frames=60, bbox=None, resolution=None, **kwargs):
+    """Refresh the loop and write the animation to ``../imgs/satellite``."""
+    ring, stats = refresh_loop(channel, region, frames, bbox, resolution, **kwargs)
+    fname = COLORTABLES.get(channel, (None, None, None, 'sat'))[3]
+    path = assemble(ring, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                       'imgs', 'satellite', f'{fname}_loop.gif'))
+    print(f"{stats['downloaded']} new frame(s) downloaded, {stats['rendered']} rendered, "
+          f'loop saved at {path}')
+    return path
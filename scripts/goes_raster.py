@@ -0,0 +1,334 @@
+"""
+Direct raster rendering of GOES imagery.
+
+Brightness temperatures are mapped to RGBA through uint8 lookup tables built
+once from the MetPy colortables, map overlays are burned in as pixel lines,
+and the result is written as a PNG on the satellite's own fixed grid or as an
+XYZ (web mercator) tile pyramid. No figure is involved, so memory follows the
+image or tile size; matplotlib is only imported for optional annotations.
+"""
+import os
+
+import numpy as np
+from PIL import Image
+
+from goes_subset import scan_angles, grid_mapping, to_radians
+
+
+TILE_SIZE = 256
+TRANSPARENT = (0, 0, 0, 0)
+
+# channel -> (colortable, vmin, vmax, file prefix), as in plotGOES
+COLORTABLES = {
+    9: ('WVCIMSS_r', 160, 280, 'WVsat'),
+    13: ('ir_drgb', 160, 330, 'IRsat'),
+}
+
+
+class ColorLUT:
+    """
+    Colortable as a uint8 RGBA lookup table over a value range
+
+    Values are binned into ``len(table) - 3`` steps between ``vmin`` and
+    ``vmax``; the extra rows hold the under, over and missing colors.
+
+    Parameters
+    ----------
+    table : ndarray
+        ``(n + 3, 4)`` uint8 RGBA rows: under, n bins, over, missing
+    vmin, vmax : float
+        Range covered by the bins
+    """
+
+    def __init__(self, table, vmin, vmax):
+        self.table = table
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        self.bins = len(table) - 3
+
+    @classmethod
+    def from_colortable(cls, name, vmin, vmax, bins=4096, missing=TRANSPARENT):
+        """Sample a MetPy colortable (or matplotlib colormap name) once into a lookup table."""
+        import matplotlib.colors as mcolors
+        import matplotlib.pyplot as plt
+        from metpy.plots.ctables import registry
+
+        if name in registry:
+            norm, cmap = registry.get_with_range(name, vmin, vmax)
+        else:
+            norm, cmap = mcolors.Normalize(vmin, vmax), plt.get_cmap(name)
+        step = (vmax - vmin) / bins
+        centers = vmin + step * (np.arange(bins) + 0.5)
+        table = np.empty((bins + 3, 4), dtype=np.uint8)
+        table[0] = cmap(norm(vmin - step), bytes=True)
+        table[1:-2] = cmap(norm(centers), bytes=True)
+        table[-2] = cmap(norm(vmax + step), bytes=True)
+        table[-1] = missing
+        return cls(table, vmin, vmax)
+
+    @classmethod
+    def for_channel(cls, channel, data=None):
+        """Lookup table plotGOES would use for ``channel`` (greys over the data range otherwise)."""
+        if channel in COLORTABLES:
+            name, vmin, vmax, _ = COLORTABLES[channel]
+        else:
+            name, vmin, vmax = 'Greys', float(np.nanmin(data)), float(np.nanmax(data))
+        return cls.from_colortable(name, vmin, vmax)
+
+    def index(self, values):
+        """Row of the table for every value (NaN maps to the missing color)."""
+        values = np.asarray(values, dtype=np.float32)
+        scale = self.bins / (self.vmax - self.vmin)
+        idx = np.floor((values - self.vmin) * scale)
+        np.clip(idx, -1, self.bins, out=idx)
+        idx += 1
+        idx[np.isnan(values)] = self.bins + 2
+        return idx.astype(np.intp)
+
+    def __call__(self, values):
+        """RGBA uint8 image of ``values``, shape ``values.shape + (4,)``."""
+        return self.table[self.index(values)]
+
+    def packed(self, scale_factor, add_offset, fill_value=None):
+        """
+        65536-row table indexed directly by packed uint16 counts
+
+        ``value = count * scale_factor + add_offset``, so packed images are
+        colorized with a single gather and never decoded to floats.
+        """
+        counts = np.arange(2**16)
+        table = self.table[self.index(counts * scale_factor + add_offset)]
+        if fill_value is not None:
+            table[int(fill_value)] = self.table[-1]
+        return table
+
+
+def composite(base, overlay):
+    """Alpha-blend an RGBA ``overlay`` onto ``base`` in place."""
+    alpha = overlay[..., 3:4].astype(np.float32) / 255
+    blended = base[..., :3] * (1 - alpha) + overlay[..., :3] * alpha
+    base[..., :3] = blended.round().astype(np.uint8)
+    base[..., 3] = np.maximum(base[..., 3], overlay[..., 3])
+    return base
+
+
+def draw_lines(image, lines, color=(0, 0, 0, 255), width=1):
+    """
+    Burn polylines given in pixel coordinates into an RGBA image in place
+
+    Parameters
+    ----------
+    image : ndarray
+        ``(rows, cols, 4)`` uint8 image
+    lines : iterable of (px, py)
+        Column and row coordinates of each polyline; NaN breaks a line
+    color : tuple
+        RGBA color
+    width : int
+        Line width in pixels
+    """
+    rows, cols = image.shape[:2]
+    offsets = np.arange(width) - (width - 1) // 2
+    color = np.asarray(color, dtype=np.uint8)
+    for px, py in lines:
+        px, py = np.asarray(px, dtype=float), np.asarray(py, dtype=float)
+        if px.size < 2:
+            continue
+        dx, dy = np.diff(px), np.diff(py)
+        # only segments that touch the image, sampled at least twice per pixel
+        with np.errstate(invalid='ignore'):
+            ok = ((np.fmax(px[:-1], px[1:]) >= -width) & (np.fmin(px[:-1], px[1:]) < cols + width)
+                  & (np.fmax(py[:-1], py[1:]) >= -width) & (np.fmin(py[:-1], py[1:]) < rows + width)
+                  & np.isfinite(dx) & np.isfinite(dy))
+        if not ok.any():
+            continue
+        idx = np.nonzero(ok)[0]
+        steps = np.ceil(2 * np.hypot(dx[idx], dy[idx])).astype(int) + 1
+        seg = np.repeat(idx, steps)
+        start = np.repeat(np.cumsum(steps) - steps, steps)
+        frac = (np.arange(seg.size) - start) / np.repeat(steps, steps)
+        x = np.rint(px[seg] + dx[seg] * frac).astype(np.intp)
+        y = np.rint(py[seg] + dy[seg] * frac).astype(np.intp)
+        for oy in offsets:
+            for ox in offsets:
+                xx, yy = x + ox, y + oy
+                inside = (xx >= 0) & (xx < cols) & (yy >= 0) & (yy < rows)
+                image[yy[inside], xx[inside]] = color
+    return image
+
+
+# scales plotGOES draws the features at; anything else uses cartopy's 110m
+FEATURE_SCALES = {'states': '50m'}
+
+
+def feature_lines(names=('borders', 'states'), extent=(-180, 180, -90, 90), scale=None):
+    """
+    Lon/lat polylines of cached map features, see ``map_features.FeatureCache``
+
+    ``scale`` applies to every feature; by default each one uses its
+    ``FEATURE_SCALES`` entry, else 110m.
+    """
+    import cartopy.crs as ccrs
+    from map_features import FEATURE_CACHE
+
+    lines = []
+    for name in names:
+        for geom in FEATURE_CACHE.geometries(
+                name, ccrs.PlateCarree(), extent, scale or FEATURE_SCALES.get(name, '110m')):
+            parts = getattr(geom, 'geoms', [geom])
+            for part in parts:
+                rings = [part.exterior, *part.interiors] if part.geom_type == 'Polygon' else [part]
+                for ring in rings:
+                    lon, lat = np.asarray(ring.coords).T[:2]
+                    lines.append((lon, lat))
+    return lines
+
+
+class FixedGrid:
+    """
+    Pixel geometry of a GOES fixed-grid image
+
+    Parameters
+    ----------
+    x, y : ndarray
+        Scan angles (radians) of the image columns and rows, evenly spaced
+    proj : mapping
+        CF geostationary grid-mapping attributes
+    """
+
+    def __init__(self, x, y, proj):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.proj = proj
+        self.dx = (self.x[-1] - self.x[0]) / max(self.x.size - 1, 1)
+        self.dy = (self.y[-1] - self.y[0]) / max(self.y.size - 1, 1)
+
+    @classmethod
+    def from_dataset(cls, ds, variable='Sectorized_CMI'):
+        proj = grid_mapping(ds, variable)
+        height = proj['perspective_point_height']
+        return cls(to_radians(ds['x'], height), to_radians(ds['y'], height), proj)
+
+    def pixel(self, lat, lon):
+        """Fractional column and row of lat/lon points (NaN off the disk)."""
+        x, y = scan_angles(lat, lon, self.proj)
+        return (x - self.x[0]) / self.dx, (y - self.y[0]) / self.dy
+
+
+def render_image(values, lut, grid=None, overlays=(), lines=(), line_color=(0, 0, 0, 255),
+                 line_width=1):
+    """
+    RGBA image of ``values`` on its own grid
+
+    ``overlays`` are RGBA images of the same shape blended on top, then the
+    lon/lat ``lines`` are burned in.
+    """
+    image = lut(values)
+    for overlay in overlays:
+        composite(image, overlay)
+    if lines:
+        draw_lines(image, [grid.pixel(lat, lon) for lon, lat in lines], line_color, line_width)
+    return image
+
+
+def write_png(image, path):
+    Image.fromarray(image, 'RGBA').save(path)
+    return path
+
+
+def annotate(image, path, text=None, points=None, dpi=100, fontsize=None):
+    """
+    Save ``image`` with matplotlib text and labeled markers on top
+
+    ``points`` maps labels to (column, row) pixel positions. The figure is
+    exactly the image size, so nothing is resampled.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib import patheffects
+
+    rows, cols = image.shape[:2]
+    fontsize = fontsize or max(rows / 40, 8)
+    outline = [patheffects.withStroke(linewidth=fontsize / 6, foreground='black')]
+    fig = plt.figure(figsize=(cols / dpi, rows / dpi), dpi=dpi)
+    fig.figimage(image, origin='upper')
+    if text:
+        fig.text(0.01, 0.01, text, color='white', fontsize=fontsize, weight='bold',
+                 path_effects=outline)
+    for label, (px, py) in (points or {}).items():
+        fx, fy = px / cols, 1 - py / rows
+        fig.text(fx, fy, '*', color='red', fontsize=fontsize, ha='center', va='center')
+        fig.text(fx, fy + 0.02, label, color='white', fontsize=fontsize * 0.6, ha='center',
+                 path_effects=outline)
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+    return path
+
+
+def _tile_lonlat(z, tx, ty, size=TILE_SIZE):
+    """Lon/lat of the pixel centers of web mercator tile ``z/tx/ty``."""
+    n = 2**z * size
+    px = (tx * size + np.arange(size) + 0.5) / n
+    py = (ty * size + np.arange(size) + 0.5) / n
+    lon = px * 360 - 180
+    lat = np.rad2deg(np.arctan(np.sinh(np.pi * (1 - 2 * py))))
+    return np.meshgrid(lon, lat)
+
+
+def _tile_range(z, bbox):
+    west, east, south, north = bbox
+    n = 2**z
+
+    def tx(lon):
+        return int(np.clip((lon + 180) / 360 * n, 0, n - 1))
+
+    def ty(lat):
+        lat = np.deg2rad(np.clip(lat, -85.0511, 85.0511))
+        return int(np.clip((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n, 0, n - 1))
+
+    return range(tx(west), tx(east) + 1), range(ty(north), ty(south) + 1)
+
+
+def write_tiles(values, grid, lut, out_dir, bbox, zooms=range(3, 8), lines=(),
+                line_color=(0, 0, 0, 255), line_width=1, size=TILE_SIZE):
+    """
+    Write an XYZ tile pyramid ``out_dir/z/x/y.png`` of a fixed-grid image
+
+    Each tile samples the image at its own pixel centers (nearest neighbour),
+    so only one tile of output is in memory at a time.
+
+    Returns
+    ----------
+    paths : list of str
+        Written tiles
+    """
+    values = np.asarray(values)
+    rows, cols = values.shape
+    # overlay lines in normalized web mercator coordinates, scaled per zoom
+    mercator = []
+    for lon, lat in lines:
+        lat = np.deg2rad(np.clip(lat, -85.0511, 85.0511))
+        mercator.append(((np.asarray(lon) + 180) / 360,
+                         (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2))
+    paths = []
+    for z in zooms:
+        xs, ys = _tile_range(z, bbox)
+        for tx in xs:
+            for ty in ys:
+                lon, lat = _tile_lonlat(z, tx, ty, size)
+                col, row = grid.pixel(lat, lon)
+                col, row = np.rint(col), np.rint(row)
+                inside = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+                if not inside.any():
+                    continue
+                tile = np.zeros((size, size, 4), dtype=np.uint8)
+                tile[inside] = lut(values[row[inside].astype(np.intp), col[inside].astype(np.intp)])
+                if lines:
+                    n = 2**z * size
+                    draw_lines(tile, [(mx * n - tx * size - 0.5, my * n - ty * size - 0.5)
+                                      for mx, my in mercator], line_color, line_width)
+                path = os.path.join(out_dir, str(z), str(tx), f'{ty}.png')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                paths.append(write_png(tile, path))
+    return paths
@@ -0,0 +1,235 @@
+"""
+Regional subsets of GOES fixed-grid imagery.
+
+A lon/lat box is mapped onto the geostationary scan-angle grid with the
+GOES-R PUG navigation equations, turned into x/y index slices plus a
+decimation stride for the requested resolution, and only that hyperslab is
+read. The file is opened lazily, so with OPeNDAP the server is asked for the
+strided slab alone, and local netCDF files (e.g. the fixture written by
+``write_fixture``) go through exactly the same path.
+"""
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import xarray as xr
+
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                            'goes_fixture.nc')
+
+
+def grid_mapping(ds, variable):
+    """Geostationary grid-mapping attributes of ``variable``."""
+    return ds[ds[variable].attrs['grid_mapping']].attrs
+
+
+def to_radians(coord, height):
+    """Scan angles in radians from x/y coordinates in radians, meters or kilometers."""
+    values = np.asarray(coord.values, dtype=float)
+    units = coord.attrs.get('units', 'rad')
+    if units.startswith('rad'):
+        return values
+    if units in ('km', 'kilometer', 'kilometers'):
+        values = values * 1000
+    return values / height
+
+
+def scan_angles(lat, lon, proj):
+    """
+    Geostationary x/y scan angles (radians) of lat/lon points
+
+    Parameters
+    ----------
+    lat, lon : array_like
+        Points in degrees
+    proj : mapping
+        CF geostationary grid-mapping attributes
+
+    Returns
+    ----------
+    x, y : ndarray
+        Scan angles, NaN where the point is not visible from the satellite
+    """
+    a = proj['semi_major_axis']
+    b = proj['semi_minor_axis']
+    H = proj['perspective_point_height'] + a
+    lon0 = np.deg2rad(proj['longitude_of_projection_origin'])
+    lat, lon = np.deg2rad(np.asarray(lat, dtype=float)), np.deg2rad(np.asarray(lon, dtype=float))
+
+    # geocentric latitude and distance to the ellipsoid surface
+    phi = np.arctan((b / a)**2 * np.tan(lat))
+    e2 = (a**2 - b**2) / a**2
+    rc = b / np.sqrt(1 - e2 * np.cos(phi)**2)
+    sx = H - rc * np.cos(phi) * np.cos(lon - lon0)
+    sy = -rc * np.cos(phi) * np.sin(lon - lon0)
+    sz = rc * np.sin(phi)
+
+    if proj.get('sweep_angle_axis', 'x') == 'x':
+        x = np.arcsin(-sy / np.sqrt(sx**2 + sy**2 + sz**2))
+        y = np.arctan(sz / sx)
+    else:
+        x = np.arctan(-sy / sx)
+        y = np.arcsin(sz / np.sqrt(sx**2 + sy**2 + sz**2))
+    hidden = H * (H - sx) < sy**2 + (a / b)**2 * sz**2
+    return np.where(hidden, np.nan, x), np.where(hidden, np.nan, y)
+
+
+def _index_slice(coord, lo, hi, stride, pad=1):
+    inside = np.nonzero((coord >= lo) & (coord <= hi))[0]
+    if inside.size == 0:
+        raise ValueError('Bounding box does not overlap the image')
+    return slice(max(inside[0] - pad, 0), min(inside[-1] + pad + 1, coord.size), stride)
+
+
+def subset_slices(ds, bbox, resolution=None, variable='Sectorized_CMI', n=64):
+    """
+    x/y index slices covering a lon/lat box at (at least) a target resolution
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Lazily opened GOES file
+    bbox : (west, east, south, north)
+        Region in degrees, the whole image when None
+    resolution : float
+        Wanted pixel size in km at the sub-satellite point; the native grid is
+        decimated by the largest whole stride not coarser than this. Full
+        resolution when None
+    variable : str
+        Image variable, whose grid mapping gives the projection
+
+    Returns
+    ----------
+    slices : dict
+        ``{'x': slice, 'y': slice}`` for ``ds.isel``
+    """
+    proj = grid_mapping(ds, variable)
+    height = proj['perspective_point_height']
+    x = to_radians(ds['x'], height)
+    y = to_radians(ds['y'], height)
+    stride = 1
+    if resolution:
+        native = np.median(np.abs(np.diff(x))) * height / 1000
+        stride = max(1, int(resolution // native))
+    if bbox is None:
+        return {'x': slice(None, None, stride), 'y': slice(None, None, stride)}
+
+    west, east, south, north = bbox
+    # the box edges are curved on the fixed grid, so sample them densely
+    t = np.linspace(0, 1, n)
+    lon = np.concatenate([west + (east - west) * t, np.full(n, east), east - (east - west) * t,
+                          np.full(n, west)])
+    lat = np.concatenate([np.full(n, south), south + (north - south) * t, np.full(n, north),
+                          north - (north - south) * t])
+    bx, by = scan_angles(lat, lon, proj)
+    if np.isnan(bx).all():
+        raise ValueError('Bounding box is not visible from the satellite')
+    return {'x': _index_slice(x, np.nanmin(bx), np.nanmax(bx), stride),
+            'y': _index_slice(y, np.nanmin(by), np.nanmax(by), stride)}
+
+
+def catalog_url(channel=13, region='CONUS', date=None):
+    """THREDDS catalog of one day of GOES-East Cloud and Moisture Imagery."""
+    return ('https://thredds.ucar.edu/thredds/catalog/satellite/goes/east/products/'
+            'CloudAndMoistureImagery/{}/Channel{:02d}/{:%Y%m%d}/'
+            'catalog.xml'.format(region, channel, date or datetime.utcnow()))
+
+
+def open_goes_subset(source, bbox=None, resolution=None, variable='Sectorized_CMI',
+                     chunks=None, mask_and_scale=True):
+    """
+    Open a GOES file (OPeNDAP URL or local path) restricted to a region
+
+    Parameters
+    ----------
+    source : str
+        OPeNDAP URL or netCDF path
+    bbox : (west, east, south, north)
+        Region in degrees, the whole sector when None
+    resolution : float
+        Target pixel size in km, see ``subset_slices``
+    variable : str
+        Image variable
+    chunks : dict
+        Dask chunks for the subset (e.g. ``{'y': 512, 'x': 512}``); each chunk
+        then reads only its own part of the strided slab
+    mask_and_scale : bool
+        False keeps the packed integer counts (and their ``scale_factor`` /
+        ``add_offset`` attributes) instead of decoding to floats
+
+    Returns
+    ----------
+    ds : xarray.Dataset
+        Lazy subset with the file's attributes and grid mapping
+    """
+    ds = xr.open_dataset(source, mask_and_scale=mask_and_scale)
+    if bbox is not None or resolution:
+        ds = ds.isel(subset_slices(ds, bbox, resolution, variable))
+    if chunks:
+        ds = ds.chunk(chunks)
+    return ds
+
+
+def write_fixture(path=FIXTURE_PATH, nx=2500, ny=1500, dx=56e-6):
+    """
+    Write a synthetic CONUS-sector GOES-East file for offline checks
+
+    Same layout as the THREDDS Sectorized_CMI files: a ``fixedgrid_projection``
+    grid mapping, x/y scan angles in radians and a packed uint16 brightness
+    temperature variable.
+    """
+    x = -0.101360 + dx * np.arange(nx)
+    y = 0.128212 - dx * np.arange(ny)
+    xx, yy = np.meshgrid(x, y)
+    tb = 250 + 40 * np.sin(xx * 60) * np.cos(yy * 45) - 30 * (yy - y.min()) / np.ptp(y)
+    ds = xr.Dataset(
+        {'Sectorized_CMI': (('y', 'x'), tb.astype(np.float32),
+                            {'grid_mapping': 'fixedgrid_projection', 'units': 'kelvin'}),
+         'fixedgrid_projection': ((), 0, {
+             'grid_mapping_name': 'geostationary', 'perspective_point_height': 35786023.,
+             'semi_major_axis': 6378137., 'semi_minor_axis': 6356752.31414,
+             'longitude_of_projection_origin': -75., 'latitude_of_projection_origin': 0.,
+             'sweep_angle_axis': 'x'})},
+        coords={'x': ('x', x, {'units': 'rad'}), 'y': ('y', y, {'units': 'rad'})},
+        attrs={'start_date_time': '2021113120117', 'satellite_id': 'G16'})
+    ds.to_netcdf(path, encoding={'Sectorized_CMI': {
+        'dtype': 'uint16', 'scale_factor': 0.01, 'add_offset': 150., '_FillValue': 65535}})
+    return path
+
+
+def check_subset(path=FIXTURE_PATH, bbox=(-90, -80, 35, 42), resolution=6.):
+    """Compare the subset read with cropping the full image, and report bytes and peak memory."""
+    if not os.path.isfile(path):
+        write_fixture(path)
+
+    tracemalloc.start()
+    tic = time.perf_counter()
+    full = xr.open_dataset(path)['Sectorized_CMI'].load()
+    full_seconds = time.perf_counter() - tic
+    full_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    tic = time.perf_counter()
+    ds = open_goes_subset(path, bbox, resolution)
+    sub = ds['Sectorized_CMI'].load()
+    sub_seconds = time.perf_counter() - tic
+    sub_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    with xr.open_dataset(path) as raw:
+        slices = subset_slices(raw, bbox, resolution)
+    assert np.array_equal(full.isel(slices).values, sub.values, equal_nan=True)
+    itemsize = np.dtype(np.uint16).itemsize
+    print(f'full image {full.shape}: {full.size * itemsize / 2**20:.1f} MB read, '
+          f'{full_peak / 2**20:.1f} MB peak, {full_seconds * 1000:.0f} ms')
+    print(f'subset {sub.shape} (stride {slices["x"].step}): '
+          f'{sub.size * itemsize / 2**20:.2f} MB read, {sub_peak / 2**20:.1f} MB peak, '
+          f'{sub_seconds * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    check_subset()
@@ -1,111 +1,206 @@
+import os
+import warnings
+from multiprocessing import Pool
+
 import metpy.calc as mpcalc
 from metpy.units import units
 import numpy as np
 import xarray as xr
-import os
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-import warnings
-
-
-warnings.simplefilter('ignore')
-
-# open netCDF4 file with xarray and parse data to CF standard using Metpy
-ds = xr.open_dataset('data/isentropic_example.nc').metpy.parse_cf()
-data_proj = ds.t.metpy.cartopy_crs
-time = ds.time.values
-
-# extract atmospehric variables
-temperature = ds.t
-lat = temperature.metpy.y
-lon = temperature.metpy.x
-mixing = ds.q
-z = ds.z
-u = ds.u
-v = ds.v
-
-# Can have different vertical levels for wind and thermodynamic variables
-# Find and select the common levels
-press = temperature.metpy.vertical
-common_levels = np.intersect1d(press, u.metpy.vertical)
-temperature = temperature.metpy.sel(vertical=common_levels)
-u = u.metpy.sel(vertical=common_levels)
-v = v.metpy.sel(vertical=common_levels)
 
-# Get common pressure levels as a data array
-press = press.metpy.sel(vertical=common_levels)
-
-# Needed to make numpy broadcasting work between 1D pressure and other 3D arrays
-# Use .metpy.unit_array to get numpy array with units rather than xarray DataArray
-pressure_for_calc = press.metpy.unit_array[:, None, None]  
-
-mixing['units'] = 'dimensionless'
-
-# Interpolate all the data
-isen_level = np.array([290, 295, 300, 305, 310]) * units.kelvin
-
-# use Metoy to interpolate data 
-ret = mpcalc.isentropic_interpolation(isen_level, press, temperature, mixing, u, v)
-isen_press, isen_mixing, isen_u, isen_v = ret
-
-
-# Squeeze the returned arrays
-isen_press = isen_press.squeeze()
-isen_mixing = isen_mixing.squeeze()
-isen_u = isen_u.squeeze()
-isen_v = isen_v.squeeze()
-
-# search through the image directory to see if the plot already exists
-for isen_level_idx, isen_lvl in enumerate(isen_level):
-    fname = f'imgs/isentropic/{isen_lvl.m}K_{str(time)[0:13]}.png'
-    print(fname)
-    if os.path.isfile(fname): 
-        print('Already have it')
-        continue
-
-    # smoothe the data to get a better snapshot of synoptic conditions
-    isen_press = mpcalc.smooth_gaussian(isen_press.squeeze(), 9)
-    isen_u = mpcalc.smooth_gaussian(isen_u.squeeze(), 9)
-    isen_v = mpcalc.smooth_gaussian(isen_v.squeeze(), 9)
+from derived import derived
+from map_features import cached_feature
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(SCRIPT_DIR, '..', 'data', 'isentropic_example.nc')
+IMG_DIR = os.path.join(SCRIPT_DIR, '..', 'imgs', 'isentropic')
+
+ISEN_LEVELS = np.array([290, 295, 300, 305, 310]) * units.kelvin
+
+# map extent shared by every level, so the clipped and projected map features
+# are looked up once
+EXTENT = (-120, -70, 25, 55)
+
+
+def _advection(scalar, u, v, dx, dy):
+    """Horizontal advection of ``scalar`` for both the MetPy 1.x and 0.12 signatures."""
+    try:
+        return mpcalc.advection(scalar, u, v, dx=dx, dy=dy)
+    except TypeError:
+        return mpcalc.advection(scalar, [u, v], [dx, dy], dim_order='yx')
+
+
+def isentropic_analysis(ds, isen_levels=ISEN_LEVELS, smooth=9):
+    """
+    Isentropic pressure, mixing ratio, wind and lift on every requested theta level
+
+    Interpolation, Gaussian smoothing and the grid deltas are done once for
+    all levels; the lift (isentropic pressure advection) is then computed per
+    level from the smoothed fields.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Single-time pressure-level data with ``t``, ``q``, ``u`` and ``v``,
+        parsed with ``metpy.parse_cf``
+    isen_levels : pint.Quantity
+        Potential temperature levels
+    smooth : int
+        Gaussian smoothing passes (``mpcalc.smooth_gaussian`` ``n``)
+
+    Returns
+    ----------
+    analysis : xarray.Dataset
+        ``pressure`` (hPa), ``mixing_ratio``, ``u``/``v`` (knots) and ``lift``
+        (microbar/s) on (isentropic_level, latitude, longitude)
+    """
+    # extract atmospehric variables
+    temperature = ds.t
+    lat = temperature.metpy.y
+    lon = temperature.metpy.x
+    mixing = derived(ds, 'mixing_ratio')
+    u = ds.u
+    v = ds.v
+
+    # Can have different vertical levels for wind and thermodynamic variables
+    # Find and select the common levels
+    press = temperature.metpy.vertical
+    common_levels = np.intersect1d(press, u.metpy.vertical)
+    temperature = temperature.metpy.sel(vertical=common_levels)
+    u = u.metpy.sel(vertical=common_levels)
+    v = v.metpy.sel(vertical=common_levels)
+    mixing = mixing.metpy.sel(vertical=common_levels)
+
+    # Get common pressure levels as a data array
+    press = press.metpy.sel(vertical=common_levels)
+
+    # use Metpy to interpolate data to every level at once
+    ret = mpcalc.isentropic_interpolation(isen_levels, press, temperature, mixing, u, v)
+    isen_press, isen_mixing, isen_u, isen_v = (np.squeeze(field) for field in ret)
+    if isen_press.ndim == 2:  # a single level was requested
+        isen_press, isen_mixing, isen_u, isen_v = (field[None] for field in
+                                                   (isen_press, isen_mixing, isen_u, isen_v))
+
+    # smoothe the data once to get a better snapshot of synoptic conditions
+    isen_press = mpcalc.smooth_gaussian(isen_press, smooth)
+    isen_u = mpcalc.smooth_gaussian(isen_u, smooth)
+    isen_v = mpcalc.smooth_gaussian(isen_v, smooth)
 
     # use .values because we don't care about using DataArray
     dx, dy = mpcalc.lat_lon_grid_deltas(lon.values, lat.values)
-    lift = -mpcalc.advection(isen_press[isen_level_idx], [isen_u[isen_level_idx], 
-                                                          isen_v[isen_level_idx]], [dx, dy], dim_order='yx')
+    lift = units.Quantity(np.stack([
+        -_advection(isen_press[i], isen_u[i], isen_v[i], dx, dy).m_as('microbar/s')
+        for i in range(len(isen_levels))]), 'microbar/s')
+
+    dims = ('isentropic_level', lat.dims[0], lon.dims[0])
+    fields = {'pressure': (isen_press, 'hPa'), 'mixing_ratio': (isen_mixing, 'dimensionless'),
+              'u': (isen_u, 'knots'), 'v': (isen_v, 'knots'), 'lift': (lift, 'microbar/s')}
+    return xr.Dataset(
+        {name: (dims, np.asarray(field.m_as(unit)), {'units': unit})
+         for name, (field, unit) in fields.items()},
+        coords={'isentropic_level': ('isentropic_level', isen_levels.m_as('K'), {'units': 'K'}),
+                lat.dims[0]: lat.values, lon.dims[0]: lon.values},
+        attrs={'time': str(ds.time.values)})
+
+
+def up_to_date(target, *sources):
+    """True if ``target`` exists and is newer than every one of ``sources``."""
+    if not os.path.isfile(target):
+        return False
+    newest = max(os.path.getmtime(s) for s in sources if os.path.exists(s))
+    return os.path.getmtime(target) >= newest
+
+
+def render_level(level, fname, data_proj):
+    """
+    Plot isentropic ascent, pressure and wind for one level of ``isentropic_analysis``
+
+    ``level`` is the analysis selected at one ``isentropic_level``.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+
+    warnings.simplefilter('ignore')
+    lat_name, lon_name = level['pressure'].dims
+    lat, lon = level[lat_name], level[lon_name]
+    map_crs = ccrs.LambertConformal(central_longitude=-100)
 
     # plot isentropic ascent and pressure levels
     fig = plt.figure(figsize=(14, 8), dpi=200)
-    ax = fig.add_subplot(1, 1, 1, projection=ccrs.LambertConformal(central_longitude=-100))
+    ax = fig.add_subplot(1, 1, 1, projection=map_crs)
     fig.patch.set_facecolor('white')
-    ax.add_feature(cfeature.COASTLINE)
+    ax.add_feature(cached_feature('coastline', map_crs, EXTENT))
 
     levels = np.arange(300, 1000, 25)
-    cntr = ax.contour(lon, lat, isen_press[isen_level_idx], transform=data_proj, colors='black', levels=levels)
+    cntr = ax.contour(lon, lat, level['pressure'], transform=data_proj, colors='black', levels=levels)
     cntr.clabel(fmt='%d')
 
     # plot isentropic wind in knots
     lon_slice = slice(None, None, 5)
     lat_slice = slice(None, None, 5)
-    ax.barbs(lon[lon_slice], lat[lat_slice],
-             isen_u[isen_level_idx, lon_slice, lat_slice].to('knots').magnitude,
-             isen_v[isen_level_idx, lon_slice, lat_slice].to('knots').magnitude,
+    ax.barbs(lon[lon_slice].values, lat[lat_slice].values,
+             level['u'].values[lat_slice, lon_slice], level['v'].values[lat_slice, lon_slice],
              transform=data_proj, zorder=2, length=5, regrid_shape=50)
 
     # plot isentropic vertical motion in microbar/s
     levels = np.arange(-6, 7)
-    cs = ax.contourf(lon, lat, lift.to('microbar/s'), levels=levels, cmap='RdBu',
+    cs = ax.contourf(lon, lat, level['lift'], levels=levels, cmap='RdBu',
                      transform=data_proj, extend='both')
     plt.colorbar(cs)
 
     # add US/State boundaries using Cartopy
-    ax.add_feature(cfeature.LAND)
-    ax.add_feature(cfeature.OCEAN)
-    ax.add_feature(cfeature.COASTLINE)
-    ax.add_feature(cfeature.BORDERS, linewidth=2)
-    ax.add_feature(cfeature.STATES, linestyle=':')
-
-    ax.set_extent((-120, -70, 25, 55), crs=data_proj)
-#         plt.show()
+    ax.add_feature(cached_feature('land', map_crs, EXTENT))
+    ax.add_feature(cached_feature('ocean', map_crs, EXTENT))
+    ax.add_feature(cached_feature('coastline', map_crs, EXTENT))
+    ax.add_feature(cached_feature('borders', map_crs, EXTENT), linewidth=2)
+    ax.add_feature(cached_feature('states', map_crs, EXTENT), linestyle=':')
+
+    ax.set_extent(EXTENT, crs=data_proj)
     plt.savefig(fname, bbox_inches='tight')
     plt.close(fig)
+    return fname
+
+
+def _render(args):
+    return render_level(*args)
+
+
+def render_levels(analysis, data_proj, out_dir=IMG_DIR, sources=(DATA_PATH,), processes=None,
+                  force=False):
+    """
+    Render every level of ``analysis`` in a process pool
+
+    A level is skipped when its image is newer than all of ``sources`` (and
+    this module), unless ``force``.
+
+    Returns
+    ----------
+    fnames : list of str
+        Images of all levels, rendered or already up to date
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    sources = tuple(sources) + (os.path.abspath(__file__),)
+    tasks, fnames = [], []
+    for lvl in analysis['isentropic_level'].values:
+        fname = os.path.join(out_dir, f'{lvl:g}K_{analysis.attrs["time"][0:13]}.png')
+        fnames.append(fname)
+        if not force and up_to_date(fname, *sources):
+            print(f'{fname} is up to date')
+            continue
+        tasks.append((analysis.sel(isentropic_level=lvl), fname, data_proj))
+    if tasks:
+        with Pool(min(processes or os.cpu_count(), len(tasks))) as pool:
+            for fname in pool.imap_unordered(_render, tasks):
+                print(fname)
+    return fnames
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+
+    # open netCDF4 file with xarray and parse data to CF standard using Metpy
+    ds = xr.open_dataset(DATA_PATH).metpy.parse_cf()
+    analysis = isentropic_analysis(ds)
+    render_levels(analysis, ds.t.metpy.cartopy_crs)
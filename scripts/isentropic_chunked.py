@@ -0,0 +1,260 @@
+"""
+Out-of-core isentropic interpolation of ERA5 pressure-level time series.
+
+``isentropic.py`` hands a whole single-time grid to
+``mpcalc.isentropic_interpolation``. Here the dataset is opened lazily with
+dask, chunked over time and horizontal tiles while every vertical column stays
+whole, and each chunk goes through a numpy kernel that does the same
+computation as MetPy (temperature linear in ln p between the levels bracketing
+the theta surface, Newton iterations for the pressure, the other fields linear
+in theta) for all columns of the chunk at once. The result is written chunk by chunk to a netCDF store, so peak
+memory depends on the chunk size and the number of workers, not on the length
+of the record.
+
+    python isentropic_chunked.py era5_pl_2015-05.nc data/isentropic_2015-05.nc
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import dask
+import dask.array as da
+import numpy as np
+import xarray as xr
+import metpy.calc as mpcalc
+from metpy.units import units
+
+from thermo import KAPPA
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_PATH = os.path.join(SCRIPT_DIR, '..', 'data', 'isentropic_example.nc')
+STORE_PATH = os.path.join(SCRIPT_DIR, '..', 'data', 'isentropic_levels.nc')
+
+THETA_LEVELS = np.arange(280, 352, 2.)  # K
+P0 = 1000.  # hPa
+POK = P0**KAPPA
+
+
+def _isentropic_columns(theta_levels, p, t, *fields, max_iters=50, eps=1e-6,
+                        temperature_out=False):
+    """
+    Interpolate columns to isentropic levels
+
+    Parameters
+    ----------
+    theta_levels : ndarray
+        Isentropic levels (K), ascending
+    p : ndarray
+        Pressure levels (hPa), from the surface up
+    t : ndarray
+        Temperature (K), shape (len(p), ncolumns)
+    fields : ndarray
+        Other variables on the same grid as ``t``
+
+    Returns
+    ----------
+    out : ndarray
+        Shape (1 + temperature_out + len(fields), len(theta_levels), ncolumns):
+        pressure (hPa), optionally temperature (K), then each field
+    """
+    nlev, ncol = t.shape
+    cols = np.arange(ncol)
+    log_p = np.log(p)
+    theta = t * (P0 / p[:, None])**KAPPA
+    out = np.full((1 + temperature_out + len(fields), len(theta_levels), ncol), np.nan)
+
+    # the other fields are interpolated on theta sorted per column, as MetPy's
+    # interpolate_1d does, which only matters where theta is not monotonic
+    sorter = np.argsort(theta, axis=0)
+    theta_sorted = np.take_along_axis(theta, sorter, axis=0)
+    fields = [np.take_along_axis(field, sorter, axis=0) for field in fields]
+
+    for k, level in enumerate(theta_levels):
+        # first pair of levels from the surface up that brackets the theta surface
+        warmer = theta >= level
+        switch = warmer[1:] != warmer[:-1]
+        below = switch.argmax(axis=0)
+        above = below + 1
+        good = switch[below, cols]
+
+        # temperature linear in ln p between the bracketing levels
+        t_below, t_above = t[below, cols], t[above, cols]
+        a = (t_above - t_below) / (log_p[above] - log_p[below])
+        b = t_above - a * log_p[above]
+        good &= ~np.isnan(a)
+        a, b = a[good], b[good]
+
+        # Newton iterations on theta(ln p) - level, as MetPy's _isen_iter
+        x = 0.5 * (log_p[above[good]] + log_p[below[good]])
+        for _ in range(max_iters):
+            exner = POK * np.exp(-KAPPA * x)
+            temp = a * x + b
+            step = (level - temp * exner) / (exner * (KAPPA * temp - a))
+            x -= step
+            if not np.any(np.abs(step) > eps):
+                break
+        pres = np.full(ncol, np.nan)
+        pres[good] = np.exp(x)
+        pres[pres > p.max() * (1 + 1e-10)] = np.nan
+        out[0, k] = pres
+        if temperature_out:
+            out[1, k] = level * (pres / P0)**KAPPA
+
+        # fields linear in theta between the sorted values bracketing the level
+        upper = (theta_sorted < level).sum(axis=0)
+        inside = (upper > 0) & (upper < nlev)
+        upper = np.clip(upper, 1, nlev - 1)
+        th_below, th_above = theta_sorted[upper - 1, cols], theta_sorted[upper, cols]
+        w = np.where(inside, (level - th_below) / (th_above - th_below), np.nan)
+        for i, field in enumerate(fields, 1 + temperature_out):
+            f_below = field[upper - 1, cols]
+            out[i, k] = f_below + w * (field[upper, cols] - f_below)
+    return out
+
+
+def _block(t, *fields, theta_levels, p, temperature_out, out_dtype):
+    """Kernel applied to one (time, level, y, x) chunk."""
+    nt, nlev, ny, nx = t.shape
+    columns = [np.moveaxis(a, 1, 0).reshape(nlev, -1).astype(np.float64) for a in (t,) + fields]
+    out = _isentropic_columns(theta_levels, p, *columns, temperature_out=temperature_out)
+    out = out.reshape(out.shape[:2] + (nt, ny, nx))
+    return np.moveaxis(out, 2, 1).astype(out_dtype)
+
+
+def isentropic_dataset(ds, theta_levels=THETA_LEVELS, fields=('q', 'u', 'v'), temperature='t',
+                       level_dim='level', tile=128, time_chunk=1, temperature_out=False,
+                       dtype=np.float32):
+    """
+    Lazy isentropic interpolation of a (time, level, y, x) pressure-level dataset
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Pressure-level data, opened lazily (``xr.open_dataset``) or dask-backed
+    theta_levels : array_like
+        Isentropic levels in K
+    fields : sequence of str
+        Variables interpolated alongside pressure
+    temperature : str
+        Temperature variable (K)
+    level_dim : str
+        Vertical dimension, a pressure coordinate
+    tile : int
+        Horizontal chunk size; columns are never split
+    time_chunk : int
+        Times per chunk
+    temperature_out : bool
+        Also return temperature on the isentropic levels
+    dtype : numpy dtype
+        Output precision
+
+    Returns
+    ----------
+    isen : xarray.Dataset
+        Dask-backed ``pressure`` (hPa), optional ``temperature`` and ``fields``
+        on (time, isentropic_level, y, x)
+    """
+    theta_levels = np.sort(np.asarray(theta_levels, dtype=np.float64))
+    level = ds[level_dim]
+    p = units.Quantity(level.values.astype(np.float64), level.attrs.get('units', 'hPa'))
+    order = np.argsort(p.m_as('hPa'))[::-1]
+    p = p.m_as('hPa')[order]
+
+    ds = ds[[temperature] + list(fields)].isel({level_dim: order})
+    if 'time' not in ds.dims:
+        ds = ds.expand_dims('time')
+    ydim, xdim = [d for d in ds[temperature].dims if d not in ('time', level_dim)]
+    ds = ds.transpose('time', level_dim, ydim, xdim)
+    ds = ds.chunk({'time': time_chunk, level_dim: -1, ydim: tile, xdim: tile})
+
+    arrays = [ds[name].data for name in (temperature,) + tuple(fields)]
+    names = ['pressure'] + (['temperature'] if temperature_out else []) + list(fields)
+    t_chunks, _, y_chunks, x_chunks = arrays[0].chunks
+    out = da.map_blocks(_block, *arrays, theta_levels=theta_levels, p=p,
+                        temperature_out=temperature_out, out_dtype=dtype, dtype=dtype, new_axis=0,
+                        chunks=((len(names),), t_chunks, (len(theta_levels),), y_chunks, x_chunks))
+
+    attrs = [{'units': 'hPa'}] + ([{'units': 'K'}] if temperature_out else [])
+    attrs += [dict(ds[name].attrs) for name in fields]
+    dims = ('time', 'isentropic_level', ydim, xdim)
+    return xr.Dataset(
+        {name: (dims, out[i], attr) for i, (name, attr) in enumerate(zip(names, attrs))},
+        coords={'time': ds['time'], 'isentropic_level': ('isentropic_level', theta_levels,
+                                                         {'units': 'K'}),
+                ydim: ds[ydim], xdim: ds[xdim]})
+
+
+def interpolate_to_store(source, store=STORE_PATH, theta_levels=THETA_LEVELS,
+                         fields=('q', 'u', 'v'), tile=128, time_chunk=1, workers=None, **kwargs):
+    """
+    Interpolate ``source`` (path or glob of netCDF files) to theta levels and stream it to ``store``
+
+    Chunks are read, interpolated and written ``workers`` at a time (all
+    cores by default), so memory stays at a few chunks whatever the length of
+    the record. Extra keyword arguments go to ``isentropic_dataset``.
+
+    Returns
+    ----------
+    store : str
+        Path of the netCDF store
+    """
+    # lazily indexed, ``isentropic_dataset`` chunks it so each task reads only its own slab
+    if any(c in source for c in '*?['):
+        ds = xr.open_mfdataset(source, chunks={'time': time_chunk}, combine='by_coords')
+    else:
+        ds = xr.open_dataset(source)
+    isen = isentropic_dataset(ds, theta_levels, fields, tile=tile, time_chunk=time_chunk,
+                              **kwargs)
+    encoding = {name: {'zlib': True, 'complevel': 1,
+                       'chunksizes': (1, 1) + tuple(min(tile, n) for n in var.shape[2:])}
+                for name, var in isen.data_vars.items()}
+
+    os.makedirs(os.path.dirname(os.path.abspath(store)), exist_ok=True)
+    tmp = f'{store}.tmp'
+    write = isen.to_netcdf(tmp, encoding=encoding, compute=False)
+    with dask.config.set(scheduler='threads', num_workers=workers or os.cpu_count()):
+        write.compute()
+    ds.close()
+    os.replace(tmp, store)
+    return store
+
+
+def check_against_metpy(source=EXAMPLE_PATH, theta_levels=(290, 295, 300, 305, 310),
+                        store=None, tile=64):
+    """Compare the chunked interpolation with ``mpcalc.isentropic_interpolation`` time by time."""
+    store = store or os.path.join(SCRIPT_DIR, '..', 'data', 'isentropic_check.nc')
+    tracemalloc.start()
+    tic = time.perf_counter()
+    interpolate_to_store(source, store, theta_levels, tile=tile, dtype=np.float64)
+    seconds = time.perf_counter() - tic
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    levels = np.asarray(theta_levels, dtype=np.float64) * units.kelvin
+    with xr.open_dataset(source) as ds, xr.open_dataset(store) as isen:
+        ds = ds.metpy.parse_cf()
+        if 'time' not in ds.dims:
+            ds = ds.expand_dims('time')
+        errors = {name: 0. for name in ('pressure', 'q', 'u', 'v')}
+        for i in range(ds.sizes['time']):
+            step = ds.isel(time=i)
+            press = step.t.metpy.vertical
+            ret = mpcalc.isentropic_interpolation(levels, press, step.t, step.q, step.u, step.v)
+            for name, expected in zip(errors, ret):
+                expected = np.asarray(getattr(expected, 'magnitude', expected)).squeeze()
+                actual = isen[name].isel(time=i).values
+                assert np.array_equal(np.isnan(expected), np.isnan(actual)), name
+                errors[name] = max(errors[name], float(np.nanmax(np.abs(actual - expected))))
+    os.remove(store)
+    print(f'{seconds:.2f} s, {peak / 2**20:.1f} MB peak (traced)')
+    print('max abs difference: ' + ', '.join(f'{k} {v:.2e}' for k, v in errors.items()))
+    return errors
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print(interpolate_to_store(*sys.argv[1:3]))
+    else:
+        check_against_metpy()
@@ -0,0 +1,168 @@
+"""
+Cache of Natural Earth map features, clipped and projected per map.
+
+Adding ``cfeature.STATES`` or ``BORDERS`` to a map makes cartopy read the
+shapefile and reproject every geometry into the map projection on each new
+figure. Here the geometries are clipped to the map extent and projected once
+per (feature, scale, projection, extent), kept in memory and pickled as WKB to
+disk, and handed back as a ``ShapelyFeature`` already in the map projection,
+so cartopy draws them without projecting again.
+
+    ax.add_feature(cached_feature('states', ax.projection, (-110, -70, 25, 50)),
+                   edgecolor='black')
+
+The scale defaults to 110m like the ``cfeature`` constants; pass
+``scale='50m'`` where a map used ``.with_scale('50m')``.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+from shapely import wkb
+from shapely.geometry import box
+
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                         'feature_cache')
+
+# name -> (Natural Earth category, shapefile name, default style)
+FEATURES = {
+    'borders': ('cultural', 'admin_0_boundary_lines_land',
+                {'edgecolor': 'black', 'facecolor': 'none'}),
+    'states': ('cultural', 'admin_1_states_provinces_lakes',
+               {'edgecolor': 'black', 'facecolor': 'none'}),
+    'coastline': ('physical', 'coastline', {'edgecolor': 'black', 'facecolor': 'none'}),
+    'land': ('physical', 'land', {'edgecolor': 'face', 'facecolor': cfeature.COLORS['land'],
+                                  'zorder': -1}),
+    'ocean': ('physical', 'ocean', {'edgecolor': 'face', 'facecolor': cfeature.COLORS['water'],
+                                    'zorder': -1}),
+}
+
+
+def _boundary(x0, x1, y0, y1, n=64):
+    """Densified outline of a rectangle, so curved edges survive reprojection."""
+    t = np.linspace(0, 1, n)
+    x = np.concatenate([x0 + (x1 - x0) * t, np.full(n, x1), x1 - (x1 - x0) * t, np.full(n, x0)])
+    y = np.concatenate([np.full(n, y0), y0 + (y1 - y0) * t, np.full(n, y1), y1 - (y1 - y0) * t])
+    return x, y
+
+
+def map_bounds(crs, extent):
+    """
+    Projected rectangle shown by ``ax.set_extent(extent)`` and the lon/lat box covering it
+
+    Parameters
+    ----------
+    crs : cartopy.crs.Projection
+        Map projection
+    extent : (west, east, south, north)
+        Extent in degrees, as passed to ``set_extent``
+
+    Returns
+    ----------
+    projected, geographic : (x0, x1, y0, y1)
+        The map rectangle in projection coordinates and the lon/lat bounds of
+        everything inside it
+    """
+    geodetic = ccrs.PlateCarree()
+    west, east, south, north = extent
+    lon, lat = _boundary(west, east, min(south, north), max(south, north))
+    xy = crs.transform_points(geodetic, lon, lat)
+    ok = np.isfinite(xy[:, 0]) & np.isfinite(xy[:, 1])
+    x0, x1 = xy[ok, 0].min(), xy[ok, 0].max()
+    y0, y1 = xy[ok, 1].min(), xy[ok, 1].max()
+
+    x, y = _boundary(x0, x1, y0, y1)
+    lonlat = geodetic.transform_points(crs, x, y)
+    ok = np.isfinite(lonlat[:, 0]) & np.isfinite(lonlat[:, 1])
+    lons = np.concatenate([lonlat[ok, 0], (lon + 180) % 360 - 180])
+    lats = np.concatenate([lonlat[ok, 1], lat])
+    return (x0, x1, y0, y1), (lons.min(), lons.max(), lats.min(), lats.max())
+
+
+class FeatureCache:
+    """
+    Natural Earth geometries clipped and projected per (feature, scale, CRS, extent)
+
+    Parameters
+    ----------
+    root : str
+        Directory for the pickled geometries, None to keep them in memory only
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        self._memory = {}
+
+    def _path(self, name, scale, crs, extent):
+        key = f'{crs.proj4_init}|{np.round(extent, 4).tolist()}'
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.root, f'{name}_{scale}_{digest}.pkl')
+
+    def _build(self, name, scale, crs, extent, margin=1.):
+        category, shapefile, _ = FEATURES[name]
+        source = cfeature.NaturalEarthFeature(category, shapefile, scale)
+        (x0, x1, y0, y1), (west, east, south, north) = map_bounds(crs, extent)
+        lonlat_box = box(west - margin, south - margin, east + margin, north + margin)
+        dx, dy = (x1 - x0) * 0.01, (y1 - y0) * 0.01
+        map_box = box(x0 - dx, y0 - dy, x1 + dx, y1 + dy)
+
+        geoms = []
+        for geom in source.intersecting_geometries((west - margin, east + margin,
+                                                    south - margin, north + margin)):
+            geom = geom.intersection(lonlat_box)
+            if geom.is_empty:
+                continue
+            geom = crs.project_geometry(geom, source.crs).intersection(map_box)
+            if not geom.is_empty:
+                geoms.append(geom)
+        return geoms
+
+    def _write(self, path, geoms):
+        os.makedirs(self.root, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.root, suffix='.tmp', delete=False) as f:
+            pickle.dump([wkb.dumps(g) for g in geoms], f, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            if not os.path.isfile(path):
+                raise
+
+    def geometries(self, name, crs, extent, scale='110m'):
+        """Geometries of feature ``name`` in ``crs`` coordinates, clipped to the map for ``extent``."""
+        name = name.lower()
+        if name not in FEATURES:
+            raise ValueError(f'Unknown feature {name!r}, expected one of {sorted(FEATURES)}')
+        key = (name, scale, crs.proj4_init, tuple(np.round(extent, 4)))
+        if key in self._memory:
+            return self._memory[key]
+
+        path = self._path(name, scale, crs, extent) if self.root else None
+        if path and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                geoms = [wkb.loads(g) for g in pickle.load(f)]
+        else:
+            geoms = self._build(name, scale, crs, extent)
+            # another process may have cached the same map while this one was building it
+            if path and not os.path.isfile(path):
+                self._write(path, geoms)
+        self._memory[key] = geoms
+        return geoms
+
+    def feature(self, name, crs, extent, scale='110m', **kwargs):
+        """``ShapelyFeature`` of the cached geometries with the feature's default style and ``kwargs``."""
+        style = dict(FEATURES[name.lower()][2], **kwargs)
+        return cfeature.ShapelyFeature(self.geometries(name, crs, extent, scale), crs, **style)
+
+
+FEATURE_CACHE = FeatureCache()
+
+
+def cached_feature(name, crs, extent, scale='110m', **kwargs):
+    """Feature from the process-wide ``FeatureCache``, see ``FeatureCache.feature``."""
+    return FEATURE_CACHE.feature(name, crs, extent, scale, **kwargs)
@@ -1,5 +1,4 @@
-import requests
-from bs4 import BeautifulSoup
+from awc_cache import CACHE
 # import sys
 
 
@@ -17,22 +16,7 @@ def get_metar(icao, hoursback=None):
     obs : str
         str with each observation as a seperate line (\n)
     """
-    if hoursback:
-        metar_url = f'https://www.aviationweather.gov/metar/data?ids={icao}&format=raw&date=&hours={hoursback}&taf=off'
-    else:
-        metar_url = f'https://www.aviationweather.gov/metar/data?ids={icao}&format=raw&date=&hours=0&taf=off'
-    src = requests.get(metar_url).content
-    soup = BeautifulSoup(src, "html.parser")
-
-    metar_data = soup.find(id='awc_main_content_wrap')
-
-    obs = ''
-    for i in metar_data:
-        if str(i).startswith('<code>'):
-            line = str(i).lstrip('<code>').rstrip('</code>')
-            obs += line
-            obs += '\n'
-    return obs
+    return CACHE.metars(icao, hoursback)
 
 
 if __name__ == '__main__':
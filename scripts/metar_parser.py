@@ -0,0 +1,133 @@
+"""
+Single-pass columnar METAR parsing.
+
+Each report is parsed into MetPy's ``Metar`` named tuple and written straight
+into preallocated numpy columns. The DataFrame, sea-level pressure and wind
+components are built once per batch instead of once per report.
+"""
+from datetime import datetime as dt
+
+import numpy as np
+import pandas as pd
+import metpy.calc as mpcalc
+from metpy.units import units
+
+try:
+    from metpy.io.metar import parse_metar, ParseError
+except ImportError:  # MetPy < 1.0
+    from metpy.io.metar import parse_metar_to_named_tuple, ParseError
+    from metpy.io.station_data import station_info
+
+    def parse_metar(metar_text, year, month, station_metadata=station_info):
+        return parse_metar_to_named_tuple(metar_text, station_metadata, year, month)
+
+
+# everything else in the Metar tuple is numeric
+STRING_FIELDS = {'station_id', 'current_wx1', 'current_wx2', 'current_wx3',
+                 'skyc1', 'skyc2', 'skyc3', 'skyc4', 'remarks'}
+RENAME = {'skyc1': 'low_cloud_type', 'skylev1': 'low_cloud_level',
+          'skyc2': 'medium_cloud_type', 'skylev2': 'medium_cloud_level',
+          'skyc3': 'high_cloud_type', 'skylev3': 'high_cloud_level',
+          'skyc4': 'highest_cloud_type', 'skylev4': 'highest_cloud_level',
+          'cloudcover': 'cloud_coverage', 'temperature': 'air_temperature',
+          'dewpoint': 'dew_point_temperature'}
+
+
+def _allocate(fields, size):
+    """Preallocate one numpy column per Metar field."""
+    cols = {}
+    for name in fields:
+        if name in STRING_FIELDS:
+            cols[name] = np.empty(size, dtype=object)
+        elif name == 'date_time':
+            cols[name] = np.empty(size, dtype='datetime64[ns]')
+        else:
+            cols[name] = np.full(size, np.nan)
+    return cols
+
+
+def _to_dataframe(cols, n):
+    """Build the DataFrame and the derived columns for the first ``n`` rows of ``cols``."""
+    df = pd.DataFrame({name: col[:n] for name, col in cols.items()})
+    df.rename(columns=RENAME, inplace=True)
+    df.set_index('station_id', inplace=True, drop=False)
+    df.drop_duplicates(subset=['station_id', 'date_time'], keep='last', inplace=True)
+
+    df['air_pressure_at_sea_level'] = mpcalc.altimeter_to_sea_level_pressure(
+        df['altimeter'].values * units.inHg,
+        df['elevation'].values * units.meter,
+        df['air_temperature'].values * units.degC).m_as('hPa').round(2)
+    u, v = mpcalc.wind_components(df['wind_speed'].values * units.knots,
+                                  df['wind_direction'].values * units.degree)
+    df['eastward_wind'] = u.m
+    df['northward_wind'] = v.m
+    df['altimeter'] = df['altimeter'].round(2)
+    return df
+
+
+def iter_metar_frames(lines, chunk_size=65536, year=None, month=None, station_metadata=None):
+    """
+    Parse an iterable of raw METAR lines into DataFrames of at most ``chunk_size`` rows
+
+    ``lines`` can be a list, a generator or an open file, so month-long
+    multi-station dumps are parsed in bounded memory: only one chunk of
+    columns is alive at a time. Blank lines and reports MetPy cannot parse are
+    skipped, and repeated (station, time) reports within a chunk are dropped.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Raw METAR reports, one per item
+    chunk_size : int
+        Maximum number of reports per yielded DataFrame
+    year, month : int
+        Year and month of the reports, defaults to the current ones
+    station_metadata : mapping
+        Station lookup passed through to MetPy (ICAO -> lat/lon/elevation)
+
+    Yields
+    ----------
+    df : pandas.DataFrame
+        Same columns as ``parse_metar_to_dataframe``
+    """
+    now = dt.utcnow()
+    kwargs = {'year': year or now.year, 'month': month or now.month}
+    if station_metadata is not None:
+        kwargs['station_metadata'] = station_metadata
+    if hasattr(lines, '__len__'):
+        chunk_size = max(1, min(chunk_size, len(lines)))
+
+    cols, n = None, 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            ob = parse_metar(line, **kwargs)
+        except ParseError:
+            continue
+        if cols is None:
+            cols = _allocate(ob._fields, chunk_size)
+        for name, value in zip(ob._fields, ob):
+            cols[name][n] = value
+        n += 1
+        if n == chunk_size:
+            yield _to_dataframe(cols, n)
+            cols, n = None, 0
+    if n:
+        yield _to_dataframe(cols, n)
+
+
+def parse_metars(lines, **kwargs):
+    """
+    Parse an iterable of raw METAR lines into a single DataFrame
+
+    See ``iter_metar_frames`` for the arguments. Returns an empty DataFrame if
+    none of the lines could be parsed.
+    """
+    frames = list(iter_metar_frames(lines, **kwargs))
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames)
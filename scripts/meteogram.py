@@ -1,3 +1,5 @@
+import os
+
 import matplotlib.pyplot as plt
 from matplotlib.dates import DayLocator, HourLocator, DateFormatter, drange
 import requests
@@ -17,43 +19,10 @@ from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 from metpy.io import parse_metar_to_dataframe
 import warnings
 
-
-def to_heat_index(T, Td):
-    T = T*units('degF')
-    Td = Td*units('degF')
-    RH = mpcalc.relative_humidity_from_dewpoint(T, Td)
-    HI = mpcalc.heat_index(T, RH)
-    return HI
-
-
-def to_wind_chill(T, wspd):
-    T = T*units('degF')
-    wspd = wspd*units('kts').to('mph')
-    windchill = mpcalc.windchill(T, wspd)
-    return windchill
-
-
-def my_wetbulb(p, T, Td):
-    it = np.nditer([p, T, Td, None],
-                       op_dtypes=['float', 'float', 'float', 'float'],
-                       flags=['buffered'])
-    n = 0
-    for press, temp, dewp, ret in it:
-        n += 1
-        press = press * p.units
-        temp = temp * T.units
-        dewp = dewp * Td.units
-        lcl_pressure, lcl_temperature = mpcalc.lcl(press, temp, dewp)
-        moist_adiabat_temperatures = mpcalc.moist_lapse(concatenate([lcl_pressure, press]),
-                                                 lcl_temperature)
-        if moist_adiabat_temperatures.size == 0:
-            print(f'Dewpoint Depression = 0 at {press}')
-#             ret[...] = ((temp.m + dewp.m)/2) * T.units
-            ret[...] = np.nan
-        else:
-    #     print(f'{n} {press.m} {temp.m:.2f} {dewp.m:.2f} {moist_adiabat_temperatures.size}')
-            ret[...] = moist_adiabat_temperatures[-1].magnitude
-    return it.operands[3] * moist_adiabat_temperatures.units
+from awc_cache import CACHE
+from metar_parser import parse_metars
+from obs_archive import ARCHIVE
+from surface_fields import add_surface_fields
 
 
 def get_metar_meteogram(icao, hoursback=None):
@@ -73,36 +42,18 @@ def get_metar_meteogram(icao, hoursback=None):
         str with each observation as a seperate line (\n)
     """
 
-    if hoursback:
-        metar_url = f'https://www.aviationweather.gov/metar/data?ids={icao}&format=raw&date=&hours={hoursback}&taf=off'
-    else:
-        metar_url = f'https://www.aviationweather.gov/metar/data?ids={icao}&format=raw&date=&hours=0&taf=off'
-    src = requests.get(metar_url).content
-    soup = BeautifulSoup(src, "html.parser")
-    metar_data = soup.find(id='awc_main_content_wrap')
-
-    obs = ''
-    for i in metar_data:
-        if str(i).startswith('<code>'):
-            line = str(i).lstrip('<code>').rstrip('</code>')
-            obs+=line
-            obs+='\n'
-    return obs
+    return CACHE.metars(icao, hoursback)
 
 
 def metar_to_df(icao, hoursback):
     icaos = [icao.upper()]
-    # z = 19
-    for i,icao in enumerate(icaos):
-        txt = get_metar_meteogram(icao, hoursback).split('\n')[:-1]
-        if i == 0:
-            df = parse_metar_to_dataframe(txt[-1])
-        for row in txt[::-1]:
-            df = pd.concat([df, parse_metar_to_dataframe(row)])
-    return df
+    # AWC lists the newest report first, so reverse each station's lines and
+    # parse every report in one batch
+    txt = [row for icao in icaos for row in get_metar_meteogram(icao, hoursback).split('\n')[::-1]]
+    return parse_metars(txt)
 
 
-def meteogram(icao, hoursback):
+def meteogram(icao, hoursback, df=None, out_dir='../imgs/meteogram'):
     # icaos = [icao.upper()]
     # # z = 19
     # for i,icao in enumerate(icaos):
@@ -116,27 +67,12 @@ def meteogram(icao, hoursback):
       # df = df.set_index('date_time')
       # print(df)
 #     df = df.dropna(inplace=True)
-    df = metar_to_df(icao, hoursback)
-    df['tempF'] =  (df['air_temperature'] * 9/5) + 32
-    df['dewF'] =  (df['dew_point_temperature'] * 9/5) + 32
-    df['heat_index'] = to_heat_index(df['tempF'].values, df['dewF'].values)
-    ## nan HI values where air temp < 80 F 
-    df.loc[df['tempF'] < 80, ['heat_index']] = np.nan
-    df['wind_chill'] = to_wind_chill(df['tempF'].values, df['wind_speed'].values)
-    ## nan wind chill values where speed <= 5 mph or air temp > 50
-    df.loc[df['wind_speed'] <= 5, ['wind_chill']] = np.nan
-    df.loc[df['tempF'] > 50, ['wind_chill']] = np.nan
-#     unit_df = pandas_dataframe_to_unit_arrays(df, column_units=df.units)
-    try:
-        # df['wet_bulb'] = mpcalc.wet_bulb_temperature(df['air_pressure_at_sea_level'].values*units('hPa'),
-        #                                          df['air_temperature'].values*units('degC'),
-        #                                          df['dew_point_temperature'].values*units('degC')).to('degF').m
-        df['wet_bulb'] = my_wetbulb(df['air_pressure_at_sea_level'].values*units('hPa'),
-                                                df['air_temperature'].values*units('degC'),
-                                                df['dew_point_temperature'].values*units('degC')).to('degF')
-    except ValueError as e:
-        print("Can't calculate wet bulb")
-        df['wet_bulb'] = np.nan
+    if df is None:
+        df = metar_to_df(icao, hoursback)
+        # keep the parsed observations for later meteograms and climatology
+        ARCHIVE.append(df)
+    # degF, RH, heat index, wind chill, wet bulb and apparent temperature in one pass
+    add_surface_fields(df)
 
     WNDDIR = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW', 'N']
     WNDDEG = np.arange(0, 361, 22.5)
@@ -154,9 +90,9 @@ def meteogram(icao, hoursback):
 
     ax1.set_ylabel('Temperature (°F)')
     ax1.set_xlabel('Z-Time (MM-DD HH)')
-    ax1.set_title(f"{df['station_id'][0]}\n{df['date_time'][0].strftime('%Y-%m')}")
-    ax1.set_xticks(pd.date_range(df['date_time'][0].strftime('%Y-%m-%d %H'), df['date_time'][-1].strftime('%Y-%m-%d %H'), freq='2H'))
-    ax1.set_xticklabels(pd.date_range(df['date_time'][0].strftime('%Y-%m-%d %H'), df['date_time'][-1].strftime('%Y-%m-%d %H'), freq='2H').strftime('%m-%d %H%MZ'))
+    ax1.set_title(f"{df['station_id'].iloc[0]}\n{df['date_time'].iloc[0].strftime('%Y-%m')}")
+    ax1.set_xticks(pd.date_range(df['date_time'].iloc[0].strftime('%Y-%m-%d %H'), df['date_time'].iloc[-1].strftime('%Y-%m-%d %H'), freq='2h'))
+    ax1.set_xticklabels(pd.date_range(df['date_time'].iloc[0].strftime('%Y-%m-%d %H'), df['date_time'].iloc[-1].strftime('%Y-%m-%d %H'), freq='2h').strftime('%m-%d %H%MZ'))
    # ax1.set_ylim([40, 100])
     ax1.grid(which='both')
     ax1.grid(which='major', axis='x', color='black')
@@ -198,8 +134,8 @@ def meteogram(icao, hoursback):
     ax4.set_ylim([0, 30])
     ax4.set_ylabel('Cloud Height (kft)')
     ax4.set_xlabel('Date (MM-DD-HH Z)')
-    ax4.set_xticks(pd.date_range(df['date_time'][0].strftime('%Y-%m-%d %H'), (df['date_time'][-1]+timedelta(hours=6)).strftime('%Y-%m-%d %H'), freq='6H'))
-    ax4.set_xticklabels(pd.date_range(df['date_time'][0].strftime('%Y-%m-%d %H'), (df['date_time'][-1]+timedelta(hours=6)).strftime('%Y-%m-%d %H'), freq='6H').strftime('%d %HZ'))
+    ax4.set_xticks(pd.date_range(df['date_time'].iloc[0].strftime('%Y-%m-%d %H'), (df['date_time'].iloc[-1]+timedelta(hours=6)).strftime('%Y-%m-%d %H'), freq='6h'))
+    ax4.set_xticklabels(pd.date_range(df['date_time'].iloc[0].strftime('%Y-%m-%d %H'), (df['date_time'].iloc[-1]+timedelta(hours=6)).strftime('%Y-%m-%d %H'), freq='6h').strftime('%d %HZ'))
     ax4.legend(loc='upper left')
     ax4.xaxis.set_major_locator(DayLocator())
     ax4.xaxis.set_minor_locator(HourLocator(range(0, 25, 3)))
@@ -209,13 +145,56 @@ def meteogram(icao, hoursback):
     ax4.xaxis.set_major_formatter(DateFormatter('%Y-%m-%d'))
     ax4.xaxis.set_minor_formatter(DateFormatter('%H'))
     fig.autofmt_xdate(rotation=50)
-    fname = f"../imgs/meteogram/metorgram_{df['station_id'][0]}.png"
+    fname = os.path.join(out_dir, f"metorgram_{df['station_id'].iloc[0]}.png")
     plt.savefig(fname, bbox_inches='tight')
     plt.close(fig)
 
     return fname, df
 
 
+def max_peak_wind(df):
+    """
+    Highest peak wind (kts) reported in the remarks of ``df``
+
+    Works on a single meteogram's frame or on months of history read back
+    with ``ARCHIVE.read(stations, start, end, columns=['remarks'])``.
+    """
+    rmks = df['remarks'].dropna()
+    pk_wnds = [x.split('AO2 PK WND ')[1][0:10] for x in rmks if 'PK WND' in x]
+    pk_dict = dict(zip([x.split('/')[1] for x in pk_wnds], [x.split('/')[0] for x in pk_wnds]))
+    max_wnds = np.array([x[-2:] for x in pk_dict.values()], dtype=float)
+    if max_wnds.any():
+        return max_wnds.max()
+    return None
+
+
+def check_archive_render(station='KPIT', hours=36):
+    """Render a meteogram from observations read back out of an ``ObsArchive``."""
+    import tempfile
+    from obs_archive import ObsArchive
+
+    start = dt(2026, 10, 17)
+    lines = []
+    for h in range(hours):
+        t = start + timedelta(hours=h)
+        temp = 12 + 6 * np.sin(2 * np.pi * (h - 9) / 24)
+        lines.append(f'{station} {t:%d%H}53Z {(200 + 5 * h) % 360:03d}{8 + h % 7:02d}KT 10SM '
+                     f'FEW{30 + h % 20:03d} BKN250 {round(temp):02d}/{round(temp) - 5:02d} '
+                     f'A{3001 + h % 9} RMK AO2 PK WND 270{20 + h % 15}/{h % 60:02d}')
+
+    with tempfile.TemporaryDirectory() as root:
+        archive = ObsArchive(root)
+        # no station table lookup (it is downloaded on first use), the location is not plotted
+        archive.append(parse_metars(lines, year=start.year, month=start.month, station_metadata={}))
+        df = archive.read([station], start, start + timedelta(hours=hours))
+        assert len(df) == hours and df.index[0] == 0
+        fname, df = meteogram(station, None, df=df, out_dir=root)
+        assert os.path.getsize(fname) > 0
+    assert df['date_time'].iloc[0] == start + timedelta(minutes=53)
+    assert max_peak_wind(df) == 20 + max(h % 15 for h in range(hours))
+    print(f'{fname}: {len(df)} archived observations rendered')
+
+
 if __name__ == '__main__':
     # suppress warnings about NaNs
     warnings.simplefilter('ignore')
@@ -244,11 +223,8 @@ if __name__ == '__main__':
     print(f'Meteogram for {icao} created.\n{fname}\n')
 
     try:
-        rmks = df['remarks']
-        pk_wnds = [x.split('AO2 PK WND ')[1][0:10] for x in rmks if 'PK WND' in x]
-        pk_dict = dict(zip([x.split('/')[1] for x in pk_wnds], [x.split('/')[0] for x in pk_wnds]))
-        max_wnds = np.array([x[-2:] for x in pk_dict.values()], dtype=float)
-        if max_wnds.any():
-            print(f'Max wind {max_wnds.max()}')
+        max_wnd = max_peak_wind(df)
+        if max_wnd:
+            print(f'Max wind {max_wnd}')
     except IndexError as e: 
         print(e)
@@ -0,0 +1,205 @@
+"""
+Persistent columnar archive of parsed METAR observations.
+
+Observations are partitioned by station and UTC day, one directory per
+partition, one ``.npy`` file per column:
+
+    <root>/<STATION>/<YYYY-MM-DD>/time.npy         int64 epoch seconds, sorted
+    <root>/<STATION>/<YYYY-MM-DD>/<column>.npy     float32 measurements
+    <root>/<STATION>/<YYYY-MM-DD>/<column>.codes.npy + <column>.json
+                                                   categorical text columns
+
+Reads prune partitions by station and day, memory-map only the requested
+columns and slice them by binary search on the sorted times, so months of
+history come back without touching the rest of the archive.
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                            'obs_archive')
+DAY_FORMAT = '%Y-%m-%d'
+# columns that are implied by the partition layout rather than stored
+KEY_COLUMNS = ('station_id', 'date_time')
+
+
+def _epoch(t):
+    """Epoch seconds of anything ``pd.Timestamp`` understands (naive times are UTC)."""
+    t = pd.Timestamp(t)
+    if t.tzinfo is not None:
+        t = t.tz_convert('UTC').tz_localize(None)
+    return int(t.value // 10**9)
+
+
+def _day_name(epoch_day):
+    return datetime.fromtimestamp(int(epoch_day) * 86400, timezone.utc).strftime(DAY_FORMAT)
+
+
+def _save(path, arr):
+    """Write ``arr`` next to ``path`` and move it into place, so readers never see half a file."""
+    tmp = f'{path}.tmp.npy'
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+class ObsArchive:
+    """
+    Station/day partitioned observation store
+
+    Parameters
+    ----------
+    root : str
+        Directory holding the partitions, created on first append
+    """
+
+    def __init__(self, root=ARCHIVE_PATH):
+        self.root = root
+
+    def _partition(self, station, day):
+        return os.path.join(self.root, station, day)
+
+    def _columns(self, path):
+        names = set()
+        for name in os.listdir(path):
+            if name.endswith('.codes.npy'):
+                names.add(name[:-len('.codes.npy')])
+            elif name.endswith('.npy') and name != 'time.npy' and '.tmp' not in name:
+                names.add(name[:-len('.npy')])
+        return sorted(names)
+
+    def _read_column(self, path, name, lo, hi):
+        """Rows ``lo:hi`` of one column; categorical columns come back as object arrays."""
+        codes_path = os.path.join(path, f'{name}.codes.npy')
+        if os.path.isfile(codes_path):
+            codes = np.load(codes_path, mmap_mode='r')[lo:hi]
+            with open(os.path.join(path, f'{name}.json')) as f:
+                categories = np.array(json.load(f) + [None], dtype=object)
+            return categories[codes]
+        col_path = os.path.join(path, f'{name}.npy')
+        if os.path.isfile(col_path):
+            return np.array(np.load(col_path, mmap_mode='r')[lo:hi])
+        return np.full(hi - lo, np.nan, dtype=np.float32)
+
+    def _write_partition(self, path, times, cols):
+        """Merge ``cols`` into the partition at ``path`` (new rows win on equal times)."""
+        if os.path.isfile(os.path.join(path, 'time.npy')):
+            old_times = np.load(os.path.join(path, 'time.npy'))
+            names = sorted(set(cols) | set(self._columns(path)))
+            n_old = old_times.size
+            for name in names:
+                old = self._read_column(path, name, 0, n_old)
+                new = cols.get(name, np.full(times.size, np.nan, dtype=np.float32))
+                if old.dtype == object or new.dtype == object:
+                    old, new = old.astype(object), new.astype(object)
+                cols[name] = np.concatenate([old, new])
+            times = np.concatenate([old_times, times])
+        os.makedirs(path, exist_ok=True)
+
+        # keep the last report for each time, sorted by time
+        _, keep = np.unique(times[::-1], return_index=True)
+        keep = times.size - 1 - keep
+        _save(os.path.join(path, 'time.npy'), times[keep].astype(np.int64))
+        for name, col in cols.items():
+            col = col[keep]
+            if col.dtype == object:
+                codes, categories = pd.factorize(col)
+                _save(os.path.join(path, f'{name}.codes.npy'), codes.astype(np.int32))
+                with open(os.path.join(path, f'{name}.json'), 'w') as f:
+                    json.dump([str(c) for c in categories], f)
+            else:
+                _save(os.path.join(path, f'{name}.npy'), col.astype(np.float32))
+
+    def append(self, df):
+        """
+        Add parsed observations (e.g. from ``parse_metars``) to the archive
+
+        Only the station/day partitions touched by ``df`` are rewritten;
+        reports already archived for the same station and time are replaced.
+        """
+        if df.empty:
+            return
+        df = df.reset_index(drop=True)
+        times = pd.to_datetime(df['date_time']).values.astype('datetime64[s]').astype(np.int64)
+        stations = df['station_id'].astype(str).values
+        for (station, day), idx in pd.Series(np.arange(len(df))).groupby(
+                [stations, times // 86400]).groups.items():
+            idx = np.asarray(idx)
+            cols = {}
+            for name in df.columns:
+                if name in KEY_COLUMNS:
+                    continue
+                values = df[name].values[idx]
+                if values.dtype.kind in 'biuf':
+                    cols[name] = values.astype(np.float32)
+                elif values.dtype.kind == 'O' or isinstance(df[name].dtype, pd.CategoricalDtype):
+                    cols[name] = np.asarray(values, dtype=object)
+            self._write_partition(self._partition(station, _day_name(day)), times[idx], cols)
+
+    def stations(self):
+        """Station identifiers present in the archive."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(os.listdir(self.root))
+
+    def read(self, stations=None, start=None, end=None, columns=None):
+        """
+        Observations of ``stations`` with ``start <= date_time < end``
+
+        Parameters
+        ----------
+        stations : iterable of str
+            ICAO identifiers, defaults to every archived station
+        start, end : datetime-like
+            Time range (UTC), open-ended when None
+        columns : iterable of str
+            Columns to read besides ``station_id`` and ``date_time``,
+            defaults to all of them
+
+        Returns
+        ----------
+        df : pandas.DataFrame
+            Observations sorted by station and time, with a categorical
+            ``station_id`` and float32 measurements
+        """
+        stations = list(dict.fromkeys(s.upper() for s in stations)) if stations is not None \
+            else self.stations()
+        t0 = _epoch(start) if start is not None else np.iinfo(np.int64).min
+        t1 = _epoch(end) if end is not None else np.iinfo(np.int64).max
+        first_day = _day_name(t0 // 86400) if start is not None else ''
+        last_day = _day_name((t1 - 1) // 86400) if end is not None else '9999'
+
+        parts, counts, times = [], [], []
+        for station in stations:
+            station_dir = os.path.join(self.root, station)
+            if not os.path.isdir(station_dir):
+                continue
+            for day in sorted(os.listdir(station_dir)):
+                if not first_day <= day <= last_day:
+                    continue
+                path = os.path.join(station_dir, day)
+                t = np.load(os.path.join(path, 'time.npy'), mmap_mode='r')
+                lo, hi = np.searchsorted(t, t0), np.searchsorted(t, t1)
+                if hi > lo:
+                    parts.append((station, path, lo, hi))
+                    counts.append(hi - lo)
+                    times.append(np.array(t[lo:hi]))
+
+        if columns is None:
+            columns = sorted({name for _, path, _, _ in parts for name in self._columns(path)})
+        data = {
+            'station_id': pd.Categorical(np.repeat([p[0] for p in parts], counts),
+                                         categories=stations),
+            'date_time': pd.to_datetime(np.concatenate(times) if times else [], unit='s'),
+        }
+        for name in columns:
+            pieces = [self._read_column(path, name, lo, hi) for _, path, lo, hi in parts]
+            data[name] = np.concatenate(pieces) if pieces else np.array([], dtype=np.float32)
+        return pd.DataFrame(data)
+
+
+ARCHIVE = ObsArchive()
@@ -1,3 +1,6 @@
+# with arguments, render in batch, e.g. ./run.sh --state PA --products skewt meteogram
+if [[ $# -gt 0 ]]; then exec python batch_render.py "$@"; fi
+
 while true
 do
 read -p "What do you want to do?
@@ -6,6 +9,7 @@ read -p "What do you want to do?
 [3] Skew T
 [4] Meteogram
 [5] GOES
+[6] Batch Skew T / Meteogram
 --> " choice
 
 if [[ $choice -eq 1 ]]; then python metar.py
@@ -13,6 +17,10 @@ elif [[ $choice -eq 2 ]]; then python taf.py
 elif [[ $choice -eq 3 ]]; then python skewt.py
 elif [[ $choice -eq 4 ]]; then python meteogram.py
 elif [[ $choice -eq 5 ]]; then python goes_imagery.py
+elif [[ $choice -eq 6 ]]; then read -p "Stations (ICAOs or a state, e.g. PA): " stations
+    if [[ ${#stations} -eq 2 ]]; then python batch_render.py --state $stations
+    else python batch_render.py --stations $stations
+    fi
 else echo "Enter a valid choice"
 fi
 echo ""
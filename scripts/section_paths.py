@@ -0,0 +1,239 @@
+"""
+Batch cross-sections with precomputed path interpolation weights.
+
+``metpy.interpolate.cross_section`` walks the geodesic and interpolates with
+``xarray.interp`` for every section and every variable. ``SectionPaths`` does
+the geodesic and the bilinear weights once per path and stores them for all
+paths as one sparse (points x grid) matrix, so sectioning a variable for every
+path, level and time is a single sparse-dense product. The same object is
+reused for any number of variables and forecast times on the same grid.
+
+    names, paths = all_pairs(station_index().coords(icaos))
+    cross = SectionPaths.from_dataset(data, paths, 500, names).apply(data[['t', 'q', 'u', 'v']])
+"""
+import itertools
+import time
+
+import numpy as np
+import xarray as xr
+import cartopy.crs as ccrs
+from pyproj import Geod
+from scipy import sparse
+
+
+def _geod(crs):
+    """``pyproj.Geod`` on the ellipsoid of a cartopy CRS."""
+    params = crs.proj4_params
+    if 'R' in params:
+        return Geod(a=params['R'], b=params['R'])
+    kwargs = {k: params[k] for k in ('ellps', 'a', 'b', 'rf', 'f') if k in params}
+    return Geod(**(kwargs or {'ellps': 'WGS84'}))
+
+
+def geodesic_points(geod, start, end, steps):
+    """Latitudes and longitudes of ``steps`` points from ``start`` to ``end`` (both (lat, lon)), endpoints included."""
+    inner = np.array(geod.npts(start[1], start[0], end[1], end[0], steps - 2)).reshape(-1, 2)
+    lon = np.concatenate([[start[1]], inner[:, 0], [end[1]]])
+    lat = np.concatenate([[start[0]], inner[:, 1], [end[0]]])
+    return lat, lon
+
+
+def _fractional_index(coord, points, period=None):
+    """Fractional position of ``points`` along a monotonic 1-D coordinate (NaN outside)."""
+    coord = np.asarray(coord, dtype=np.float64)
+    if period:
+        points = (points - coord.min()) % period + coord.min()
+    order = np.argsort(coord)
+    return np.interp(points, coord[order], order.astype(np.float64), left=np.nan, right=np.nan)
+
+
+def all_pairs(points):
+    """
+    ``(start, end)`` for every pair of named points
+
+    Parameters
+    ----------
+    points : dict
+        ``{name: (lat, lon)}``, e.g. from ``station_index().coords(icaos)``
+
+    Returns
+    ----------
+    names : list of str
+        ``'A-B'`` label of each pair
+    paths : list of ((lat, lon), (lat, lon))
+    """
+    pairs = list(itertools.combinations(sorted(points), 2))
+    return [f'{a}-{b}' for a, b in pairs], [(points[a], points[b]) for a, b in pairs]
+
+
+class SectionPaths:
+    """
+    Geodesic sample points and bilinear weights of many cross-section paths on one grid
+
+    Parameters
+    ----------
+    paths : sequence of ((lat, lon), (lat, lon))
+        Start and end of each section
+    x, y : array_like
+        1-D grid coordinates in ``crs``
+    crs : cartopy.crs.CRS
+        Grid projection, plain latitude/longitude when None
+    steps : int
+        Points along each path, endpoints included
+    names : sequence
+        Optional label of each path, e.g. the station pair
+    """
+
+    def __init__(self, paths, x, y, crs=None, steps=100, names=None):
+        crs = crs or ccrs.PlateCarree()
+        geod = _geod(crs)
+        self.paths = [(tuple(start), tuple(end)) for start, end in paths]
+        self.names = list(names) if names is not None else list(range(len(self.paths)))
+        self.steps = steps
+        self.shape = (len(y), len(x))
+
+        lat, lon = zip(*(geodesic_points(geod, start, end, steps) for start, end in self.paths))
+        self.latitude = np.array(lat).reshape(len(self.paths), steps)
+        self.longitude = np.array(lon).reshape(len(self.paths), steps)
+
+        # longitudes wrap onto the grid (e.g. 0-360) when x is a longitude
+        latlong = crs.proj4_params.get('proj') in ('latlong', 'longlat', 'lonlat')
+        if latlong:
+            px, py = self.longitude.ravel(), self.latitude.ravel()
+        else:
+            xyz = crs.transform_points(ccrs.Geodetic(), self.longitude.ravel(),
+                                       self.latitude.ravel())
+            px, py = xyz[:, 0], xyz[:, 1]
+        latlong |= isinstance(crs, ccrs.PlateCarree)
+        fx = _fractional_index(x, px, 360. if latlong else None)
+        fy = _fractional_index(y, py)
+        self.outside = (np.isnan(fx) | np.isnan(fy)).reshape(self.latitude.shape)
+        self.weights = self._matrix(fx, fy)
+
+    def _matrix(self, fx, fy):
+        """Sparse (points, grid) matrix of bilinear weights."""
+        ny, nx = self.shape
+        npoints = fx.size
+        ok = ~(np.isnan(fx) | np.isnan(fy))
+        rows = np.nonzero(ok)[0]
+        fx, fy = fx[ok], fy[ok]
+        ix = np.minimum(np.floor(fx).astype(int), nx - 2)
+        iy = np.minimum(np.floor(fy).astype(int), ny - 2)
+        wx, wy = fx - ix, fy - iy
+        cols = np.concatenate([iy * nx + ix, iy * nx + ix + 1, (iy + 1) * nx + ix,
+                               (iy + 1) * nx + ix + 1])
+        vals = np.concatenate([(1 - wy) * (1 - wx), (1 - wy) * wx, wy * (1 - wx), wy * wx])
+        matrix = sparse.csr_matrix((vals, (np.tile(rows, 4), cols)),
+                                   shape=(npoints, ny * nx))
+        matrix.eliminate_zeros()
+        return matrix
+
+    @classmethod
+    def from_dataset(cls, data, paths, steps=100, names=None):
+        """Paths on the grid of a MetPy-parsed DataArray or Dataset."""
+        var = data if isinstance(data, xr.DataArray) else next(
+            v for v in data.data_vars.values() if v.ndim >= 2)
+        x, y = var.metpy.x, var.metpy.y
+        return cls(paths, x.values, y.values, var.metpy.cartopy_crs, steps, names)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def gather(self, values):
+        """
+        Sections of a gridded array along every path
+
+        Parameters
+        ----------
+        values : array_like
+            Shape (..., ny, nx); any leading dimensions (time, level, ...) are
+            sectioned in the same product
+
+        Returns
+        ----------
+        sections : ndarray
+            Shape (..., npaths, steps), NaN where a path leaves the grid
+        """
+        values = np.asarray(values)
+        lead = values.shape[:-2]
+        flat = values.reshape(-1, self.shape[0] * self.shape[1]).T
+        out = (self.weights @ flat).T.reshape(lead + self.latitude.shape)
+        out[..., self.outside] = np.nan
+        return out
+
+    def apply(self, data):
+        """
+        Cross-sections of a DataArray or every gridded variable of a Dataset
+
+        The grid dimensions are replaced by ``path`` and ``index`` and the
+        sample points are attached as ``latitude``/``longitude`` coordinates,
+        like ``metpy.interpolate.cross_section`` does for one path.
+        """
+        if isinstance(data, xr.Dataset):
+            sections = {name: self.apply(var) for name, var in data.data_vars.items()
+                        if self._grid_dims(var)}
+            return xr.Dataset(sections, attrs=data.attrs)
+
+        ydim, xdim = self._grid_dims(data)
+        data = data.transpose(..., ydim, xdim)
+        values = self.gather(getattr(data.data, 'magnitude', data.data))
+        dims = data.dims[:-2] + ('path', 'index')
+        coords = {name: coord for name, coord in data.coords.items()
+                  if ydim not in coord.dims and xdim not in coord.dims and name != 'crs'}
+        coords.update({
+            'path': self.names, 'index': np.arange(self.steps),
+            'latitude': (('path', 'index'), self.latitude),
+            'longitude': (('path', 'index'), self.longitude),
+        })
+        return xr.DataArray(values, dims=dims, coords=coords, name=data.name, attrs=data.attrs)
+
+    def _grid_dims(self, var):
+        """Names of the y and x dimensions of ``var`` (None if it is not on the grid)."""
+        try:
+            ydim, xdim = var.metpy.y.dims[0], var.metpy.x.dims[0]
+        except AttributeError:
+            ydim, xdim = var.dims[-2:] if var.ndim >= 2 else (None, None)
+        if (var.sizes.get(ydim), var.sizes.get(xdim)) != self.shape:
+            return None
+        return ydim, xdim
+
+
+def check_against_metpy(data, paths, steps=100, variables=('t', 'q', 'u', 'v')):
+    """Largest difference from ``metpy.interpolate.cross_section`` and the timings of both."""
+    from metpy.interpolate import cross_section
+
+    data = data[list(variables)]
+    tic = time.perf_counter()
+    engine = SectionPaths.from_dataset(data, paths, steps)
+    batch = engine.apply(data)
+    batch_seconds = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    error = 0.
+    for i, (start, end) in enumerate(paths):
+        cross = cross_section(data, start, end, steps=steps)
+        for name in variables:
+            expected = np.asarray(getattr(cross[name].data, 'magnitude', cross[name].data))
+            actual = batch[name].isel(path=i).values
+            error = max(error, float(np.nanmax(np.abs(actual - expected))))
+    metpy_seconds = time.perf_counter() - tic
+    print(f'{len(paths)} paths x {len(variables)} variables: batch {batch_seconds:.2f} s, '
+          f'MetPy {metpy_seconds:.2f} s, max abs difference {error:.2e}')
+    return error
+
+
+if __name__ == '__main__':
+    import os
+
+    from stations import station_index
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                        'isentropic_example.nc')
+    data = xr.open_dataset(path).metpy.parse_cf()
+    index = station_index()
+    icaos = index.icao[index.bbox(-100, -70, 25, 45)][:20]
+    names, paths = all_pairs(index.coords(icaos))
+    check_against_metpy(data, paths[:50], steps=500)
+    tic = time.perf_counter()
+    sections = SectionPaths.from_dataset(data, paths, 500, names).apply(data[['t', 'q', 'u', 'v']])
+    print(f'{len(paths)} station-pair sections in {time.perf_counter() - tic:.2f} s')
@@ -0,0 +1,172 @@
+"""
+Vectorized solar geometry.
+
+The pveducation solar time formulas that ``convTime`` in solar_rad.py is
+based on, evaluated in NumPy for whole arrays of local times and locations at
+once instead of one ``datetime`` per call. Unlike ``convTime``, the time
+correction is in minutes (so the longitude counts), the equation of time is
+added to the clock in the same units, and the azimuth is measured clockwise
+from north on both sides of solar noon.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+
+SOLAR_CONSTANT = 1367.  # W m-2
+
+SolarPosition = namedtuple('SolarPosition', ['declination', 'hour_angle', 'elevation',
+                                             'azimuth', 'equation_of_time'])
+
+
+def solar_position(times, lat, lon, dtz):
+    """
+    Sun position for every combination of local time and location
+
+    Parameters
+    ----------
+    times : array_like of datetime64 or datetime
+        Local standard times (naive)
+    lat, lon : float or array_like
+        Locations in decimal degrees, broadcast against each other
+    dtz : float
+        Offset of local standard time from UTC in hours, e.g. -5 for EST
+
+    Returns
+    ----------
+    position : SolarPosition
+        ``declination``, ``hour_angle``, ``elevation`` and ``azimuth`` in
+        degrees and ``equation_of_time`` in minutes, shaped
+        ``times.shape + lat.shape``; the declination and equation of time only
+        depend on time and keep length-1 location axes
+    """
+    t = np.asarray(times, dtype='datetime64[s]')
+    lat, lon = np.broadcast_arrays(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+    t = t.reshape(t.shape + (1,) * lat.ndim)
+
+    day = (t.astype('datetime64[D]') - t.astype('datetime64[Y]')).astype(float) + 1
+    seconds = (t - t.astype('datetime64[D]')).astype(float)
+
+    B = np.deg2rad((360 / 365) * (day - 81))
+    eot = 9.87 * np.sin(2 * B) - 7.53 * np.cos(B) - 1.5 * np.sin(B)
+    decl = np.deg2rad(23.45) * np.sin(B)
+    # time correction (minutes): 4 min per degree from the time zone meridian
+    # plus the equation of time. The hour angle splits into a time part and a
+    # location part so the trig functions run on the (time x location) grid
+    # only once
+    tc_site = 4 * (lon - 15 * dtz)
+    hra_time = np.deg2rad(15) * ((seconds + 60 * eot) / 3600 - 12)
+    hra_site = np.deg2rad(15) * tc_site / 60
+    hra = hra_time + hra_site
+
+    lat = np.deg2rad(lat)
+    sin_decl, cos_decl = np.sin(decl), np.cos(decl)
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    cos_hra = np.cos(hra_time) * np.cos(hra_site) - np.sin(hra_time) * np.sin(hra_site)
+    sin_hra = np.sin(hra_time) * np.cos(hra_site) + np.cos(hra_time) * np.sin(hra_site)
+    sin_elev = np.clip(sin_decl * sin_lat + cos_decl * cos_lat * cos_hra, -1, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_azi = (sin_decl * cos_lat - cos_decl * sin_lat * cos_hra) / np.sqrt(1 - sin_elev**2)
+    # east of the meridian in the morning, west of it in the afternoon
+    azi = np.rad2deg(np.arccos(np.clip(cos_azi, -1, 1)))
+    azi = np.where(sin_hra > 0, 360 - azi, azi)
+
+    hra = (np.rad2deg(hra) + 180) % 360 - 180
+    return SolarPosition(np.rad2deg(decl), hra, np.rad2deg(np.arcsin(sin_elev)), azi, eot)
+
+
+def max_solar(elevation):
+    """Theoretical maximum surface solar radiation (W m-2) for a sun elevation in degrees."""
+    return SOLAR_CONSTANT * (np.sin(np.deg2rad(elevation)) + 0.033 * np.cos(np.deg2rad(80)))
+
+
+def day_minutes(year, month, day):
+    """Every minute of a local day as datetime64."""
+    return np.datetime64(f'{year:04d}-{month:02d}-{day:02d}') + np.arange(1440).astype(
+        'timedelta64[m]')
+
+
+def check_convtime(n=2000, seed=0):
+    """
+    Differences from ``convTime`` over random times and sites
+
+    Only the declination is expected to agree. ``convTime`` applies its time
+    correction in radians as if they were minutes, which drops the longitude
+    and most of the equation of time, and uses ``sin(lat)`` for ``cos(lat)``
+    in the azimuth, so its elevation and azimuth can be off by anything up
+    to the whole range. The checks that matter here are on ``solar_position`` alone:
+    the sun is highest near 12 LT on the time zone meridian once the equation
+    of time is taken out, rises in the east and sets in the west.
+    """
+    import datetime
+    from solar_rad import convTime
+
+    rng = np.random.default_rng(seed)
+    times = np.datetime64('2021-01-01') + rng.integers(0, 365 * 1440, n).astype('timedelta64[m]')
+    lat, lon = rng.uniform(-80, 80, n), rng.uniform(-180, 180, n)
+    dtz = -5
+    ref = np.array([convTime(dtz, la, lo, t.astype(datetime.datetime))[:3]
+                    for t, la, lo in zip(times, lat, lon)])
+    # one site per time: take the diagonal of the (time x site) result
+    pos = solar_position(times, lat, lon, dtz)
+    diag = np.arange(n)
+    errors = {
+        'declination': np.abs(pos.declination[:, 0] - ref[:, 0]),
+        'azimuth': np.abs(pos.azimuth[diag, diag] - ref[:, 1]),
+        'elevation': np.abs(pos.elevation[diag, diag] - ref[:, 2]),
+    }
+    for name, err in errors.items():
+        print(f'{name}: max abs difference from convTime {np.nanmax(err):.2e} deg')
+    assert errors['declination'].max() < 1e-9
+
+    # on the time zone meridian the sun peaks at 12 LT minus the equation of time
+    minutes = day_minutes(2021, 6, 21)
+    pos = solar_position(minutes, [40.], [-75.], -5)
+    noon = (minutes[np.argmax(pos.elevation[:, 0])] - minutes[0]).astype(float)
+    assert abs(noon - (720 - pos.equation_of_time[0, 0])) <= 1, noon
+    # a site 45 degrees further west sees it three hours later
+    west = solar_position(minutes, [40.], [-120.], -5)
+    shift = (np.argmax(west.elevation[:, 0]) - np.argmax(pos.elevation[:, 0]))
+    assert abs(shift - 180) <= 1, shift
+    morning, evening = pos.azimuth[6 * 60, 0], pos.azimuth[18 * 60, 0]
+    assert 45 < morning < 135 and 225 < evening < 315, (morning, evening)
+    return errors
+
+
+def benchmark(n_sites=2000, year=2021, dtz=-5):
+    """Annual clear-sky irradiation at minute resolution for ``n_sites`` sites."""
+    import datetime
+    from solar_rad import convTime
+
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(-60, 60, n_sites), rng.uniform(-180, 180, n_sites)
+    start = np.datetime64(f'{year:04d}-01-01')
+    n_days = int((np.datetime64(f'{year + 1:04d}-01-01') - start).astype(int))
+
+    # a day at a time keeps the (time x site) arrays to 1440 x n_sites
+    tic = time.perf_counter()
+    energy = np.zeros(n_sites)
+    for d in range(n_days):
+        minutes = start + np.timedelta64(d, 'D') + np.arange(1440).astype('timedelta64[m]')
+        elev = solar_position(minutes, lat, lon, dtz).elevation
+        energy += np.clip(max_solar(elev), 0, None).sum(axis=0) * 60
+    vectorized = time.perf_counter() - tic
+    n_points = n_days * 1440 * n_sites
+
+    local = datetime.datetime(year, 6, 1, 12)
+    tic = time.perf_counter()
+    for la, lo in zip(lat[:200], lon[:200]):
+        convTime(dtz, la, lo, local)
+    per_call = (time.perf_counter() - tic) / 200
+
+    print(f'{n_days} days x 1440 min x {n_sites} sites = {n_points:.3g} positions')
+    print(f'solar_position: {vectorized:.1f} s ({vectorized / n_points * 1e9:.1f} ns each)')
+    print(f'convTime (extrapolated): {per_call * n_points:.0f} s '
+          f'({per_call * 1e6:.1f} us each), {per_call * n_points / vectorized:.0f}x slower')
+    print(f'mean annual clear-sky irradiation: {energy.mean() / 1e9:.2f} GJ m-2')
+
+
+if __name__ == '__main__':
+    check_convtime()
+    benchmark()
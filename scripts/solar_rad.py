@@ -26,6 +26,7 @@ from datetime import datetime as dt
 from matplotlib import colors as mcolors
 from matplotlib.dates import YearLocator, MonthLocator, DateFormatter
 from matplotlib.ticker import MultipleLocator
+from solar import solar_position, max_solar, day_minutes
 
 
 def getTimeInHours(td):
@@ -73,19 +74,15 @@ def convTime(dtz, deglat, deglon, local):
 
     
 def plotSolar(year, month, day, lat, lon):
-    hours = np.arange(0, 24)
-    minutes = np.arange(60)
-
     # create a "smooth" theoretical max line using minute increments
-    # use the convTime function to get declination, azimuth, and elevation
+    # get declination, azimuth, and elevation for the whole day at once
     x = np.arange(0,24,1/60)
-    time = [convTime(-4, lat, lon, datetime.datetime(year, month, day, i, j))[3] for i, j in itertools.product(hours, minutes)]
-    elev = [convTime(-4, lat, lon, datetime.datetime(year, month, day, i, j))[2] for i, j in itertools.product(hours, minutes)]
-    azi = [convTime(-4, lat, lon, datetime.datetime(year, month, day, i, j))[1] for i, j in itertools.product(hours, minutes)]
+    pos = solar_position(day_minutes(year, month, day), lat, lon, -4)
+    elev, azi = pos.elevation, pos.azimuth
 
     # emperical formula for theoretica max surface solar radiation based off elevation
     # of the sun at a given time throughout the year, latitude, and longitude
-    maxsolar =  1367*(np.sin(np.deg2rad(elev))+0.033*np.cos(np.deg2rad((360*80)/360))) # formula to get max solar rad
+    maxsolar = max_solar(elev)
 
     fig, ax = plt.subplots(figsize=(9,6), dpi=100)
     ax2 = ax.twinx()
@@ -129,12 +126,12 @@ if __name__ == '__main__':
     fig.patch.set_facecolor('white')
     colors = list(mcolors.TABLEAU_COLORS.keys())
 
+    # sun elevation for every minute of the day at every city, shaped (minute, city)
+    lats, lons = np.array(list(cities.values())).T
+    elevs = solar_position(day_minutes(2021, 4, 13), lats, lons, -4).elevation
+
     for i, city in enumerate(list(cities.keys())):
-        lat, lon = cities[city]
-        hours = np.arange(0, 24)
-        minutes = np.arange(60)
-        elev = [convTime(-4, lat, lon, datetime.datetime(2021, 4, 13, i, j))[2] for i, j in itertools.product(hours, minutes)]
-        maxsolar =  1367*(np.sin(np.deg2rad(elev))+0.033*np.cos(np.deg2rad((360*80)/360))) # formula to get max solar rad
+        maxsolar = max_solar(elevs[:, i]) # formula to get max solar rad
         fcst_solar = (1-sky_coverage/100)*maxsolar[::60]
         diff = (maxsolar[::60] - fcst_solar)/maxsolar[::60]
         print(fcst_solar)
@@ -0,0 +1,498 @@
+"""
+Bulk upper-air sounding retrieval and a local ragged-array sounding archive.
+
+``fetch_soundings`` pulls the University of Wyoming TEXT:LIST page of every
+RAOB station for a synoptic cycle concurrently (one pooled aiohttp client,
+a concurrency limit and a per-host rate limit, as ``awc.fetch_reports``) and
+parses the fixed-width table straight into a float array. ``fetch_cycle``
+stores the profiles in ``ARCHIVE``, one directory per cycle:
+
+    <root>/<YYYYMMDDHH>/stations.npy    sorted station identifiers
+    <root>/<YYYYMMDDHH>/offsets.npy     int64, row range of each station
+    <root>/<YYYYMMDDHH>/values.npy      float32 (rows, len(COLUMNS))
+
+so a profile is two binary searches and one slice of a memory-mapped array.
+Stations the server has no sounding for are kept as empty profiles, so
+rerunning a cycle or backfilling older ones only downloads what is not on
+disk yet.
+
+    fetch_cycle(RAOB_STATIONS, cycle_time())
+    p, z, T, Td, direction, speed = load_sounding('PIT').T
+"""
+import asyncio
+import fcntl
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+from awc import RateLimiter, serve_stand_in
+
+
+WYOMING_URL = 'http://weather.uwyo.edu'
+ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                            'soundings')
+CYCLE_FORMAT = '%Y%m%d%H'
+
+# columns of the archived profiles (hPa, m, degC, degC, degrees, knots)
+COLUMNS = ('pressure', 'height', 'temperature', 'dewpoint', 'direction', 'speed')
+# positions of COLUMNS among the 7-character fields of a TEXT:LIST row
+FIELD_WIDTH = 7
+TABLE_FIELDS = (0, 1, 2, 3, 6, 7)
+# a cycle's soundings are posted within a few hours; "no data" before then is not final
+PENDING = timedelta(hours=3)
+
+# CONUS radiosonde sites, by the identifiers the Wyoming server accepts
+RAOB_STATIONS = (
+    'ABQ', 'ABR', 'ALB', 'AMA', 'APX', 'BIS', 'BMX', 'BOI', 'BRO', 'BUF', 'CAR', 'CHH', 'CHS',
+    'CRP', 'DDC', 'DNR', 'DRT', 'DTX', 'DVN', 'EPZ', 'EYW', 'FFC', 'FGZ', 'FWD', 'GGW', 'GJT',
+    'GRB', 'GSO', 'IAD', 'ILN', 'ILX', 'INL', 'JAN', 'JAX', 'LBF', 'LCH', 'LIX', 'LKN', 'LZK',
+    'MAF', 'MFL', 'MFR', 'MHX', 'MPX', 'NKX', 'OAK', 'OAX', 'OHX', 'OKX', 'OTX', 'OUN', 'PIT',
+    'REV', 'RIW', 'RNK', 'SGF', 'SHV', 'SLC', 'SLE', 'TBW', 'TFX', 'TLH', 'TOP', 'TUS', 'UIL',
+    'UNR', 'VEF', 'WAL', 'XMR',
+)
+
+PRE = re.compile(r'<pre>(.*?)</pre>', re.IGNORECASE | re.DOTALL)
+
+
+def station_id(icao):
+    """Wyoming identifier of a station: the ICAO identifier without the leading K."""
+    icao = icao.strip().upper()
+    return icao[1:] if len(icao) == 4 and icao.startswith('K') else icao
+
+
+def cycle_time(hoursback=None, now=None):
+    """
+    Synoptic cycle (00Z or 12Z) of the latest sounding, ``hoursback`` hours earlier
+
+    Parameters
+    ----------
+    hoursback : str or int
+        Hours before the latest cycle, blank or None for the latest
+    now : datetime
+        Current UTC time, defaults to the clock
+    """
+    now = now or datetime.utcnow()
+    cycle = now.replace(microsecond=0, second=0, minute=0, hour=0 if now.hour < 12 else 12)
+    if hoursback:
+        cycle -= timedelta(hours=int(hoursback))
+    return cycle
+
+
+def sounding_url(station, cycle, base_url=WYOMING_URL):
+    """URL of the Wyoming TEXT:LIST page of ``station`` at ``cycle``."""
+    return (f'{base_url}/cgi-bin/sounding?region=naconf&TYPE=TEXT%3ALIST&YEAR={cycle.year}'
+            f'&MONTH={cycle.month:02d}&FROM={cycle:%d%H}&TO={cycle:%d%H}&STNM={station}')
+
+
+def parse_sounding(src):
+    """
+    Profile table of a Wyoming TEXT:LIST page
+
+    Levels with none of temperature, dewpoint and wind are dropped, as siphon
+    does.
+
+    Parameters
+    ----------
+    src : str or bytes
+        Page source
+
+    Returns
+    ----------
+    profile : ndarray
+        Shape (levels, len(COLUMNS)), NaN where a field is blank, or None if
+        the server has no sounding for the station and cycle
+
+    Raises
+    ----------
+    ValueError
+        If the page is neither a sounding nor the server's "no data" answer,
+        e.g. when the server is too busy
+    """
+    if isinstance(src, bytes):
+        src = src.decode('latin-1')
+    match = PRE.search(src)
+    if match is None:
+        if "Can't get" in src:
+            return None
+        raise ValueError(' '.join(re.sub(r'<[^>]*>', ' ', src).split())[:200] or 'empty page')
+
+    # four header lines: rule, field names, units, rule
+    rows = [row for row in match.group(1).strip('\r\n').splitlines()[4:] if row.strip()]
+    cells = np.char.strip(np.array(
+        [[row[i * FIELD_WIDTH:(i + 1) * FIELD_WIDTH] for i in TABLE_FIELDS] for row in rows],
+        dtype=f'U{FIELD_WIDTH}').reshape(-1, len(COLUMNS)))
+    profile = np.full(cells.shape, np.nan)
+    filled = cells != ''
+    profile[filled] = cells[filled].astype(np.float64)
+    return profile[~np.isnan(profile[:, 2:]).all(axis=1)]
+
+
+def _save(path, arr):
+    """Write ``arr`` next to ``path`` and move it into place, so readers never see half a file."""
+    tmp = f'{path}.tmp.npy'
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+class SoundingArchive:
+    """
+    Ragged-array store of sounding profiles keyed by (station, cycle)
+
+    Parameters
+    ----------
+    root : str
+        Directory holding one subdirectory per cycle, created on first write
+    """
+
+    def __init__(self, root=ARCHIVE_PATH):
+        self.root = root
+
+    def _path(self, cycle):
+        return os.path.join(self.root, cycle.strftime(CYCLE_FORMAT))
+
+    @contextmanager
+    def _locked(self, cycle):
+        """Exclusive lock on a cycle, so processes filling it concurrently do not lose profiles."""
+        path = self._path(cycle)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield path
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _index(self, cycle):
+        """Stations and row offsets of a cycle (empty if it was never written)."""
+        path = self._path(cycle)
+        try:
+            stations = np.load(os.path.join(path, 'stations.npy'))
+            offsets = np.load(os.path.join(path, 'offsets.npy'))
+        except FileNotFoundError:
+            return np.array([], dtype='U1'), np.zeros(1, dtype=np.int64)
+        return stations, offsets
+
+    def cycles(self):
+        """Cycles present in the archive, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(datetime.strptime(name, CYCLE_FORMAT) for name in os.listdir(self.root)
+                      if os.path.isfile(os.path.join(self.root, name, 'offsets.npy')))
+
+    def stations(self, cycle):
+        """Stations archived for ``cycle``, including those without a sounding."""
+        return [str(s) for s in self._index(cycle)[0]]
+
+    def get(self, station, cycle):
+        """
+        Profile of one station and cycle
+
+        Returns
+        ----------
+        profile : ndarray
+            Shape (levels, len(COLUMNS)); zero levels if the server had no
+            sounding, None if the station was never fetched for the cycle
+        """
+        stations, offsets = self._index(cycle)
+        i = np.searchsorted(stations, station)
+        if i == stations.size or stations[i] != station:
+            return None
+        values = np.load(os.path.join(self._path(cycle), 'values.npy'), mmap_mode='r')
+        return np.array(values[offsets[i]:offsets[i + 1]], dtype=np.float64)
+
+    def read_cycle(self, cycle):
+        """Every profile of ``cycle`` as ``{station: ndarray}`` (views of one array)."""
+        stations, offsets = self._index(cycle)
+        if not stations.size:
+            return {}
+        values = np.load(os.path.join(self._path(cycle), 'values.npy')).astype(np.float64)
+        return {str(s): values[lo:hi] for s, lo, hi in zip(stations, offsets[:-1], offsets[1:])}
+
+    def put_cycle(self, cycle, profiles):
+        """
+        Add profiles to a cycle
+
+        Parameters
+        ----------
+        cycle : datetime
+        profiles : dict
+            ``{station: ndarray or None}``; None records that the server has
+            no sounding. Profiles already archived for a station are replaced.
+        """
+        if not profiles:
+            return
+        with self._locked(cycle) as path:
+            merged = {**self.read_cycle(cycle), **profiles}
+            stations = np.array(sorted(merged))
+            arrays = [np.empty((0, len(COLUMNS))) if merged[s] is None else merged[s]
+                      for s in stations]
+            offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+            np.cumsum([len(a) for a in arrays], out=offsets[1:])
+            _save(os.path.join(path, 'values.npy'),
+                  np.concatenate(arrays).astype(np.float32).reshape(-1, len(COLUMNS)))
+            # the index is written last, so readers never see offsets past the values
+            _save(os.path.join(path, 'offsets.npy'), offsets)
+            _save(os.path.join(path, 'stations.npy'), stations)
+
+
+ARCHIVE = SoundingArchive()
+
+
+async def _fetch_one(client, limiter, semaphore, station, url, retries, backoff=1.):
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(backoff * attempt)
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                async with client.get(url) as resp:
+                    resp.raise_for_status()
+                    src = await resp.read()
+                return station, parse_sounding(src), None
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = e
+    return station, None, error
+
+
+async def fetch_soundings(stations, cycle, concurrency=4, rate=2., burst=4, retries=2,
+                          timeout=60, base_url=WYOMING_URL):
+    """
+    Fetch the soundings of many stations for one cycle concurrently
+
+    The Wyoming server turns away clients that hammer it, hence the low
+    default concurrency and rate; a "too busy" page is retried with a backoff.
+
+    Parameters
+    ----------
+    stations : iterable of str
+        Wyoming station identifiers (see ``station_id``)
+    cycle : datetime
+        Synoptic time, see ``cycle_time``
+    concurrency : int
+        Maximum number of requests in flight
+    rate, burst : float, int
+        Token bucket: requests per second and maximum burst
+    retries : int
+        Number of times a failed station is retried
+    timeout : float
+        Total timeout in seconds for each request
+    base_url : str
+        Server to query, e.g. a local stand-in server for tests
+
+    Yields
+    ----------
+    station, profile, error : str, ndarray, Exception
+        ``profile`` as ``parse_sounding`` returns it (None when the server
+        has no sounding); both are None if the station failed with ``error``
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate, burst)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as client:
+        tasks = [asyncio.ensure_future(_fetch_one(client, limiter, semaphore, station,
+                                                  sounding_url(station, cycle, base_url),
+                                                  retries))
+                 for station in stations]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def fetch_cycle(stations=RAOB_STATIONS, cycle=None, archive=ARCHIVE, refresh=False, now=None,
+                **kwargs):
+    """
+    Bring the archive up to date with the soundings of ``stations`` at ``cycle``
+
+    Only stations not archived for the cycle yet are downloaded (all of them
+    with ``refresh``). Failed stations are reported and left out, so the next
+    call retries them. So are stations the server has no sounding for while
+    the cycle is less than ``PENDING`` old (``now`` defaults to the clock), as
+    Wyoming has usually not posted it yet. Extra keyword arguments go to
+    ``fetch_soundings``.
+
+    Returns
+    ----------
+    fetched : list of str
+        Stations downloaded by this call
+    """
+    cycle = cycle or cycle_time()
+    stations = list(dict.fromkeys(stations))
+    if not refresh:
+        known = set(archive.stations(cycle))
+        stations = [s for s in stations if s not in known]
+    if not stations:
+        return []
+
+    async def collect():
+        profiles = {}
+        async for station, profile, error in fetch_soundings(stations, cycle, **kwargs):
+            if error is None:
+                profiles[station] = profile
+            else:
+                print(f'{station} {cycle:%d%H}Z: {error}')
+        return profiles
+
+    profiles = asyncio.run(collect())
+    if (now or datetime.utcnow()) - cycle < PENDING:
+        profiles = {s: profile for s, profile in profiles.items() if profile is not None}
+    archive.put_cycle(cycle, profiles)
+    return sorted(profiles)
+
+
+def backfill(stations=RAOB_STATIONS, hoursback=24, archive=ARCHIVE, now=None, **kwargs):
+    """Fill the archive with every cycle from ``hoursback`` hours ago to the latest."""
+    latest = cycle_time(now=now)
+    cycles = [latest - timedelta(hours=h) for h in range(0, int(hoursback) + 1, 12)]
+    return {cycle: fetch_cycle(stations, cycle, archive, **kwargs) for cycle in cycles}
+
+
+def load_sounding(station, cycle=None, archive=ARCHIVE, **kwargs):
+    """
+    Profile of ``station`` at ``cycle`` from the archive, downloaded first if missing
+
+    Returns
+    ----------
+    profile : ndarray
+        Shape (levels, len(COLUMNS)) in ``COLUMNS`` order
+
+    Raises
+    ----------
+    ValueError
+        If no sounding is available
+    """
+    cycle = cycle or cycle_time()
+    profile = archive.get(station, cycle)
+    if profile is None:
+        fetch_cycle([station], cycle, archive, **kwargs)
+        profile = archive.get(station, cycle)
+    if profile is None or not len(profile):
+        raise ValueError(f'No sounding available for {station} at {cycle:%d%h%Y %HZ}')
+    return profile
+
+
+def example_profile(seed=0, n=60):
+    """Idealized sounding in ``COLUMNS`` order, slightly different for every seed."""
+    rng = np.random.default_rng(seed)
+    p = np.linspace(1000, 100, n)
+    z = 44331 * (1 - (p / 1013.25)**0.1903)
+    t = np.maximum(rng.uniform(5, 30) - 6.5e-3 * z, -56.5) + rng.normal(0, 0.5, n)
+    td = t - np.linspace(rng.uniform(1, 8), 35, n)
+    direction = (np.linspace(180, 300, n) + rng.normal(0, 5, n)) % 360
+    speed = np.linspace(5, rng.uniform(40, 120), n)
+    return np.column_stack([p.round(1), z.round(), t.round(1), td.round(1), direction.round(),
+                            speed.round()])
+
+
+def stand_in_page(station, cycle, profile=None):
+    """HTML in the Wyoming TEXT:LIST layout with ``profile`` (a fake one by default)."""
+    if profile is None:
+        profile = example_profile(sum(map(ord, station)) + cycle.day * 24 + cycle.hour)
+    rows = ['-' * 77,
+            '   PRES   HGHT   TEMP   DWPT   RELH   MIXR   DRCT   SKNT   THTA   THTE   THTV',
+            '    hPa     m      C      C      %    g/kg    deg   knot     K      K      K ',
+            '-' * 77]
+    # a level below ground, with height only, as the server lists it
+    rows.append(f'{1050.:7.1f}{-300.:7.0f}')
+    for p, z, t, td, direction, speed in profile:
+        e, es = (6.112 * np.exp(17.67 * x / (x + 243.5)) for x in (td, t))
+        w = 621.97 * e / (p - e)
+        theta = (t + 273.15) * (1000 / p)**0.2857
+        cells = [f'{p:7.1f}', f'{z:7.0f}', f'{t:7.1f}', f'{td:7.1f}', f'{100 * e / es:7.0f}',
+                 f'{w:7.2f}', f'{direction:7.0f}', f'{speed:7.0f}', f'{theta:7.1f}',
+                 f'{theta * np.exp(2.5 * w / (t + 273.15)):7.1f}',
+                 f'{theta * (1 + 0.61e-3 * w):7.1f}']
+        rows.append(''.join(cells))
+    return ('<HTML>\n<TITLE>University of Wyoming - Radiosonde Data</TITLE>\n'
+            f'<BODY BGCOLOR="white">\n<H2>{station} Observations at {cycle:%HZ %d %b %Y}</H2>\n'
+            '<PRE>\n' + '\n'.join(rows) + '\n</PRE><H3>Station information and sounding '
+            f'indices</H3><PRE>\n Station identifier: {station}\n</PRE>\n</BODY></HTML>\n')
+
+
+def stand_in_app(latency=0.2, jitter=0.1, seed=0, missing=()):
+    """
+    aiohttp application imitating the Wyoming sounding server
+
+    Every request waits ``latency`` seconds plus an exponential tail with
+    mean ``jitter``; stations in ``missing`` get the server's "no data" page.
+    """
+    rng = np.random.default_rng(seed)
+
+    async def handler(request):
+        await asyncio.sleep(latency + rng.exponential(jitter))
+        q = request.query
+        station = q.get('STNM', 'XXX')
+        if station in missing:
+            page = (f"<HTML><BODY>Can't get {station} Observations at "
+                    f"{q.get('FROM')}.</BODY></HTML>")
+        else:
+            cycle = datetime(int(q['YEAR']), int(q['MONTH']), int(q['FROM'][:2]),
+                             int(q['FROM'][2:]))
+            page = stand_in_page(station, cycle)
+        return web.Response(text=page, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/cgi-bin/sounding', handler)
+    return app
+
+
+def check_parse(n=20):
+    """Round trip of example profiles through the stand-in page and ``parse_sounding``."""
+    cycle = datetime(2026, 10, 18, 12)
+    for seed in range(n):
+        profile = example_profile(seed)
+        parsed = parse_sounding(stand_in_page('PIT', cycle, profile))
+        assert parsed.shape == profile.shape, parsed.shape
+        assert np.allclose(parsed, profile, atol=0.05, equal_nan=True)
+    assert parse_sounding("<HTML><BODY>Can't get PIT Observations at 1812.</BODY></HTML>") is None
+    print(f'{n} stand-in pages parsed')
+
+
+def benchmark(n_stations=len(RAOB_STATIONS), concurrency=(1, 8, 32), latency=0.2, jitter=0.1):
+    """Fetch a whole cycle from the stand-in server, then reload it from the archive."""
+    stations = RAOB_STATIONS[:n_stations]
+    cycle = datetime(2026, 10, 1, 12)
+
+    async def serve(limit, archive):
+        runner, base_url = await serve_stand_in(stand_in_app(latency, jitter, missing={'EYW'}))
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, lambda: fetch_cycle(
+                stations, cycle, archive, concurrency=limit, rate=1000., burst=limit,
+                base_url=base_url))
+        finally:
+            await runner.cleanup()
+
+    for limit in concurrency:
+        with tempfile.TemporaryDirectory() as root:
+            archive = SoundingArchive(root)
+            tic = time.perf_counter()
+            asyncio.run(serve(limit, archive))
+            fetched = time.perf_counter() - tic
+
+            tic = time.perf_counter()
+            for station in stations:
+                archive.get(station, cycle)
+            cached = time.perf_counter() - tic
+            # nothing is downloaded again: no server is running now
+            assert fetch_cycle(stations, cycle, archive) == []
+            assert 'EYW' not in stations or archive.get('EYW', cycle).size == 0
+            size = sum(os.path.getsize(os.path.join(archive._path(cycle), name))
+                       for name in os.listdir(archive._path(cycle)))
+        print(f'concurrency {limit:3d}: {len(stations)} soundings fetched in {fetched:6.2f} s, '
+              f'reloaded from disk in {cached * 1000:6.1f} ms ({size / 1024:.0f} kB)')
+
+
+if __name__ == '__main__':
+    check_parse()
+    benchmark()
@@ -0,0 +1,191 @@
+"""
+Station registry and spatial index over data/icaos.csv.
+
+The csv is parsed once into decimal-degree float arrays and saved as a
+structured ``.npy`` file that is memory-mapped on later loads. Queries use a
+KD-tree on unit vectors (chord distance is monotonic in great-circle
+distance) and are vectorized over any number of query points.
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+CSV_PATH = os.path.join(DATA_DIR, 'icaos.csv')
+CACHE_PATH = os.path.join(DATA_DIR, 'icaos.npy')
+EARTH_RADIUS = 6371.  # km
+
+STATION_DTYPE = np.dtype([('icao', 'U4'), ('name', 'U16'), ('state', 'U2'), ('country', 'U2'),
+                          ('lat', 'f8'), ('lon', 'f8'), ('elev', 'f4')])
+
+# what MetPy's METAR parser expects from a station lookup
+StationInfo = namedtuple('StationInfo', ['id', 'latitude', 'longitude', 'altitude'])
+
+
+def _parse_degrees(col, negative):
+    """Convert strings like ``51 53N`` / ``176 39W`` to signed decimal degrees."""
+    parts = col.str.extract(r'^\s*(\d+)\s+(\d+)\s*([NSEW])\s*$')
+    deg = parts[0].astype(float) + parts[1].astype(float) / 60
+    return np.where(parts[2] == negative, -deg, deg)
+
+
+def _to_xyz(lat, lon):
+    lat, lon = np.deg2rad(lat), np.deg2rad(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _chord(km):
+    """Chord length on the unit sphere for a great-circle distance in km."""
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=float) / EARTH_RADIUS, np.pi) / 2)
+
+
+def _arc(chord):
+    """Great-circle distance in km for a chord length on the unit sphere."""
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def build_station_table(csv_path=CSV_PATH, path=CACHE_PATH):
+    """Parse the station csv into a structured array and save it to ``path``."""
+    df = pd.read_csv(csv_path, index_col=0, dtype=str)
+    df = df.dropna(subset=['ICAO', 'LAT', 'LONG'])
+    table = np.empty(len(df), dtype=STATION_DTYPE)
+    table['icao'] = df['ICAO'].str.strip().str.upper()
+    table['name'] = df['STATION'].fillna('').str.strip()
+    table['state'] = df['CD'].fillna('')
+    table['country'] = df['CT'].fillna('')
+    table['lat'] = _parse_degrees(df['LAT'], 'S')
+    table['lon'] = _parse_degrees(df['LONG'], 'W')
+    table['elev'] = pd.to_numeric(df['ELEV'], errors='coerce')
+    table = table[np.isfinite(table['lat']) & np.isfinite(table['lon'])]
+    if path:
+        np.save(path, table)
+    return table
+
+
+class StationIndex:
+    """
+    Spatial index over the station table
+
+    Parameters
+    ----------
+    table : structured ndarray
+        Stations with ``STATION_DTYPE`` fields, see ``load``
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.icao = table['icao']
+        self.lat = table['lat']
+        self.lon = table['lon']
+        self.tree = cKDTree(_to_xyz(self.lat, self.lon))
+        self._positions = None
+
+    @classmethod
+    def load(cls, path=CACHE_PATH, csv_path=CSV_PATH):
+        """Memory-map the parsed station table, rebuilding it if the csv is newer."""
+        if not os.path.isfile(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+            build_station_table(csv_path, path)
+        return cls(np.load(path, mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.table)
+
+    def index(self, icaos):
+        """Row of each ICAO in ``icaos`` (-1 where unknown)."""
+        if self._positions is None:
+            # first occurrence wins for the few duplicated identifiers
+            self._positions = {icao: i for i, icao in reversed(list(enumerate(self.icao)))}
+        return np.array([self._positions.get(icao.upper(), -1) for icao in np.atleast_1d(icaos)])
+
+    def coords(self, icaos):
+        """{ICAO: (lat, lon)} for the known stations in ``icaos``, e.g. for ``plot_cities``."""
+        idx = self.index(icaos)
+        return {str(self.icao[i]): (float(self.lat[i]), float(self.lon[i])) for i in idx if i >= 0}
+
+    def nearest(self, lat, lon, k=1):
+        """
+        The ``k`` nearest stations to each query point
+
+        Parameters
+        ----------
+        lat, lon : float or array_like
+            Query points in decimal degrees
+
+        Returns
+        ----------
+        dist, idx : ndarray
+            Great-circle distances (km) and station rows, shaped
+            ``lat.shape + (k,)`` (the last axis is dropped when ``k == 1``)
+        """
+        chord, idx = self.tree.query(_to_xyz(lat, lon), k=k)
+        return _arc(chord), idx
+
+    def within(self, lat, lon, radius):
+        """
+        Stations within ``radius`` km of each query point
+
+        Returns
+        ----------
+        idx : list or ndarray of lists
+            Station rows for a single point, or an object array holding the
+            rows for every query point
+        """
+        return self.tree.query_ball_point(_to_xyz(lat, lon), _chord(radius), return_sorted=True)
+
+    def bbox(self, west, east, south, north):
+        """Rows of the stations inside a lon/lat box (``west > east`` crosses the dateline)."""
+        in_lat = (self.lat >= south) & (self.lat <= north)
+        if west <= east:
+            in_lon = (self.lon >= west) & (self.lon <= east)
+        else:
+            in_lon = (self.lon >= west) | (self.lon <= east)
+        return np.nonzero(in_lat & in_lon)[0]
+
+    def along_path(self, lats, lons, radius, spacing=25.):
+        """
+        Stations within ``radius`` km of the great-circle path through the given points
+
+        The path is sampled every ``spacing`` km and every sample is queried
+        at once; stations are returned in the order they are passed along the
+        path.
+        """
+        xyz = _to_xyz(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float))
+        samples = []
+        for a, b in zip(xyz[:-1], xyz[1:]):
+            omega = np.arccos(np.clip(a @ b, -1, 1))
+            n = max(int(np.ceil(omega * EARTH_RADIUS / spacing)), 1)
+            f = np.linspace(0, 1, n + 1)[:, np.newaxis]
+            if omega < 1e-12:
+                samples.append(np.repeat(a[np.newaxis], n + 1, axis=0))
+            else:
+                samples.append((np.sin((1 - f) * omega) * a + np.sin(f * omega) * b)
+                               / np.sin(omega))
+        samples = np.concatenate(samples)
+        # nearest sample along the path for every station near it
+        hits = self.tree.query_ball_point(samples, _chord(radius))
+        first = {}
+        for s, rows in enumerate(hits):
+            for row in rows:
+                first.setdefault(row, s)
+        return np.array(sorted(first, key=first.get), dtype=int)
+
+    def metadata(self):
+        """Mapping usable as MetPy's ``station_metadata`` when parsing METARs offline."""
+        return {str(icao): StationInfo(str(icao), float(lat), float(lon), float(elev))
+                for icao, lat, lon, elev in zip(self.icao, self.lat, self.lon,
+                                                self.table['elev'])}
+
+
+_index = None
+
+
+def station_index():
+    """Process-wide ``StationIndex``, loaded on first use."""
+    global _index
+    if _index is None:
+        _index = StationIndex.load()
+    return _index
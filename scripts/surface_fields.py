@@ -0,0 +1,230 @@
+"""
+Derived surface fields for meteograms in one fused pass over plain float arrays.
+
+Temperature and dewpoint (degC), wind speed (kt) and pressure (hPa) go in as
+plain arrays; degF temperatures, relative humidity, heat index, wind chill,
+wet-bulb and apparent temperature come out as rows of one preallocated float
+array. Rows are processed in blocks so the temporaries stay small and
+cache-resident whatever the length of the record, and the validity masks are
+written in place. Units are only attached by ``surface_fields`` at the API
+boundary; ``add_surface_fields`` works straight on METAR frames (one 24 h
+window or years of ``ARCHIVE`` history).
+"""
+import time
+
+import numpy as np
+from metpy.units import units
+
+from thermo import ES_A, ES_B, _wet_bulb, _wet_bulb_lookup
+
+
+# rows of the output block, in order
+FIELDS = ('tempF', 'dewF', 'relative_humidity', 'heat_index', 'wind_chill', 'wet_bulb',
+          'apparent_temperature')
+FIELD_UNITS = ('degF', 'degF', 'dimensionless', 'degF', 'degF', 'degF', 'degF')
+
+KT_TO_KMH = 1.852
+BLOCK = 1 << 15
+
+
+def _heat_index(tf, rh, out):
+    """Rothfusz heat index (degF) with the NWS adjustments, as ``mpcalc.heat_index``."""
+    rh2 = rh * rh
+    tf2 = tf * tf
+    # simplified formula, used where it is below 79 F
+    np.multiply(tf, 1.1, out=out)
+    out += 4.7 * rh - 10.3
+    full = out >= 79.
+    if full.any():
+        t, r, t2, r2 = tf[full], rh[full], tf2[full], rh2[full]
+        out[full] = (-42.379 + 2.04901523 * t + 1014.333127 * r - 22.475541 * t * r
+                     - 6.83783e-3 * t2 - 5.481717e2 * r2 + 1.22874e-1 * t2 * r
+                     + 8.5282 * t * r2 - 1.99e-2 * t2 * r2)
+    cold = tf <= 40.
+    out[cold] = tf[cold]
+
+    dry = (rh <= 0.13) & (tf >= 80.) & (tf <= 112.)
+    if dry.any():
+        out[dry] -= (13. - rh[dry] * 100.) / 4. * np.sqrt((17. - np.abs(tf[dry] - 95.)) / 17.)
+    humid = (rh > 0.85) & (tf >= 80.) & (tf <= 87.)
+    if humid.any():
+        out[humid] += 0.02 * (rh[humid] * 100. - 85.) * (87. - tf[humid])
+    return out
+
+
+def _wind_chill(tc, wspd, out):
+    """Wind chill (degF) from temperature (degC) and wind speed (kt), as ``mpcalc.windchill``."""
+    factor = (wspd * KT_TO_KMH)**0.16
+    np.multiply(0.3965 * factor + 0.6215, tc, out=out)
+    out -= 11.37 * factor
+    out += 13.12
+    out *= 1.8
+    out += 32.
+    return out
+
+
+def _surface_block(t, td, wspd, p, out, wet_bulb='rk4'):
+    """Fill the rows of ``out`` (len(FIELDS), n) for one block of observations."""
+    tf, dwf, rh, hi, wc, wb, app = out
+    np.multiply(t, 1.8, out=tf)
+    tf += 32.
+    np.multiply(td, 1.8, out=dwf)
+    dwf += 32.
+
+    # e(Td) / es(T) with the Bolton formula, as ``mpcalc.relative_humidity_from_dewpoint``
+    np.divide(ES_A * td, td + ES_B, out=rh)
+    rh -= ES_A * t / (t + ES_B)
+    np.exp(rh, out=rh)
+
+    _heat_index(tf, rh, hi)
+    _wind_chill(t, wspd, wc)
+
+    if wet_bulb:
+        kernel = _wet_bulb_lookup if wet_bulb == 'lookup' else _wet_bulb
+        wb[:] = kernel(p, t + 273.15, td + 273.15)
+        wb -= 273.15
+        wb *= 1.8
+        wb += 32.
+    else:
+        wb[:] = np.nan
+
+    # apparent temperature: wind chill where defined, else heat index where
+    # defined, else the temperature (mpcalc.apparent_temperature)
+    app[:] = tf
+    chill = (tf <= 50.) & (wspd * KT_TO_KMH > 3. * 1.609344)
+    app[chill] = wc[chill]
+    warm = tf >= 80.
+    app[warm] = hi[warm]
+
+    # the meteogram shows heat index from 80 F up and wind chill from 50 F down with over 5 kt
+    hi[tf < 80.] = np.nan
+    wc[(wspd <= 5.) | (tf > 50.)] = np.nan
+    return out
+
+
+def _surface_fields(t, td, wspd, p, wet_bulb='rk4', block=BLOCK):
+    """
+    Derived surface fields of plain arrays
+
+    Parameters
+    ----------
+    t, td : ndarray
+        Temperature and dewpoint (degC)
+    wspd : ndarray
+        Wind speed (kt)
+    p : ndarray
+        Pressure (hPa) used for the wet-bulb temperature
+    wet_bulb : {'rk4', 'lookup', None}
+        Integrate the moist adiabat, use the pseudoadiabat table, or skip
+    block : int
+        Observations processed per pass
+
+    Returns
+    ----------
+    out : ndarray
+        Shape (len(FIELDS), n), rows in ``FIELDS`` order
+    """
+    t, td, wspd, p = (np.asarray(a, dtype=np.float64).ravel() for a in (t, td, wspd, p))
+    n = t.size
+    out = np.empty((len(FIELDS), n))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(0, n, block):
+            sl = slice(i, i + block)
+            _surface_block(t[sl], td[sl], wspd[sl], p[sl], out[:, sl], wet_bulb)
+    return out
+
+
+def surface_fields(temperature, dewpoint, wind_speed, pressure, wet_bulb='rk4'):
+    """
+    Derived surface fields with units
+
+    Parameters
+    ----------
+    temperature, dewpoint : pint.Quantity
+    wind_speed : pint.Quantity
+    pressure : pint.Quantity
+        Station or sea-level pressure for the wet-bulb temperature
+    wet_bulb : {'rk4', 'lookup', None}
+        See ``_surface_fields``
+
+    Returns
+    ----------
+    fields : dict
+        ``{name: pint.Quantity}`` for every name in ``FIELDS``
+    """
+    out = _surface_fields(temperature.m_as('degC'), dewpoint.m_as('degC'),
+                          wind_speed.m_as('knots'), pressure.m_as('hPa'), wet_bulb)
+    shape = np.shape(temperature.m)
+    return {name: units.Quantity(row.reshape(shape), unit)
+            for name, unit, row in zip(FIELDS, FIELD_UNITS, out)}
+
+
+def add_surface_fields(df, pressure='air_pressure_at_sea_level', wet_bulb='rk4'):
+    """
+    Add the ``FIELDS`` columns to a METAR frame in place
+
+    ``df`` has the ``parse_metars`` columns: ``air_temperature`` and
+    ``dew_point_temperature`` in degC and ``wind_speed`` in kt.
+    """
+    out = _surface_fields(df['air_temperature'].values, df['dew_point_temperature'].values,
+                          df['wind_speed'].values, df[pressure].values, wet_bulb)
+    for name, row in zip(FIELDS, out):
+        df[name] = row
+    return df
+
+
+def _pint_fields(t, td, wspd, p):
+    """
+    Meteogram fields through MetPy's pint functions, one column at a time
+
+    This is how meteogram.py computed them before; ``benchmark`` times it
+    against the fused kernel and reports their largest difference per field.
+    """
+    import metpy.calc as mpcalc
+    from thermo import wet_bulb_temperature
+
+    tf = t * 9 / 5 + 32
+    dwf = td * 9 / 5 + 32
+    T, Td = tf * units.degF, dwf * units.degF
+    rh = mpcalc.relative_humidity_from_dewpoint(T, Td)
+    hi = np.ma.filled(np.ma.masked_array(mpcalc.heat_index(T, rh).m_as('degF')).astype(float),
+                      np.nan)
+    hi[tf < 80] = np.nan
+    wc = np.ma.filled(np.ma.masked_array(
+        mpcalc.windchill(T, wspd * units('kts').to('mph')).m_as('degF')).astype(float), np.nan)
+    wc[(wspd <= 5) | (tf > 50)] = np.nan
+    wb = wet_bulb_temperature(p * units.hPa, t * units.degC, td * units.degC).m_as('degF')
+    return np.array([tf, dwf, rh.m_as(''), hi, wc, wb])
+
+
+def benchmark(sizes=(100, 10000, 1000000), seed=0):
+    """
+    Time the fused kernel against the pint path and report the largest differences
+
+    RH (and through it the heat index) differs from MetPy 1.6+ by a few
+    tenths of a percent, which use a newer saturation vapor pressure formula
+    than Bolton's.
+    """
+    rng = np.random.default_rng(seed)
+    for n in sizes:
+        t = rng.uniform(-30, 45, n)
+        td = t - rng.uniform(0, 25, n)
+        wspd = rng.uniform(0, 40, n)
+        p = rng.uniform(980, 1040, n)
+
+        tic = time.perf_counter()
+        fused = _surface_fields(t, td, wspd, p)
+        fused_seconds = time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        ref = _pint_fields(t, td, wspd, p)
+        pint_seconds = time.perf_counter() - tic
+
+        errors = ', '.join(f'{name} {np.nanmax(np.abs(fused[i] - ref[i])):.1e}'
+                           for i, name in enumerate(FIELDS[:6]))
+        print(f'{n:>9d} obs  fused {fused_seconds:8.4f} s  pint {pint_seconds:8.4f} s  '
+              f'max |diff|: {errors}')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,667 @@
+"""
+Structured TAF decoding into array-backed change groups with an interval index.
+
+``decode_tafs`` turns raw TAF reports (e.g. from ``CACHE.taf`` or a dump of
+many stations) into a ``TafTable``: one row per change-group interval, held
+as numpy columns. Prevailing rows (the initial conditions, FM groups and the
+state after each BECMG) tile the validity period of each TAF; temporary rows
+(TEMPO, PROB and BECMG transition windows) sit on top of them. Elements a
+group does not mention are filled from the prevailing conditions, so every
+row carries a complete wind, visibility, weather and ceiling, and a flight
+category.
+
+A newer TAF for a station supersedes the older one from its valid start, and
+the rows are indexed by (station, start) and by start alone, so queries over
+thousands of TAFs are binary searches plus array masks:
+
+    tafs = decode_tafs(texts)
+    at = tafs.conditions(['KPIT'] * 3, ['2026-10-19T06', '2026-10-19T09', '2026-10-19T15'])
+    ifr = tafs.forecasting('IFR', '2026-10-19T06', '2026-10-19T12')
+"""
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from awc_cache import report_time
+from obs_archive import _epoch
+
+
+KINDS = ('BASE', 'FM', 'BECMG', 'TEMPO', 'PROB')
+CATEGORIES = ('VFR', 'MVFR', 'IFR', 'LIFR')
+ELEMENTS = ('wind_direction', 'wind_speed', 'wind_gust', 'visibility', 'ceiling', 'weather')
+
+# station code and start time packed into one sortable key; epoch seconds stay below 2**33
+KEY_SHIFT = 2**33
+# visibility (statute miles) reported for P6SM and for 9999 m
+VIS_UNLIMITED = 6.
+METERS_PER_MILE = 1609.344
+MPS_TO_KT = 1.943844
+KMH_TO_KT = 0.539957
+
+WIND = re.compile(r'^(VRB|\d{3})(\d{2,3})(?:G(\d{2,3}))?(KT|MPS|KMH)$')
+VISIBILITY = re.compile(r'^([PM])?(?:(\d+)/(\d+)|(\d+))SM$')
+METRIC_VISIBILITY = re.compile(r'^(\d{4})$')
+WEATHER = re.compile(r'^(?:[-+]|VC)?(?:MI|PR|BC|DR|BL|SH|TS|FZ)?'
+                     r'(?:DZ|RA|SN|SG|IC|PL|GR|GS|UP|BR|FG|FU|VA|DU|SA|HZ|PY|PO|SQ|FC|SS|DS)*$')
+CLOUD = re.compile(r'^(FEW|SCT|BKN|OVC|VV)(\d{3}|///)(CB|TCU)?$')
+PERIOD = re.compile(r'^(\d{2})(\d{2})/(\d{2})(\d{2})$')
+FROM = re.compile(r'^FM(\d{2})(\d{2})(\d{2})$')
+PROB = re.compile(r'^PROB(\d{2})$')
+ISSUE = re.compile(r'^\d{6}Z$')
+CLEAR = {'SKC', 'CLR', 'NSC', 'NCD'}
+
+
+def _epochs(times):
+    """Epoch seconds (int64) of numbers, datetime64 or anything ``pd.to_datetime`` reads (naive is UTC)."""
+    arr = np.asarray(times)
+    if arr.dtype.kind in 'iuf':
+        return arr.astype(np.int64)
+    if arr.dtype.kind == 'M':
+        return arr.astype('datetime64[s]').astype(np.int64)
+    return np.array([_epoch(t) for t in arr.ravel().tolist()], dtype=np.int64).reshape(arr.shape)
+
+
+def _group_time(day, hour, minute, issued):
+    """Epoch seconds of a day/hour/minute group, in the month that puts it closest to ``issued``."""
+    base = datetime.fromtimestamp(issued, timezone.utc)
+    best = None
+    for months in (0, 1, -1):
+        year, month = divmod(base.year * 12 + base.month - 1 + months, 12)
+        try:
+            t = datetime(year, month + 1, day, tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        t = (t + timedelta(hours=hour, minutes=minute)).timestamp()
+        if best is None or abs(t - issued) < abs(best - issued):
+            best = t
+    return int(best)
+
+
+def _flight_category(ceiling, visibility):
+    """Index into ``CATEGORIES`` from ceiling (ft) and visibility (SM); NaN counts as unlimited."""
+    ceiling = np.nan_to_num(np.asarray(ceiling, dtype=np.float64), nan=np.inf)
+    visibility = np.nan_to_num(np.asarray(visibility, dtype=np.float64), nan=np.inf)
+    category = np.zeros(np.broadcast(ceiling, visibility).shape, dtype=np.int8)
+    category[(ceiling <= 3000) | (visibility <= 5)] = 1
+    category[(ceiling < 1000) | (visibility < 3)] = 2
+    category[(ceiling < 500) | (visibility < 1)] = 3
+    return category
+
+
+def _decode_elements(tokens):
+    """
+    Wind, visibility, weather and ceiling of one group's tokens
+
+    Returns
+    ----------
+    elements : dict
+        Only the elements the group mentions; the wind direction is NaN for
+        VRB, the ceiling ``inf`` when no layer is broken or worse and the
+        weather '' for NSW
+    """
+    out = {}
+    weather, layers = [], None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        wind = WIND.match(token)
+        if wind:
+            direction, speed, gust, unit = wind.groups()
+            factor = {'KT': 1., 'MPS': MPS_TO_KT, 'KMH': KMH_TO_KT}[unit]
+            out['wind_direction'] = np.nan if direction == 'VRB' else float(direction)
+            out['wind_speed'] = float(speed) * factor
+            out['wind_gust'] = float(gust) * factor if gust else np.nan
+        elif token == 'CAVOK':
+            out['visibility'] = VIS_UNLIMITED
+            layers = layers or []
+            out.setdefault('weather', '')
+        elif VISIBILITY.match(token) or (token.isdigit() and len(token) <= 2 and i + 1 < len(tokens)
+                                         and VISIBILITY.match(tokens[i + 1])):
+            # "1 1/2SM" is split over two tokens
+            whole = 0.
+            if token.isdigit() and not token.endswith('SM'):
+                whole, i = float(token), i + 1
+                token = tokens[i]
+            prefix, num, den, miles = VISIBILITY.match(token).groups()
+            vis = whole + (float(num) / float(den) if num else float(miles))
+            out['visibility'] = VIS_UNLIMITED if prefix == 'P' else vis
+        elif METRIC_VISIBILITY.match(token):
+            meters = float(token)
+            out['visibility'] = VIS_UNLIMITED if meters >= 9999 else meters / METERS_PER_MILE
+        elif token == 'NSW':
+            out['weather'] = ''
+        elif CLOUD.match(token):
+            cover, height, _ = CLOUD.match(token).groups()
+            layers = layers or []
+            if cover in ('BKN', 'OVC', 'VV') and height != '///':
+                layers.append(int(height) * 100.)
+        elif token in CLEAR:
+            layers = layers or []
+        elif len(token) >= 2 and WEATHER.match(token) and token not in ('VC',):
+            weather.append(token)
+        i += 1
+    if weather:
+        out['weather'] = ' '.join(weather)
+    if layers is not None:
+        out['ceiling'] = min(layers) if layers else np.inf
+    return out
+
+
+def _split_groups(tokens, issued):
+    """Change groups of the tokens after the validity period: (kind, prob, start, end, tokens)."""
+    groups = []
+    current = ['BASE', 0, None, None, []]
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        fm = FROM.match(token)
+        prob = PROB.match(token)
+        if fm or token in ('BECMG', 'TEMPO') or prob:
+            groups.append(current)
+            if fm:
+                current = ['FM', 0, _group_time(*map(int, fm.groups()), issued), None, []]
+            else:
+                kind, chance = ('PROB', int(prob.group(1))) if prob else (token, 0)
+                if prob and i + 1 < len(tokens) and tokens[i + 1] == 'TEMPO':
+                    i += 1
+                period = PERIOD.match(tokens[i + 1]) if i + 1 < len(tokens) else None
+                start = end = None
+                if period:
+                    d0, h0, d1, h1 = map(int, period.groups())
+                    start, end = _group_time(d0, h0, 0, issued), _group_time(d1, h1, 0, issued)
+                    i += 1
+                current = [kind, chance, start, end, []]
+        else:
+            current[4].append(token)
+        i += 1
+    groups.append(current)
+    return groups
+
+
+def _parse_taf(text, issued=None, now=None):
+    """
+    Station, times and change groups of one TAF
+
+    Returns
+    ----------
+    taf : dict
+        ``station``, ``issued``, ``start``, ``end`` (epoch seconds) and
+        ``groups`` as (kind, prob, start, end, elements); None if the text is
+        not a TAF
+    """
+    tokens = text.replace('=', ' ').split()
+    while tokens and tokens[0] in ('TAF', 'AMD', 'COR', 'RTD'):
+        tokens = tokens[1:]
+    if len(tokens) < 2 or not re.match(r'^[A-Z0-9]{4}$', tokens[0]):
+        return None
+    station, tokens = tokens[0], tokens[1:]
+    if tokens and ISSUE.match(tokens[0]):
+        if issued is None:
+            issued = report_time(tokens[0], now)
+        tokens = tokens[1:]
+    if issued is None or not tokens:
+        return None
+    period = PERIOD.match(tokens[0])
+    if period is None:
+        return None
+    d0, h0, d1, h1 = map(int, period.groups())
+    start, end = _group_time(d0, h0, 0, issued), _group_time(d1, h1, 0, issued)
+    tokens = tokens[1:]
+    groups = []
+    # NIL and CNL TAFs keep their validity, so a cancellation still supersedes the older TAF
+    if not (tokens and tokens[0] in ('NIL', 'CNL')):
+        for kind, prob, g0, g1, group_tokens in _split_groups(tokens, issued):
+            if kind == 'BASE':
+                g0, g1 = start, end
+            if g0 is None:
+                continue
+            groups.append((kind, prob, g0, g1 if g1 is not None else end,
+                           _decode_elements(group_tokens)))
+    return {'station': station, 'issued': int(issued), 'start': start, 'end': end,
+            'groups': groups}
+
+
+def _resolve(taf):
+    """
+    Prevailing and temporary rows of one parsed TAF
+
+    Yields
+    ----------
+    kind, prob, prevailing, start, end, elements : str, int, bool, int, int, dict
+        With every element of ``ELEMENTS`` filled in
+    """
+    empty = dict.fromkeys(ELEMENTS, np.nan)
+    empty['weather'] = ''
+    base = [g for g in taf['groups'] if g[0] == 'BASE']
+    state = {**empty, **(base[0][4] if base else {})}
+    # FM replaces every element, the end of a BECMG changes only the ones it mentions
+    # (a BECMG ending when an FM starts is overridden by it)
+    changes = sorted([(g[2], 1, 'FM', g[4]) for g in taf['groups'] if g[0] == 'FM']
+                     + [(g[3], 0, 'BECMG', g[4]) for g in taf['groups'] if g[0] == 'BECMG'])
+    segments, seg_start, seg_kind = [], taf['start'], 'BASE'
+    for t, _, kind, elements in changes:
+        t = min(max(t, taf['start']), taf['end'])
+        if t > seg_start:
+            segments.append((seg_kind, seg_start, t, state))
+            seg_start = t
+        state = {**empty, **elements} if kind == 'FM' else {**state, **elements}
+        seg_kind = kind
+    if taf['end'] > seg_start:
+        segments.append((seg_kind, seg_start, taf['end'], state))
+    for kind, start, end, elements in segments:
+        yield kind, 0, True, start, end, elements
+
+    for kind, prob, start, end, elements in taf['groups']:
+        if kind not in ('BECMG', 'TEMPO', 'PROB'):
+            continue
+        for _, seg_start, seg_end, prevailing in segments:
+            lo, hi = max(start, seg_start), min(end, seg_end)
+            if hi > lo:
+                yield kind, prob, False, lo, hi, {**prevailing, **elements}
+
+
+class TafTable:
+    """
+    Change groups of many TAFs as numpy columns, indexed by station and time
+
+    Build it with ``decode_tafs``. Rows are sorted by station and start time;
+    times are epoch seconds.
+
+    Attributes
+    ----------
+    stations : ndarray
+        Sorted station identifiers; ``station`` holds codes into it
+    taf, issued : ndarray
+        Index of the TAF a row comes from and its issue time
+    kind, prob, prevailing : ndarray
+        Index into ``KINDS``, PROB percentage and whether the row is
+        prevailing (BASE, FM, state after BECMG) or temporary
+    start, end, until : ndarray
+        Interval of the group and its end once superseded by the next TAF
+    wind_direction, wind_speed, wind_gust, visibility, ceiling : ndarray
+        Degrees (NaN when variable), knots, statute miles and feet (``inf``
+        when there is no ceiling)
+    weather : ndarray
+        Codes into ``weather_names``, 0 for no significant weather
+    category : ndarray
+        Index into ``CATEGORIES``
+    """
+
+    def __init__(self, columns, stations, weather_names):
+        self.stations = stations
+        self.weather_names = weather_names
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self._build_index()
+
+    def _build_index(self):
+        """Sorted keys of the active prevailing and temporary rows and of all rows by start."""
+        active = self.until > self.start
+        self._max_duration = int((self.until - self.start)[active].max()) if active.any() else 0
+        keys = self.station.astype(np.int64) * KEY_SHIFT + self.start
+        for label, mask in (('_prev', active & self.prevailing), ('_temp', active & ~self.prevailing)):
+            rows = np.nonzero(mask)[0]
+            rows = rows[np.argsort(keys[rows], kind='stable')]
+            setattr(self, f'{label}_rows', rows)
+            setattr(self, f'{label}_keys', keys[rows])
+        rows = np.nonzero(active)[0]
+        self._by_start = rows[np.argsort(self.start[rows], kind='stable')]
+        self._starts = self.start[self._by_start]
+
+    def __len__(self):
+        return self.start.size
+
+    def _codes(self, stations):
+        """Codes of station identifiers, -1 for stations without a TAF."""
+        stations = np.asarray(stations, dtype=str)
+        pos = np.clip(np.searchsorted(self.stations, stations), 0, max(self.stations.size - 1, 0))
+        found = self.stations.size > 0
+        ok = (self.stations[pos] == stations) if found else np.zeros(stations.shape, dtype=bool)
+        return np.where(ok, pos, -1)
+
+    def _prevailing_rows(self, codes, times):
+        """Row of the prevailing group at each (station code, time), -1 where none is valid."""
+        if not self._prev_rows.size:
+            return np.full(np.shape(codes), -1, dtype=np.intp)
+        keys = codes * KEY_SHIFT + times
+        pos = np.searchsorted(self._prev_keys, keys, side='right') - 1
+        rows = self._prev_rows[np.maximum(pos, 0)]
+        ok = (pos >= 0) & (codes >= 0)
+        ok &= np.where(ok, (self.station[rows] == codes) & (times < self.until[rows]), False)
+        return np.where(ok, rows, -1)
+
+    def _worst_temporary(self, codes, times, category):
+        """Highest category among ``category`` and the temporary groups covering each (station, time)."""
+        worst = category.copy()
+        if not self._temp_rows.size:
+            return worst
+        keys = codes * KEY_SHIFT + times
+        lo = np.searchsorted(self._temp_keys, keys - self._max_duration, side='left')
+        hi = np.searchsorted(self._temp_keys, keys, side='right')
+        for k in range(int((hi - lo).max(initial=0))):
+            idx = lo + k
+            sel = np.nonzero((idx < hi) & (codes >= 0))[0]
+            rows = self._temp_rows[idx[sel]]
+            cover = (self.station[rows] == codes[sel]) & (times[sel] < self.until[rows])
+            sel, rows = sel[cover], rows[cover]
+            np.maximum.at(worst, sel, self.category[rows])
+        return worst
+
+    def conditions(self, stations, times, temporary=True):
+        """
+        Forecast conditions at each (station, time) pair
+
+        Parameters
+        ----------
+        stations : str or array_like of str
+            Station identifiers, broadcast against ``times``
+        times : array_like
+            Epoch seconds or datetime-likes
+        temporary : bool
+            Also return ``worst_category``, the worst flight category of the
+            prevailing conditions and any TEMPO/PROB/BECMG group in effect
+
+        Returns
+        ----------
+        table : pandas.DataFrame
+            One row per pair with the prevailing ``ELEMENTS`` (weather as
+            text) and ``category``; NaN/None where no TAF is valid
+        """
+        stations, times = np.broadcast_arrays(np.asarray(stations, dtype=str), _epochs(times))
+        stations, times = stations.ravel(), times.ravel()
+        codes = self._codes(stations)
+        rows = self._prevailing_rows(codes, times)
+        found = rows >= 0
+        take = np.maximum(rows, 0)
+
+        out = {'station': stations, 'time': pd.to_datetime(times, unit='s')}
+        for name in ELEMENTS[:-1]:
+            values = getattr(self, name)[take] if len(self) else np.full(rows.size, np.nan)
+            out[name] = np.where(found, values, np.nan)
+        names = np.asarray(self.weather_names, dtype=object)
+        out['weather'] = np.where(found, names[self.weather[take]] if len(self) else None, None)
+        category = np.where(found, self.category[take] if len(self) else 0, -1).astype(np.int8)
+        out['category'] = self._category_names(category)
+        if temporary:
+            out['worst_category'] = self._category_names(
+                np.where(found, self._worst_temporary(codes, times, category), -1))
+        return pd.DataFrame(out)
+
+    @staticmethod
+    def _category_names(codes):
+        names = np.array(CATEGORIES + (None,), dtype=object)
+        return pd.Categorical(names[codes], categories=CATEGORIES, ordered=True)
+
+    def windows(self, category='IFR', start=None, end=None, temporary=True):
+        """
+        Intervals forecasting ``category`` or worse that overlap [``start``, ``end``)
+
+        Parameters
+        ----------
+        category : str
+            One of ``CATEGORIES``
+        start, end : datetime-like or epoch seconds
+            Query window, open-ended when None
+        temporary : bool
+            Include TEMPO, PROB and BECMG transition groups
+
+        Returns
+        ----------
+        table : pandas.DataFrame
+            ``station``, ``kind``, ``prob``, ``start``, ``end`` (clipped to
+            the window) and ``category`` of every matching row, by station
+            and time
+        """
+        t0 = int(_epochs(start)) if start is not None else np.iinfo(np.int64).min // 2
+        t1 = int(_epochs(end)) if end is not None else np.iinfo(np.int64).max // 2
+        # rows starting before the window's end and late enough to reach into it
+        lo = np.searchsorted(self._starts, t0 - self._max_duration, side='left')
+        hi = np.searchsorted(self._starts, t1, side='left')
+        rows = self._by_start[lo:hi]
+        keep = (self.until[rows] > t0) & (self.category[rows] >= CATEGORIES.index(category))
+        if not temporary:
+            keep &= self.prevailing[rows]
+        rows = rows[keep]
+        rows = rows[np.lexsort((self.start[rows], self.station[rows]))]
+        return pd.DataFrame({
+            'station': self.stations[self.station[rows]],
+            'kind': np.array(KINDS)[self.kind[rows]],
+            'prob': self.prob[rows],
+            'start': pd.to_datetime(np.maximum(self.start[rows], t0), unit='s'),
+            'end': pd.to_datetime(np.minimum(self.until[rows], t1), unit='s'),
+            'category': self._category_names(self.category[rows]),
+        })
+
+    def forecasting(self, category='IFR', start=None, end=None, temporary=True):
+        """Stations forecasting ``category`` or worse at any time in [``start``, ``end``)."""
+        return list(dict.fromkeys(self.windows(category, start, end, temporary)['station']))
+
+    def to_frame(self):
+        """Every row as a DataFrame, with text station, kind, weather and category."""
+        return pd.DataFrame({
+            'station': self.stations[self.station], 'taf': self.taf,
+            'issued': pd.to_datetime(self.issued, unit='s'),
+            'kind': np.array(KINDS)[self.kind], 'prob': self.prob, 'prevailing': self.prevailing,
+            'start': pd.to_datetime(self.start, unit='s'),
+            'end': pd.to_datetime(self.end, unit='s'),
+            'until': pd.to_datetime(self.until, unit='s'),
+            **{name: getattr(self, name) for name in ELEMENTS[:-1]},
+            'weather': np.asarray(self.weather_names, dtype=object)[self.weather],
+            'category': self._category_names(self.category),
+        })
+
+
+def iter_tafs(text):
+    """Split text holding one or more TAFs (one per ``TAF`` keyword, else per blank-line block)."""
+    if re.search(r'(?:^|\s)TAF\s', text):
+        for part in re.split(r'(?:^|\s)(?=TAF\s)', text):
+            if part.strip().startswith('TAF'):
+                yield part
+    else:
+        for part in re.split(r'\n\s*\n', text):
+            if part.strip():
+                yield part
+
+
+def decode_tafs(reports, now=None):
+    """
+    Decode raw TAFs into a ``TafTable``
+
+    Parameters
+    ----------
+    reports : str or iterable of str or (float, str)
+        TAF text, e.g. ``CACHE.taf(icao)`` for each station; a string may
+        hold several TAFs (see ``iter_tafs``). ``(issued, text)`` pairs, as
+        streamed by ``ReportCache.iter_reports``, carry their issue time
+    now : float
+        Epoch seconds used to place the DDHHMMZ issue times in a month (see
+        ``report_time``), the clock by default
+
+    Returns
+    ----------
+    tafs : TafTable
+    """
+    if isinstance(reports, str):
+        reports = [reports]
+    parsed = []
+    for report in reports:
+        issued = None
+        if not isinstance(report, str):
+            issued, report = report
+        for text in iter_tafs(report):
+            taf = _parse_taf(text, issued=issued, now=now)
+            if taf is not None:
+                parsed.append(taf)
+
+    # a newer TAF for the same station supersedes the older one from its valid start
+    parsed.sort(key=lambda taf: (taf['station'], taf['issued']))
+    for taf, newer in zip(parsed, parsed[1:] + [None]):
+        taf['superseded'] = newer['start'] if newer and newer['station'] == taf['station'] \
+            else np.iinfo(np.int64).max // 2
+
+    stations = np.array(sorted({taf['station'] for taf in parsed}), dtype=str)
+    weather_names = ['']
+    weather_codes = {'': 0}
+    rows = {name: [] for name in ('station', 'taf', 'issued', 'kind', 'prob', 'prevailing',
+                                  'start', 'end', 'until') + ELEMENTS}
+    station_codes = {s: i for i, s in enumerate(stations)}
+    for i, taf in enumerate(parsed):
+        for kind, prob, prevailing, start, end, elements in _resolve(taf):
+            rows['station'].append(station_codes[taf['station']])
+            rows['taf'].append(i)
+            rows['issued'].append(taf['issued'])
+            rows['kind'].append(KINDS.index(kind))
+            rows['prob'].append(prob)
+            rows['prevailing'].append(prevailing)
+            rows['start'].append(start)
+            rows['end'].append(end)
+            rows['until'].append(min(end, taf['superseded']))
+            for name in ELEMENTS[:-1]:
+                rows[name].append(elements[name])
+            weather = elements['weather']
+            if weather not in weather_codes:
+                weather_codes[weather] = len(weather_names)
+                weather_names.append(weather)
+            rows['weather'].append(weather_codes[weather])
+
+    dtypes = {'station': np.int32, 'taf': np.int32, 'issued': np.int64, 'kind': np.int8,
+              'prob': np.int8, 'prevailing': bool, 'start': np.int64, 'end': np.int64,
+              'until': np.int64, 'weather': np.int16}
+    columns = {name: np.array(values, dtype=dtypes.get(name, np.float32))
+               for name, values in rows.items()}
+    columns['category'] = _flight_category(columns['ceiling'], columns['visibility'])
+    order = np.lexsort((~columns['prevailing'], columns['start'], columns['station']))
+    columns = {name: values[order] for name, values in columns.items()}
+    return TafTable(columns, stations, weather_names)
+
+
+def example_taf(station, issued, rng):
+    """Random but well-formed TAF text issued at ``issued`` (epoch seconds, on the hour)."""
+    t0 = datetime.fromtimestamp(issued, timezone.utc)
+    start = t0 + timedelta(minutes=40)
+    end = start + timedelta(hours=24)
+
+    def elements():
+        wind = f'{rng.integers(0, 36) * 10:03d}{rng.integers(3, 25):02d}KT'
+        if rng.random() < 0.2:
+            wind = wind[:-2] + f'G{rng.integers(25, 40)}KT'
+        vis = rng.choice(['P6SM', 'P6SM', 'P6SM', '5SM', '3SM', '2SM', '1 1/2SM', '1/2SM'])
+        wx = rng.choice(['', '', '', 'BR', '-RA', '-SHRA', 'TSRA', '-SN FG'])
+        cover = rng.choice(['FEW', 'SCT', 'BKN', 'OVC'])
+        sky = f'{cover}{rng.integers(3, 120):03d}' if rng.random() < 0.9 else 'SKC'
+        return ' '.join(e for e in (wind, vis, wx, sky) if e)
+
+    lines = [f'TAF {station} {t0:%d%H%M}Z {start:%d%H}/{end:%d%H} {elements()}']
+    t = start
+    while True:
+        t += timedelta(hours=int(rng.integers(3, 8)))
+        if t >= end:
+            break
+        if rng.random() < 0.7:
+            lines.append(f'  FM{t:%d%H}00 {elements()}')
+        else:
+            kind = rng.choice(['TEMPO', 'PROB30', 'BECMG'])
+            lines.append(f'  {kind} {t:%d%H}/{t + timedelta(hours=2):%d%H} {elements()}')
+    return '\n'.join(lines)
+
+
+def check_decode():
+    """Decode a hand-checked TAF and compare the conditions at a few times."""
+    now = datetime(2026, 10, 19, 2, tzinfo=timezone.utc).timestamp()
+    text = ('TAF KPIT 181720Z 1818/1918 27010G18KT P6SM FEW045 BKN250\n'
+            '  FM182300 26006KT P6SM SCT050 BKN250\n'
+            '  FM190600 VRB03KT 5SM BR OVC015\n'
+            '    TEMPO 1908/1912 2SM BR OVC008\n'
+            '  BECMG 1911/1913 1 1/2SM\n'
+            '  FM191400 28008KT P6SM SCT030\n')
+    tafs = decode_tafs(text, now=now)
+    times = ['2026-10-18T20', '2026-10-19T00', '2026-10-19T09', '2026-10-19T12:30',
+             '2026-10-19T13:30', '2026-10-19T15', '2026-10-19T20']
+    at = tafs.conditions('KPIT', times)
+    print(at.to_string())
+    assert list(at['category'].astype(object).fillna('-')) == ['VFR', 'VFR', 'MVFR', 'MVFR',
+                                                               'IFR', 'VFR', '-']
+    assert list(at['worst_category'].astype(object).fillna('-')) == ['VFR', 'VFR', 'IFR', 'IFR',
+                                                                     'IFR', 'VFR', '-']
+    assert at['wind_gust'][0] == 18 and np.isnan(at['wind_direction'][2])
+    assert at['ceiling'][2] == 1500 and at['weather'][2] == 'BR'
+    # the BECMG only changes the visibility, from its end until the FM at 14Z
+    becmg = tafs.to_frame().query("kind == 'BECMG' and prevailing")
+    assert becmg['visibility'].tolist() == [1.5] and becmg['ceiling'].tolist() == [1500]
+    assert tafs.forecasting('IFR', '2026-10-19T00', '2026-10-19T12') == ['KPIT']
+    assert tafs.forecasting('IFR', '2026-10-19T00', '2026-10-19T12', temporary=False) == []
+
+    # an amendment supersedes the original from its valid start
+    amd = 'TAF AMD KPIT 190150Z 1902/1918 18005KT 1/2SM FG VV002'
+    at = decode_tafs([text, amd], now=now).conditions('KPIT', ['2026-10-19T01', '2026-10-19T03'])
+    assert list(at['category']) == ['VFR', 'LIFR']
+
+    # random TAFs: the interval index agrees with walking each TAF's groups
+    rng = np.random.default_rng(1)
+    issued0 = datetime(2026, 10, 18, tzinfo=timezone.utc).timestamp()
+    texts = [example_taf(s, issued0 + 6 * 3600 * k, rng) for s in ('KPIT', 'KAGC', 'KBVI')
+             for k in range(4)]
+    now = issued0 + 24 * 3600
+    tafs = decode_tafs(texts, now=now)
+    parsed = [_parse_taf(text, now=now) for text in texts]
+    stations = rng.choice(['KPIT', 'KAGC', 'KBVI', 'KLBE'], 300)
+    times = (issued0 + rng.uniform(0, 48 * 3600, 300)).astype(np.int64)
+    at = tafs.conditions(stations, times, temporary=False)
+    for s, t, category in zip(stations, times, at['category'].astype(object)):
+        expected = _conditions_walk(parsed, s, t)
+        assert (pd.isna(category) and expected is None) or category == expected, (s, t)
+    print('TAF decoding ok')
+
+
+def _conditions_walk(parsed, station, t):
+    """
+    Prevailing category name at one time from the newest TAF whose validity covers it
+
+    Walks the groups of each parsed TAF directly, without the superseding
+    and interval index of ``TafTable``; ``check_decode`` compares the two.
+    """
+    for taf in reversed([taf for taf in parsed if taf['station'] == station]):
+        if taf['start'] <= t < taf['end']:
+            for kind, _, prevailing, start, end, elements in _resolve(taf):
+                if prevailing and start <= t < end:
+                    return CATEGORIES[int(_flight_category(elements['ceiling'],
+                                                           elements['visibility']))]
+    return None
+
+
+def benchmark(n_stations=2000, tafs_per_station=4, n_times=24, seed=0):
+    """Time decoding a network's worth of TAFs and the vectorized queries on them."""
+    rng = np.random.default_rng(seed)
+    issued0 = datetime(2026, 10, 18, tzinfo=timezone.utc).timestamp()
+    stations = [f'K{chr(65 + i // 676)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}'
+                for i in range(n_stations)]
+    texts = [example_taf(s, issued0 + 6 * 3600 * k, rng) for s in stations
+             for k in range(tafs_per_station)]
+    now = issued0 + 24 * 3600
+
+    tic = time.perf_counter()
+    tafs = decode_tafs(texts, now=now)
+    decode = time.perf_counter() - tic
+
+    times = issued0 + 3600 * (1 + np.arange(n_times))
+    pairs_s = np.repeat(stations, n_times)
+    pairs_t = np.tile(times, n_stations).astype(np.int64)
+    tic = time.perf_counter()
+    at = tafs.conditions(pairs_s, pairs_t)
+    query = time.perf_counter() - tic
+    tic = time.perf_counter()
+    ifr = tafs.forecasting('IFR', int(times[0]), int(times[-1]))
+    window = time.perf_counter() - tic
+
+    print(f'{len(texts)} TAFs -> {len(tafs)} rows decoded in {decode:.2f} s')
+    print(f'{len(pairs_s)} (station, time) queries in {query * 1000:.1f} ms')
+    print(f'{len(ifr)} stations forecasting IFR or worse, found in {window * 1000:.1f} ms')
+    return at
+
+
+if __name__ == '__main__':
+    check_decode()
+    benchmark()
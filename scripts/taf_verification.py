@@ -0,0 +1,543 @@
+"""
+Streaming verification of TAFs against METARs from the report archives.
+
+Each station is verified on its own: its TAFs stream oldest first from a
+``ReportCache`` archive and its METARs from the ``ObsArchive``, one chunk of
+time (a month by default) at a time, so memory depends on the chunk and not
+on the length of the record. Within a chunk the prevailing TAF groups and the
+observations are both sorted by time and joined with a sort-merge: two binary
+searches give the run of observations inside each group's interval, so only
+the matching (group, observation) pairs are ever materialized.
+
+Every pair lands in a ``Scores``: contingency tables of flight category and of
+ceiling, visibility and wind speed classes, and running sums for the bias,
+MAE and RMSE of ceiling, visibility, wind speed and direction, all by lead
+time. Scores of chunks and stations simply add up, so a year of reports for
+thousands of stations is spread over a process pool one station per task.
+TAFs fetched through ``CACHE`` expire with it; ``archive_cached`` keeps them:
+
+    archive_cached()
+    scores = verify(start='2025-10-01', end='2026-10-01', workers=8)
+    print(scores.contingency('category'))
+    print(scores.skill('ceiling'))
+    print(scores.error_stats())
+"""
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from awc_cache import CACHE, ReportCache
+from obs_archive import ARCHIVE, ObsArchive
+from taf_decoder import (CATEGORIES, VIS_UNLIMITED, METERS_PER_MILE, _epochs, _flight_category,
+                         decode_tafs, example_taf)
+
+
+TAF_ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                'taf_archive.sqlite')
+
+# lead time (hours after issue) bin edges; the last bin is open-ended
+LEAD_HOURS = (0, 6, 12, 18, 24)
+# class boundaries of the contingency tables (ft, SM, kt); classes are [edge, next edge)
+CLASS_EDGES = {'ceiling': (500., 1000., 3000.), 'visibility': (1., 3., 5.),
+               'wind_speed': (10., 20., 30.)}
+TABLES = ('category', 'ceiling', 'visibility', 'wind_speed')
+# elements where the event is being below a threshold rather than at or above it
+EVENT_BELOW = {'ceiling', 'visibility'}
+ERRORS = ('ceiling', 'visibility', 'wind_speed', 'wind_direction')
+ERROR_UNITS = ('ft', 'SM', 'kt', 'degrees')
+
+# unlimited ceilings count as this height (ft) in the error statistics
+CEILING_CAP = 12000.
+# directions are only compared when both winds are at least this strong (kt)
+DIRECTION_MIN_SPEED = 6.
+# a TAF issued this long before a chunk can no longer be valid in it
+MAX_VALIDITY = 36 * 3600
+# an amendment can start its validity up to this long before it is issued
+ISSUE_MARGIN = 3600
+CHUNK = 31 * 86400
+
+CLOUD_LEVELS = ('low', 'medium', 'high', 'highest')
+OBS_COLUMNS = ('wind_direction', 'wind_speed', 'visibility', 'cloud_coverage') + tuple(
+    f'{level}_cloud_{part}' for level in CLOUD_LEVELS for part in ('type', 'level'))
+
+
+def _class_names(edges):
+    names = [f'<{edges[0]:g}']
+    names += [f'{lo:g}-{hi:g}' for lo, hi in zip(edges[:-1], edges[1:])]
+    return names + [f'>={edges[-1]:g}']
+
+
+CLASSES = {'category': CATEGORIES,
+           **{name: tuple(_class_names(edges)) for name, edges in CLASS_EDGES.items()}}
+LEADS = tuple(f'{lo}-{hi}h' for lo, hi in zip(LEAD_HOURS[:-1], LEAD_HOURS[1:])) + (
+    f'{LEAD_HOURS[-1]}h+',)
+
+
+def _classes(name, values):
+    """Contingency class of each value (index into ``CLASSES[name]``)."""
+    if name == 'category':
+        return np.asarray(values, dtype=np.intp)
+    return np.searchsorted(CLASS_EDGES[name], values, side='right')
+
+
+class Scores:
+    """
+    Contingency tables and error sums of TAF/METAR pairs
+
+    Scores of different chunks or stations add up with ``+=``.
+
+    Attributes
+    ----------
+    pairs : int
+        Number of (forecast, observation) pairs scored
+    tables : dict
+        ``{name: int64 array (lead, forecast class, observed class)}`` for
+        every name in ``TABLES``, classes in ``CLASSES[name]`` order
+    errors : ndarray
+        float64 (len(ERRORS), lead, 4): pair count and the sums of the error
+        (forecast - observed), of its absolute value and of its square
+    """
+
+    def __init__(self):
+        self.tables = {name: np.zeros((len(LEADS), len(CLASSES[name]), len(CLASSES[name])),
+                                      dtype=np.int64) for name in TABLES}
+        self.errors = np.zeros((len(ERRORS), len(LEADS), 4))
+        self.pairs = 0
+
+    def __iadd__(self, other):
+        self.pairs += other.pairs
+        for name in TABLES:
+            self.tables[name] += other.tables[name]
+        self.errors += other.errors
+        return self
+
+    def add(self, lead, forecast, observed):
+        """
+        Accumulate matched pairs
+
+        Parameters
+        ----------
+        lead : ndarray
+            Lead bin of each pair (index into ``LEADS``)
+        forecast, observed : dict
+            ``{element: ndarray}`` with ``category``, ``ceiling`` (ft,
+            ``inf`` when unlimited), ``visibility`` (SM), ``wind_speed`` (kt)
+            and ``wind_direction`` (degrees); NaN marks a missing value
+        """
+        self.pairs += lead.size
+        for name in TABLES:
+            f, o = forecast[name], observed[name]
+            ok = ~(np.isnan(f) | np.isnan(o))
+            k = len(CLASSES[name])
+            flat = (lead[ok] * k + _classes(name, f[ok])) * k + _classes(name, o[ok])
+            self.tables[name] += np.bincount(flat, minlength=len(LEADS) * k * k).reshape(
+                len(LEADS), k, k)
+
+        for i, name in enumerate(ERRORS):
+            f, o = forecast[name], observed[name]
+            if name == 'ceiling':
+                f, o = np.minimum(f, CEILING_CAP), np.minimum(o, CEILING_CAP)
+            error = f - o
+            if name == 'wind_direction':
+                error = (error + 180.) % 360. - 180.
+                calm = ((forecast['wind_speed'] < DIRECTION_MIN_SPEED)
+                        | (observed['wind_speed'] < DIRECTION_MIN_SPEED))
+                error[calm] = np.nan
+            ok = ~np.isnan(error)
+            error, bins = error[ok], lead[ok]
+            n = len(LEADS)
+            self.errors[i, :, 0] += np.bincount(bins, minlength=n)
+            self.errors[i, :, 1] += np.bincount(bins, error, minlength=n)
+            self.errors[i, :, 2] += np.bincount(bins, np.abs(error), minlength=n)
+            self.errors[i, :, 3] += np.bincount(bins, error * error, minlength=n)
+
+    def contingency(self, name='category', lead=None):
+        """Forecast (rows) by observed (columns) counts, over all lead times or one ``LEADS`` bin."""
+        table = self.tables[name]
+        table = table.sum(axis=0) if lead is None else table[LEADS.index(lead)]
+        return pd.DataFrame(table, index=pd.Index(CLASSES[name], name='forecast'),
+                            columns=pd.Index(CLASSES[name], name='observed'))
+
+    def skill(self, name='category'):
+        """
+        2x2 scores of each threshold of a table, by lead time and overall
+
+        The event is an observation below the threshold for ceiling and
+        visibility, and at or above it for wind speed and category (e.g.
+        IFR means IFR or LIFR).
+
+        Returns
+        ----------
+        skill : pandas.DataFrame
+            Indexed by (lead, threshold): hits, misses, false alarms, correct
+            negatives, probability of detection, false alarm ratio, critical
+            success index, frequency bias and Heidke skill score
+        """
+        tables = np.concatenate([self.tables[name], self.tables[name].sum(axis=0)[None]])
+        classes = CLASSES[name]
+        if name == 'category':
+            thresholds = [(c, slice(k, None)) for k, c in enumerate(classes) if k]
+        elif name in EVENT_BELOW:
+            thresholds = [(f'<{e:g}', slice(None, k + 1)) for k, e in enumerate(CLASS_EDGES[name])]
+        else:
+            thresholds = [(f'>={e:g}', slice(k + 1, None)) for k, e in enumerate(CLASS_EDGES[name])]
+
+        rows = []
+        for lead, table in zip(LEADS + ('all',), tables):
+            total = table.sum()
+            for label, event in thresholds:
+                hits = table[event, event].sum()
+                forecast, observed = table[event, :].sum(), table[:, event].sum()
+                misses, false_alarms = observed - hits, forecast - hits
+                correct = total - hits - misses - false_alarms
+                expected = (forecast * observed + (total - forecast) * (total - observed)) / total \
+                    if total else np.nan
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    rows.append((lead, label, hits, misses, false_alarms, correct,
+                                 hits / observed, false_alarms / forecast,
+                                 hits / (hits + misses + false_alarms), forecast / observed,
+                                 (hits + correct - expected) / (total - expected)))
+        return pd.DataFrame(rows, columns=['lead', 'threshold', 'hits', 'misses', 'false_alarms',
+                                           'correct_negatives', 'pod', 'far', 'csi', 'bias', 'hss']
+                            ).set_index(['lead', 'threshold'])
+
+    def error_stats(self):
+        """Pair count, bias, MAE and RMSE of each element in ``ERRORS`` by lead time and overall."""
+        sums = np.concatenate([self.errors, self.errors.sum(axis=1, keepdims=True)], axis=1)
+        n = sums[..., 0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats = {'n': n.astype(np.int64).ravel(), 'bias': (sums[..., 1] / n).ravel(),
+                     'mae': (sums[..., 2] / n).ravel(), 'rmse': np.sqrt(sums[..., 3] / n).ravel()}
+        index = pd.MultiIndex.from_product([ERRORS, LEADS + ('all',)], names=['element', 'lead'])
+        frame = pd.DataFrame(stats, index=index)
+        frame.insert(0, 'units', np.repeat(ERROR_UNITS, len(LEADS) + 1))
+        return frame
+
+
+def _observed(obs):
+    """Ceiling (ft), visibility (SM), wind and category of archived METARs as float arrays."""
+    types = np.stack([obs[f'{level}_cloud_type'].values for level in CLOUD_LEVELS])
+    levels = np.stack([obs[f'{level}_cloud_level'].values for level in CLOUD_LEVELS]).astype(float)
+    ceiling_layer = np.isin(types, ['BKN', 'OVC', 'VV']) & ~np.isnan(levels)
+    ceiling = np.where(ceiling_layer, levels, np.inf).min(axis=0)
+    # MetPy reports a cloud cover of 10 when the sky condition is missing
+    coverage = obs['cloud_coverage'].values.astype(float)
+    ceiling[np.isnan(coverage) | (coverage > 8)] = np.nan
+
+    # back to the 1/16 SM steps of the reports, the meters are float32 in the archive
+    visibility = np.round(obs['visibility'].values / METERS_PER_MILE * 16) / 16
+    visibility = np.minimum(visibility, VIS_UNLIMITED)
+    category = _flight_category(ceiling, visibility).astype(float)
+    category[np.isnan(ceiling) | np.isnan(visibility)] = np.nan
+    return {'category': category, 'ceiling': ceiling, 'visibility': visibility,
+            'wind_speed': obs['wind_speed'].values.astype(float),
+            'wind_direction': obs['wind_direction'].values.astype(float)}
+
+
+def _merge_join(start, end, times):
+    """
+    Pairs of (interval, time) with ``start <= time < end``
+
+    ``times`` must be sorted. Each interval's run of times is found by two
+    binary searches, so the work is proportional to the number of matches
+    rather than to intervals times observations.
+
+    Returns
+    ----------
+    rows, cols : ndarray
+        Interval and time index of each pair
+    """
+    lo = np.searchsorted(times, start, side='left')
+    hi = np.searchsorted(times, end, side='left')
+    counts = np.maximum(hi - lo, 0)
+    rows = np.repeat(np.arange(start.size), counts)
+    offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return rows, np.arange(rows.size) + offsets
+
+
+def _score(tafs, obs, scores, latest_only=False):
+    """Join the prevailing groups of one station's TAFs with its METARs and add them to ``scores``."""
+    if not len(tafs) or obs.empty:
+        return scores
+    groups = np.flatnonzero(tafs.prevailing)
+    end = tafs.until if latest_only else tafs.end
+    times = _epochs(obs['date_time'].values)
+    rows, cols = _merge_join(tafs.start[groups], end[groups], times)
+    rows = groups[rows]
+
+    hours = (times[cols] - tafs.issued[rows]) / 3600.
+    lead = np.clip(np.searchsorted(LEAD_HOURS, hours, side='right') - 1, 0, len(LEADS) - 1)
+    forecast = {name: getattr(tafs, name)[rows].astype(float)
+                for name in ('category', 'ceiling', 'visibility', 'wind_speed', 'wind_direction')}
+    observed = {name: values[cols] for name, values in _observed(obs).items()}
+    scores.add(lead, forecast, observed)
+    return scores
+
+
+def iter_station(station, start, end, tafs=None, observations=ARCHIVE, chunk=CHUNK):
+    """
+    One station's TAFs and METARs, one chunk of time at a time
+
+    The TAFs are read off the archive cursor as the chunks advance and only
+    those that can still be valid are kept, so the window holds a day or two
+    of TAFs whatever the length of the record.
+
+    Parameters
+    ----------
+    station : str
+        ICAO identifier
+    start, end : datetime-like
+        Time range of the observations (UTC)
+    tafs : ReportCache
+        Archive of raw TAFs, ``ReportCache(TAF_ARCHIVE_PATH)`` by default
+    observations : ObsArchive
+        Archive of parsed METARs
+    chunk : int
+        Seconds of observations per step
+
+    Yields
+    ----------
+    tafs : TafTable
+        TAFs that can be valid during the chunk
+    obs : pandas.DataFrame
+        METARs of the chunk, sorted by time
+    """
+    tafs = tafs if tafs is not None else taf_archive()
+    t0, t1 = int(_epochs(start)), int(_epochs(end))
+    reports = tafs.iter_reports(station, 'taf', t0 - MAX_VALIDITY, t1 + ISSUE_MARGIN)
+    window = deque()
+    pending = next(reports, None)
+    for lo in range(t0, t1, chunk):
+        hi = min(lo + chunk, t1)
+        # TAFs issued shortly after the chunk may still supersede one inside it
+        while pending is not None and pending[0] < hi + ISSUE_MARGIN:
+            window.append(pending)
+            pending = next(reports, None)
+        while window and window[0][0] < lo - MAX_VALIDITY:
+            window.popleft()
+        obs = observations.read([station], pd.to_datetime(lo, unit='s'), pd.to_datetime(hi, unit='s'),
+                                columns=OBS_COLUMNS)
+        yield decode_tafs(list(window)), obs
+
+
+def verify_station(station, start, end, tafs=None, observations=ARCHIVE, chunk=CHUNK,
+                   latest_only=False):
+    """
+    Scores of one station's TAFs over [``start``, ``end``)
+
+    Parameters
+    ----------
+    latest_only : bool
+        Score only the latest TAF valid at each observation; by default every
+        TAF is scored at its own lead time
+
+    See ``iter_station`` for the other arguments.
+
+    Returns
+    ----------
+    scores : Scores
+    """
+    scores = Scores()
+    for table, obs in iter_station(station, start, end, tafs, observations, chunk):
+        _score(table, obs, scores, latest_only)
+    return scores
+
+
+def taf_archive(path=TAF_ARCHIVE_PATH):
+    """``ReportCache`` used as a TAF archive: nothing expires and there is no size cap."""
+    return ReportCache(path, ttl=math.inf, max_bytes=math.inf)
+
+
+def archive_cached(cache=CACHE, tafs=None):
+    """Copy the TAFs held in the expiring report cache into the TAF archive; returns the count."""
+    tafs = tafs if tafs is not None else taf_archive()
+    rows = cache.db.execute("SELECT station, issued, text FROM reports WHERE kind = 'taf'").fetchall()
+    tafs.insert(rows, 'taf')
+    return len(rows)
+
+
+def _verify_station(task):
+    """Pool task: (station, TAF archive path, obs archive root, ...) -> (station, Scores)."""
+    station, taf_path, obs_root, start, end, chunk, latest_only = task
+    return station, verify_station(station, start, end, taf_archive(taf_path),
+                                   ObsArchive(obs_root), chunk, latest_only)
+
+
+def verify(stations=None, start=None, end=None, taf_path=TAF_ARCHIVE_PATH, observations=ARCHIVE,
+           workers=None, chunk=CHUNK, latest_only=False, by_station=False):
+    """
+    Verify the archived TAFs of many stations, one station per pool task
+
+    Parameters
+    ----------
+    stations : iterable of str
+        ICAO identifiers, defaults to every station in the observation archive
+    start, end : datetime-like
+        Time range of the observations (UTC), defaults to the last 365 days
+    taf_path : str
+        SQLite file of the TAF archive (see ``taf_archive``)
+    observations : ObsArchive
+        Archive of parsed METARs
+    workers : int
+        Pool size, defaults to the number of CPUs; 1 runs in this process
+    chunk : int
+        Seconds of observations read at a time by each station's stream
+    latest_only : bool
+        See ``verify_station``
+    by_station : bool
+        Also return the scores of each station
+
+    Returns
+    ----------
+    scores : Scores
+        Sum over all stations
+    stations : dict
+        ``{station: Scores}``, only with ``by_station``
+    """
+    stations = list(dict.fromkeys(s.upper() for s in stations)) if stations is not None \
+        else observations.stations()
+    end = int(_epochs(end)) if end is not None else int(time.time()) // 3600 * 3600
+    start = int(_epochs(start)) if start is not None else end - 365 * 86400
+    tasks = [(station, taf_path, observations.root, start, end, chunk, latest_only)
+             for station in stations]
+
+    total, per_station = Scores(), {}
+    if workers == 1:
+        results = map(_verify_station, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_verify_station, tasks)
+    try:
+        for station, scores in results:
+            total += scores
+            if by_station:
+                per_station[station] = scores
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return (total, per_station) if by_station else total
+
+
+def _pair_loop(tafs, obs, latest_only=False):
+    """
+    Sorted (prevailing row, observation) pairs from testing every combination
+
+    Quadratic in the chunk size, which is what ``_merge_join`` avoids;
+    ``check_verification`` requires both to find exactly the same pairs.
+    """
+    times = _epochs(obs['date_time'].values)
+    end = tafs.until if latest_only else tafs.end
+    pairs = [(r, c) for r in np.flatnonzero(tafs.prevailing) for c in range(times.size)
+             if tafs.start[r] <= times[c] < end[r]]
+    return sorted(pairs)
+
+
+def example_archive(stations, start, days, tafs, observations, seed=0, error=1.):
+    """
+    Fill a TAF archive and an observation archive with synthetic reports
+
+    TAFs are issued every six hours; the hourly METARs follow the latest TAF
+    with noise scaled by ``error`` (0 makes every latest forecast perfect).
+    """
+    rng = np.random.default_rng(seed)
+    t0 = int(_epochs(start)) // 3600 * 3600
+    issue_times = t0 - 6 * 3600 + 6 * 3600 * np.arange(days * 4 + 1)
+    obs_times = t0 + 3600 * np.arange(days * 24) + 53 * 60
+    frames = []
+    for station in stations:
+        texts = [(int(t), example_taf(station, int(t), rng)) for t in issue_times]
+        tafs.insert(((station, t, text) for t, text in texts), 'taf')
+        at = decode_tafs(texts).conditions([station] * obs_times.size, obs_times, temporary=False)
+        n = obs_times.size
+        changed = rng.random(n) < 0.2 * error
+
+        ceiling = at['ceiling'].values.astype(float)
+        ceiling = np.where(changed & np.isfinite(ceiling),
+                           np.round(ceiling * rng.lognormal(0, 0.6, n), -2), ceiling)
+        visibility = at['visibility'].values.astype(float)
+        visibility = np.where(changed, np.clip(visibility * rng.lognormal(0, 0.5, n), 0.25, 10),
+                              visibility)
+        speed = np.clip(at['wind_speed'].values + error * rng.normal(0, 4, n), 0, None).round()
+        direction = at['wind_direction'].values + error * rng.normal(0, 25, n)
+        frames.append(pd.DataFrame({
+            'station_id': station, 'date_time': pd.to_datetime(obs_times, unit='s'),
+            'wind_direction': np.round(direction % 360, -1), 'wind_speed': speed,
+            'visibility': visibility * METERS_PER_MILE,
+            'cloud_coverage': np.where(np.isfinite(ceiling), 8., 2.),
+            'low_cloud_type': np.where(np.isfinite(ceiling), 'OVC', 'FEW').astype(object),
+            'low_cloud_level': np.where(np.isfinite(ceiling), ceiling, 25000.),
+            **{f'{level}_cloud_{part}': np.full(n, np.nan if part == 'level' else None)
+               for level in CLOUD_LEVELS[1:] for part in ('type', 'level')},
+        }))
+    observations.append(pd.concat(frames, ignore_index=True))
+
+
+def check_verification():
+    """Check the join against every combination and that perfect forecasts score perfectly."""
+    start = datetime(2026, 9, 1, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp:
+        tafs = taf_archive(os.path.join(tmp, 'tafs.sqlite'))
+        observations = ObsArchive(os.path.join(tmp, 'obs'))
+        example_archive(['KPIT', 'KAGC'], start, 10, tafs, observations, error=0.)
+
+        for table, obs in iter_station('KPIT', start, start.timestamp() + 10 * 86400, tafs,
+                                       observations, chunk=3 * 86400):
+            rows, cols = _merge_join(table.start[table.prevailing], table.end[table.prevailing],
+                                     _epochs(obs['date_time'].values))
+            rows = np.flatnonzero(table.prevailing)[rows]
+            assert sorted(zip(rows.tolist(), cols.tolist())) == _pair_loop(table, obs)
+
+        scores = verify(['KPIT', 'KAGC'], start, start.timestamp() + 10 * 86400,
+                        tafs.path, observations, workers=1, chunk=2 * 86400, latest_only=True)
+        for name in TABLES:
+            table = scores.tables[name].sum(axis=0)
+            assert table.sum() == np.trace(table), name
+        stats = scores.error_stats().xs('all', level='lead')
+        assert (stats['mae'] < 1e-3).all(), stats
+        # ten days of hourly METARs at two stations, each scored once
+        assert scores.pairs == 2 * 10 * 24, scores.pairs
+
+        every = verify(['KPIT', 'KAGC'], start, start.timestamp() + 10 * 86400,
+                       tafs.path, observations, workers=2)
+        assert every.pairs > scores.pairs
+    print('TAF verification ok')
+
+
+def benchmark(n_stations=200, days=60, workers=None, seed=0):
+    """Verify a synthetic archive and report the pair throughput."""
+    start = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    stations = [f'K{chr(65 + i // 676)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}'
+                for i in range(n_stations)]
+    with tempfile.TemporaryDirectory() as tmp:
+        tafs = taf_archive(os.path.join(tmp, 'tafs.sqlite'))
+        observations = ObsArchive(os.path.join(tmp, 'obs'))
+        tic = time.perf_counter()
+        example_archive(stations, start, days, tafs, observations, seed)
+        build = time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        scores = verify(stations, start, start.timestamp() + days * 86400, tafs.path,
+                        observations, workers)
+        elapsed = time.perf_counter() - tic
+
+    print(f'{n_stations} stations x {days} days archived in {build:.1f} s')
+    print(f'{scores.pairs} TAF/METAR pairs verified in {elapsed:.1f} s '
+          f'({scores.pairs / elapsed:,.0f} pairs/s)')
+    print(scores.contingency('category').to_string())
+    print(scores.skill('category').xs('all', level='lead').to_string())
+    print(scores.error_stats().xs('all', level='lead').to_string())
+    return scores
+
+
+if __name__ == '__main__':
+    check_verification()
+    benchmark()